@@ -1,7 +1,12 @@
 __version__ = "1.0.2"
 __author__ = "Paul Blischak and Laura Kubatko"
 
+from phyde.binary import TripleIndex, is_binary
 from phyde.bootstrap import Bootstrap
+from phyde.cache import CountCache
 from phyde.data import HydeData
-from phyde.result import HydeResult
-from phyde.utils import expand_prefix
+from phyde.readers import AlignmentMatrix, AlignmentReader, open_input, read_alignment, register_reader
+from phyde.result import HydeResult, ResultTable
+from phyde.triples import TripleSpace, group_trios
+from phyde.utils import Checkpoint, expand_prefix, imap_ordered, resume_results
+from phyde.writer import RESULT_HEADER, ResultWriter, bootstrap_table, individual_table
@@ -0,0 +1,171 @@
+""" Functions and classes for storing HyDe output in a binary format. """
+
+import struct
+import zipfile
+from collections.abc import Mapping
+
+import numpy as np
+
+# Size of the fixed part of the local file header of a zip archive member.
+_ZIP_HEADER = 30
+
+
+def is_binary(filename):
+    """
+    Check whether a file holds HyDe output in the binary (``.npz``) format
+    rather than as text.
+
+    :param str filename: name of the file.
+    :rtype: bool
+    """
+    with open(filename, "rb") as f:
+        return f.read(4) == b"PK\x03\x04"
+
+
+def save_columns(filename, kind, p1, hyb, p2, values, **extra):
+    """
+    Save HyDe output as an uncompressed ``.npz`` file. The names of the
+    taxa in each triple are stored as three arrays of strings and the
+    values for each column of the text output as one array of floats per
+    column, so that any column can be read without the others. An index
+    of the triples, sorted by name, is stored with them so that a triple
+    can be found without reading all of the names. As when the text output
+    is read, only the first row is kept for a triple that was tested more
+    than once.
+
+    :param str filename: name of the output file.
+    :param str kind: type of output, ``"results"`` or ``"bootstrap"``.
+    :param p1: names of parent one.
+    :param hyb: names of the putative hybrids.
+    :param p2: names of parent two.
+    :param values: array with one row for each column of values, with the
+        triples along its second axis.
+    :param extra: any other arrays to store in the file, stored as given.
+    """
+    p1, hyb, p2 = [np.asarray(x, dtype=str) for x in (p1, hyb, p2)]
+    values = np.asarray(values, dtype=np.double)
+    keys = _triple_keys(p1, hyb, p2)
+    first = np.sort(np.unique(keys, return_index=True)[1])
+    if len(first) != len(keys):
+        # keep the first row for each triple that was tested more than once
+        dup = np.ones(len(keys), dtype=bool)
+        dup[first] = False
+        for i in np.flatnonzero(dup):
+            print("\nERROR:")
+            print(
+                "  The triple ", (str(p1[i]), str(hyb[i]), str(p2[i])),
+                " was tested more than once.\n"
+            )
+        p1, hyb, p2, keys = p1[first], hyb[first], p2[first], keys[first]
+        values = values[:, first]
+    order = np.argsort(keys, kind="stable")
+    # np.savez would add ".npz" to a name without it
+    with open(filename, "wb") as f:
+        np.savez(
+            f,
+            kind=np.array(kind),
+            p1=p1,
+            hyb=hyb,
+            p2=p2,
+            values=np.ascontiguousarray(values, dtype=np.double),
+            keys=keys[order],
+            order=order,
+            **extra
+        )
+
+
+def load_columns(filename, mmap=True):
+    """
+    Load HyDe output saved by :func:`save_columns`. With ``mmap=True``
+    the arrays are memory-mapped, so that they are only read from disk
+    when they are used.
+
+    :param str filename: name of the file.
+    :param bool mmap: memory-map the arrays (default=True).
+
+    Returns a dictionary of arrays keyed by name.
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as zf, open(filename, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _map_member(filename, f, info)
+            else:
+                with zf.open(info) as m:
+                    arrays[name] = np.lib.format.read_array(m)
+    return arrays
+
+
+def _map_member(filename, f, info):
+    # Memory-map an uncompressed .npy member of a zip archive. Its data
+    # starts after the local file header, the name and extra fields of the
+    # member and the .npy header.
+    f.seek(info.header_offset)
+    header = f.read(_ZIP_HEADER)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    f.seek(info.header_offset + _ZIP_HEADER + name_len + extra_len)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject or 0 in shape or shape == ():
+        f.seek(info.header_offset + _ZIP_HEADER + name_len + extra_len)
+        return np.lib.format.read_array(f)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                     order="F" if fortran else "C")
+
+
+def _triple_keys(p1, hyb, p2):
+    # One string per triple, for sorting and searching.
+    return np.char.add(np.char.add(np.char.add(np.char.add(p1, "\t"), hyb), "\t"), p2)
+
+
+class TripleIndex(Mapping):
+    """
+    A read-only mapping from triples ``(p1, hyb, p2)`` to row numbers,
+    backed by the sorted keys stored in a binary file. Triples are found by
+    binary search, so the index does not need to be built when the file is
+    opened. Files written by :func:`save_columns` hold each triple once; if a
+    file holds a triple more than once anyway, the first row is used.
+
+    :param p1: names of parent one, in row order.
+    :param hyb: names of the putative hybrids, in row order.
+    :param p2: names of parent two, in row order.
+    :param keys: sorted keys of the triples.
+    :param order: row number for each sorted key.
+    """
+
+    def __init__(self, p1, hyb, p2, keys, order):
+        """
+        TripleIndex constructor.
+        """
+        self.p1 = p1
+        self.hyb = hyb
+        self.p2 = p2
+        self.keys = keys
+        self.order = order
+
+    def __getitem__(self, triple):
+        try:
+            key = "\t".join(triple)
+        except TypeError:
+            raise KeyError(triple)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            raise KeyError(triple)
+        return int(self.order[i])
+
+    def __contains__(self, triple):
+        try:
+            self[triple]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return zip(self.p1.tolist(), self.hyb.tolist(), self.p2.tolist())
+
+    def __len__(self):
+        return len(self.order)
@@ -1,16 +1,29 @@
 """ Class for processing HyDe bootsrapping output. """
 
+from collections.abc import Mapping
+from itertools import groupby
+
 import numpy as np
 
+from phyde.batch import PATTERNS
+from phyde.binary import TripleIndex, is_binary, load_columns, save_columns
+from phyde.result import RESULT_HEADER, STATS, ResultTable
+
 
 class Bootstrap:
     """
-    A class representing a dictionary of
-    species triplets with info for each
-    bootstrap replicate stored as a dictionary
-    containing parameter values.
+    A class representing the bootstrap replicates for each of a set of
+    species triplets. The replicates are stored in a single array,
+    ``values``, with shape (triples, replicates, values), where the values
+    for each replicate are in the same order as the columns of the
+    bootstrap file. Triples with fewer replicates than the others are
+    padded with NaN. ``breps`` gives the replicates for a triple as a list
+    of dictionaries containing parameter values. Replicates can be read
+    from the text output of HyDe or from the binary format written by
+    :meth:`save`, which is memory-mapped by default.
 
     :param str bootfile: name of file with bootstrapping results.
+    :param bool mmap: memory-map a binary bootstrap file (default=True).
 
     Example:
 
@@ -20,14 +33,20 @@ class Bootstrap:
         boot = hd.Bootstrap("hyde-boot.txt")
     """
 
-    def __init__(self, bootfile):
+    def __init__(self, bootfile, mmap=True):
         """
         Bootstrap constructor.
         """
         self.bootfile = bootfile
-        self.breps = {}
         self.triples = []
-        self._read_bootstraps(bootfile)
+        self.index = {}
+        self.nreps = np.zeros(0, dtype=np.intp)
+        self.values = np.zeros((0, 0, len(STATS)))
+        self.breps = _BootstrapReps(self)
+        if is_binary(bootfile):
+            self._read_binary(bootfile, mmap)
+        else:
+            self._read_bootstraps(bootfile)
 
     def __call__(self, attr, p1, hyb, p2):
         """
@@ -51,87 +70,125 @@ class Bootstrap:
             boot = hd.Bootstrap("hyde-boot.txt")
             boot("Gamma", "sp1", "sp2", "sp3")
         """
-        return [t[attr] for t in self.breps[(p1, hyb, p2)]]
+        i = self.index[(p1, hyb, p2)]
+        return self.values[i, : self.nreps[i], STATS.index(attr)].tolist()
 
     def _read_bootstraps(self, bootfile):
+        # Read the file one block of replicates at a time, so that only the
+        # parsed values are kept in memory.
+        reps = {}
         with open(bootfile) as b:
-            boot_read_in = b.read()
-            if boot_read_in[-1] == "\n":
-                boot_reps = boot_read_in[:-1].split("####\n")
-            else:
-                boot_reps = boot_read_in.split("####\n")
-            split_bootreps = [r.splitlines() for r in boot_reps]
-            print("Number of boot reps:", len(boot_reps[0].splitlines()[1:]))
-            for s in split_bootreps:
-                lines = [line.split("\t") for line in s[1:]]
-                for l in lines:
-                    tripl = (l[0], l[1], l[2])
-                    if tripl not in self.triples:
-                        self.triples.append(tripl)
-                        self.breps[tripl] = []
-                    else:
-                        pass
-                    self.breps[tripl].append(self._boot_info(l[3:]))
-
-    def _boot_info(self, b):
-        if len(b) != 18:
+            block = []
+            for line in b:
+                if line.startswith("####") or line.startswith("P1\tHybrid\tP2\t"):
+                    self._add_reps(reps, block)
+                    block = []
+                elif line.strip():
+                    block.append(line.rstrip("\r\n"))
+            self._add_reps(reps, block)
+        self.triples = list(reps)
+        self.index = {t: i for i, t in enumerate(self.triples)}
+        self.nreps = np.array([sum(len(v) for v in r) for r in reps.values()], dtype=np.intp)
+        nmax = self.nreps.max() if len(self.nreps) else 0
+        self.values = np.full((len(self.triples), nmax, len(STATS)), np.nan)
+        for i, r in enumerate(reps.values()):
+            self.values[i, : self.nreps[i]] = np.concatenate(r)
+        print("Number of boot reps:", self.nreps[0] if len(self.nreps) else 0)
+
+    def _read_binary(self, bootfile, mmap):
+        # Read replicates saved in the binary format, where the values are
+        # stored with shape (values, triples, replicates).
+        cols = load_columns(bootfile, mmap)
+        if str(cols["kind"]) != "bootstrap" or cols["stats"].tolist() != STATS:
+            raise ValueError(
+                "** Warning: " + bootfile + " is not a binary HyDe bootstrap file. **"
+            )
+        self.index = TripleIndex(cols["p1"], cols["hyb"], cols["p2"],
+                                 cols["keys"], cols["order"])
+        self.triples = list(self.index)
+        self.nreps = cols["nreps"]
+        self.values = np.moveaxis(cols["values"], 0, 2)
+        print("Number of boot reps:", self.nreps[0] if len(self.nreps) else 0)
+
+    def save(self, outfile):
+        """
+        Save the bootstrap replicates in the binary format, which can be
+        read back with :class:`phyde.Bootstrap` much faster than the text
+        output.
+
+        :param str outfile: name of the output file (e.g., "hyde-boot.npz").
+        """
+        names = [[t[k] for t in self.triples] for k in range(3)]
+        save_columns(outfile, "bootstrap", *names, np.moveaxis(self.values, 2, 0),
+                     nreps=np.asarray(self.nreps), stats=np.array(STATS))
+
+    def write(self, outfile):
+        """
+        Write the bootstrap replicates as text, in the same layout as
+        ``hyde-boot.txt``.
+
+        :param str outfile: name of the output file.
+        """
+        with open(outfile, "w") as f:
+            for i, t in enumerate(self.triples):
+                n = self.nreps[i]
+                if i > 0:
+                    f.write("####\n")
+                f.write(RESULT_HEADER)
+                ResultTable([t[0]] * n, [t[1]] * n, [t[2]] * n,
+                            dict(zip(STATS, self.values[i, :n].T))).write(f)
+
+    def _add_reps(self, reps, block):
+        # Parse a block of lines and add the values to the list of
+        # replicates for each triple.
+        if not block:
+            return
+        names, rest = [], []
+        for line in block:
+            fields = line.split("\t", 3)
+            if len(fields) != 4:
+                raise ValueError(
+                    "** Warning: length of bootrep entry is incorrect. **"
+                )
+            names.append((fields[0], fields[1], fields[2]))
+            rest.append(fields[3])
+        values = "\t".join(rest).split("\t")
+        if len(values) != len(STATS) * len(block):
             raise ValueError(
                 "** Warning: length of bootrep entry is incorrect. **"
             )
-        else:
-            pass
-        boot_info = {
-            "Zscore": float(b[0]),
-            "Pvalue": float(b[1]),
-            "Gamma": float(b[2]),
-            "AAAA": float(b[3]),
-            "AAAB": float(b[4]),
-            "AABA": float(b[5]),
-            "AABB": float(b[6]),
-            "AABC": float(b[7]),
-            "ABAA": float(b[8]),
-            "ABAB": float(b[9]),
-            "ABAC": float(b[10]),
-            "ABBA": float(b[11]),
-            "BAAA": float(b[12]),
-            "ABBC": float(b[13]),
-            "CABC": float(b[14]),
-            "BACA": float(b[15]),
-            "BCAA": float(b[16]),
-            "ABCD": float(b[17]),
-        }
-        return boot_info
+        values = np.array(values, dtype=np.double).reshape(len(block), len(STATS))
+        start = 0
+        for tripl, rows in groupby(names):
+            stop = start + len(list(rows))
+            reps.setdefault(tripl, []).append(values[start:stop])
+            start = stop
+
+    def _stat(self, attr):
+        # Values of one attribute with shape (triples, replicates).
+        return np.ascontiguousarray(self.values[:, :, STATS.index(attr)])
 
     def summarize(self):
         # Summarizes the results of a bootsrapped HyDe analysis.
+        stats = ["Zscore", "Pvalue", "Gamma"]
+        means = {k: np.nanmean(self._stat(k), axis=1) for k in stats}
+        stds = {k: np.nanstd(self._stat(k), axis=1) for k in stats}
         summaries = {}
-        for t in self.triples:
-            summaries[t] = {}
-            summaries[t]["Zscore"] = [
-                np.mean(self.zscore(t)),
-                np.std(self.zscore(t)),
-            ]
-            summaries[t]["Pvalue"] = [
-                np.mean(self.pvalue(t)),
-                np.std(self.pvalue(t)),
-            ]
-            summaries[t]["Gamma"] = [
-                np.mean(self.gamma(t)),
-                np.std(self.gamma(t)),
-            ]
+        for i, t in enumerate(self.triples):
+            summaries[t] = {k: [means[k][i], stds[k][i]] for k in stats}
         return summaries
 
     def gamma(self, p1, hyb, p2):
         # Return the values of gamma for the triple (p1, hyb, p2).
-        return [t["Gamma"] for t in self.breps[(p1, hyb, p2)]]
+        return self("Gamma", p1, hyb, p2)
 
     def zscore(self, p1, hyb, p2):
         # Return the values of the test statistic for the triple (p1, hyb, p2).
-        return [t["Zscore"] for t in self.breps[(p1, hyb, p2)]]
+        return self("Zscore", p1, hyb, p2)
 
     def pvalue(self, p1, hyb, p2):
         # Return the p-values for the triple (p1, hyb, p2).
-        return [t["Pvalue"] for t in self.breps[(p1, hyb, p2)]]
+        return self("Pvalue", p1, hyb, p2)
 
     def abba_baba(self, p1, hyb, p2):
         """
@@ -151,44 +208,43 @@ class Bootstrap:
             boot = hd.Bootstrap("hyde-boot.txt")
             boot.abba_baba("sp1", "sp2", "sp3")
         """
-        return (
-            np.array([t["ABBA"] for t in self.breps[(p1, hyb, p2)]])
-            - np.array([t["ABAB"] for t in self.breps[(p1, hyb, p2)]])
-        ) / (
-            np.array([t["ABBA"] for t in self.breps[(p1, hyb, p2)]])
-            + np.array([t["ABAB"] for t in self.breps[(p1, hyb, p2)]])
-        )
+        i = self.index[(p1, hyb, p2)]
+        return self.d_statistics()[i, : self.nreps[i]]
+
+    def d_statistics(self):
+        """
+        Calculate Patterson's D-Statistic for every bootstrap replicate of
+        every triple at once.
+
+        :rtype: numpy.array
+
+        Returns an array with shape (triples, replicates).
+        """
+        abba = self._stat("ABBA")
+        abab = self._stat("ABAB")
+        with np.errstate(all="ignore"):
+            return (abba - abab) / (abba + abab)
 
     def site_patterns(self, p1, hyb, p2):
         # Get all site patterns for the triple (p1, hyb, p2)
-        return {
-            "AAAA": [t["AAAA"] for t in self.breps[(p1, hyb, p2)]],
-            "AAAB": [t["AAAB"] for t in self.breps[(p1, hyb, p2)]],
-            "AABA": [t["AABA"] for t in self.breps[(p1, hyb, p2)]],
-            "AABB": [t["AABB"] for t in self.breps[(p1, hyb, p2)]],
-            "AABC": [t["AABC"] for t in self.breps[(p1, hyb, p2)]],
-            "ABAA": [t["ABAA"] for t in self.breps[(p1, hyb, p2)]],
-            "ABAB": [t["ABAB"] for t in self.breps[(p1, hyb, p2)]],
-            "ABAC": [t["ABAC"] for t in self.breps[(p1, hyb, p2)]],
-            "ABBA": [t["ABBA"] for t in self.breps[(p1, hyb, p2)]],
-            "BAAA": [t["BAAA"] for t in self.breps[(p1, hyb, p2)]],
-            "ABBC": [t["ABBC"] for t in self.breps[(p1, hyb, p2)]],
-            "CABC": [t["CABC"] for t in self.breps[(p1, hyb, p2)]],
-            "BACA": [t["BACA"] for t in self.breps[(p1, hyb, p2)]],
-            "BCAA": [t["BCAA"] for t in self.breps[(p1, hyb, p2)]],
-            "ABCD": [t["ABCD"] for t in self.breps[(p1, hyb, p2)]],
-        }
+        i = self.index[(p1, hyb, p2)]
+        counts = self.values[i, : self.nreps[i], len(STATS) - len(PATTERNS):]
+        return dict(zip(PATTERNS, counts.T.tolist()))
 
     def write_summary(self, summary_file):
         """
         Write a summary of the bootstrap replicates for each tested triple.
         The summary written to file includes the mean and standard deviation
-        of the Zscore, P-value, and estimate of :math:`\gamma`.
+        of the Zscore, P-value, and estimate of :math:`\\gamma`.
 
         :param str summary_file: name of file.
         """
         print("Writing summary to file:", summary_file)
-        summ = self.summarize()
+        cols = [[t[k] for t in self.triples] for k in range(3)]
+        for k in ["Zscore", "Pvalue", "Gamma"]:
+            values = self._stat(k)
+            cols.append(list(map(repr, np.nanmean(values, axis=1).tolist())))
+            cols.append(list(map(repr, np.nanstd(values, axis=1).tolist())))
         with open(summary_file, "w") as f:
             print(
                 "P1",
@@ -203,16 +259,23 @@ class Bootstrap:
                 sep="\t",
                 file=f,
             )
-            for k in summ.keys():
-                for i in list(k):
-                    print(i, "\t", sep="", end="", file=f)
-                print(
-                    summ[k]["Zscore"][0],
-                    summ[k]["Zscore"][1],
-                    summ[k]["Pvalue"][0],
-                    summ[k]["Pvalue"][1],
-                    summ[k]["Gamma"][0],
-                    summ[k]["Gamma"][1],
-                    sep="\t",
-                    file=f,
-                )
+            if self.triples:
+                f.write("\n".join(map("\t".join, zip(*cols))) + "\n")
+
+
+class _BootstrapReps(Mapping):
+    # Read-only view of a Bootstrap as a dictionary of lists of replicates
+    # keyed by triple. Each list is built only when it is looked up.
+
+    def __init__(self, boot):
+        self._boot = boot
+
+    def __getitem__(self, triple):
+        i = self._boot.index[triple]
+        return [dict(zip(STATS, r)) for r in self._boot.values[i, : self._boot.nreps[i]].tolist()]
+
+    def __iter__(self):
+        return iter(self._boot.index)
+
+    def __len__(self):
+        return len(self._boot.index)
@@ -0,0 +1,153 @@
+""" Persistent cache of site pattern count tables. """
+
+import atexit
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Number of keys looked up in each query.
+_QUERY_SIZE = 500
+
+
+class CountCache(object):
+    """
+    A cache of count tables that is kept in an SQLite database on disk, so
+    that it can be reused by later analyses of the same data (e.g., with a
+    different p-value cutoff or a subset of the triples). Each entry holds
+    the 4x4x4x4 table of site pattern counts for a trio of taxa and the
+    number of resolved quadruples of individuals. The keys are built by
+    :class:`phyde.HydeData` and include a fingerprint of the data, so that
+    tables are never reused for different data.
+
+    The total size of the entries is kept below ``max_size`` bytes by
+    removing the least recently used entries. New entries and the times
+    that entries are used are written in batches; the cache is safe to
+    share between threads and between processes.
+
+    :param str path: name of the cache file.
+    :param int max_size: maximum size of the cache in bytes (default=1GB).
+    :param float flush_every: seconds between writes to the database (default=1).
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup", 100, 6, 10000)
+        data.use_count_cache("counts.hyde.db")
+    """
+
+    def __init__(self, path, max_size=1 << 30, flush_every=1.0):
+        """
+        CountCache constructor.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._new = {}
+        self._used = {}
+        self._last_flush = time.monotonic()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS counts ("
+                             "key TEXT PRIMARY KEY, counts BLOB NOT NULL, "
+                             "num_obs REAL NOT NULL, used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS counts_used ON counts (used)")
+        atexit.register(self.close)
+
+    def __len__(self):
+        with self._lock:
+            self._flush()
+            return self._db.execute("SELECT COUNT(*) FROM counts").fetchone()[0]
+
+    def get_many(self, keys):
+        """
+        Look up the count tables for a list of keys.
+
+        :param list keys: keys of the entries.
+
+        Returns a dictionary of ``(table, num_obs)`` pairs for the keys that
+        are in the cache.
+        """
+        found = {}
+        with self._lock:
+            for k in keys:
+                if k in self._new:
+                    found[k] = self._new[k]
+            keys = [k for k in dict.fromkeys(keys) if k not in found]
+            for i in range(0, len(keys), _QUERY_SIZE):
+                part = keys[i:i + _QUERY_SIZE]
+                rows = self._db.execute(
+                    "SELECT key, counts, num_obs FROM counts WHERE key IN (%s)"
+                    % ",".join("?" * len(part)), part)
+                for k, counts, num_obs in rows:
+                    found[k] = (np.frombuffer(counts, dtype=np.double).reshape(4, 4, 4, 4), num_obs)
+            now = time.time()
+            for k in found:
+                self._used[k] = now
+            self._maybe_flush()
+        return found
+
+    def put_many(self, entries):
+        """
+        Add count tables to the cache.
+
+        :param dict entries: ``(table, num_obs)`` pairs keyed by their keys.
+        """
+        with self._lock:
+            for k, (table, num_obs) in entries.items():
+                self._new[k] = (np.array(table, dtype=np.double).reshape(4, 4, 4, 4), float(num_obs))
+            self._maybe_flush()
+
+    def flush(self):
+        """
+        Write new entries and the times that entries were used to disk,
+        then remove the least recently used entries if the cache is larger
+        than ``max_size``.
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """
+        Flush the cache and close the database.
+        """
+        atexit.unregister(self.close)
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+                self._db.close()
+                self._db = None
+
+    def _maybe_flush(self):
+        # Entries are written in batches; an entry that has not been written
+        # when a worker process is stopped is simply counted again next time.
+        if time.monotonic() - self._last_flush >= self.flush_every:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._db is None or not (self._new or self._used):
+            return
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?)",
+                [(k, t.tobytes(), n, self._used.get(k, now)) for k, (t, n) in self._new.items()])
+            self._db.executemany(
+                "UPDATE counts SET used = ? WHERE key = ?",
+                [(u, k) for k, u in self._used.items() if k not in self._new])
+            size, count = self._db.execute(
+                "SELECT TOTAL(LENGTH(key) + LENGTH(counts)), COUNT(*) FROM counts").fetchone()
+            if size > self.max_size:
+                excess = int(np.ceil((size - self.max_size) / (size / count)))
+                self._db.execute(
+                    "DELETE FROM counts WHERE key IN "
+                    "(SELECT key FROM counts ORDER BY used LIMIT ?)", (excess,))
+        self._new = {}
+        self._used = {}
@@ -10,9 +10,26 @@
 import numpy as np
 cimport numpy as np
 cimport cython
+import hashlib
+import json
+import os
 import sys
+import tempfile
+import time
+from itertools import islice
+from multiprocess.pool import ThreadPool
+from multiprocess.shared_memory import SharedMemory
 
+from phyde.batch import PATTERNS, batch_stats, count_tables, unique_sites
+from phyde.cache import CountCache
+from phyde.readers import open_input, read_alignment
+from phyde.result import ResultTable
+from phyde.triples import TripleSpace, group_trios
+from phyde.utils import imap_ordered
+
+from cython.parallel cimport prange, threadid
 from libc.math cimport fabs, sqrt, pow, exp
+from libc.stdlib cimport calloc, free
 from libcpp.vector cimport vector
 
 # types and typedefs for DNA bases and indices
@@ -20,34 +37,8 @@ ctypedef np.uint8_t DNA_t
 DNA = np.uint8
 ctypedef np.uint64_t INDEX_t
 INDEX = np.uint64
-
-cdef dict _BASE_TO_UINT8 = {
-    "A": 0,  "a": 0,
-    "G": 1,  "g": 1,
-    "C": 2,  "c": 2,
-    "T": 3,  "t": 3,
-    "U": 3,  "u": 3,
-    "M": 5,  "m": 5,
-    "R": 6,  "r": 6,
-    "W": 7,  "w": 7,
-    "S": 8,  "s": 8,
-    "Y": 9,  "y": 9,
-    "K": 10, "k": 10,
-    "B": 11, "b": 11,
-    "D": 12, "d": 12,
-    "H": 13, "h": 13,
-    "V": 14, "v": 14,
-    "N": 15, "n": 15, "?": 15,
-    "-": 4
-}
-
-cdef dict _BASE_LOOKUP = {
-    0: [0], 1: [1], 2: [2], 3: [3], 4: [4], 5: [0, 2],
-    6: [0, 1], 7: [0, 3], 8: [1, 2], 9: [2, 3], 10: [1, 3],
-    11: [1, 2, 3], 12: [0, 1, 3], 13: [0, 2, 3], 14: [0, 1, 2],
-    15: [0, 1, 2, 3]
-}
-
+ctypedef np.uint32_t FREQ_t
+FREQ = np.uint32
 
 cdef vector[vector[int]] _baseLookup = [ #/* {A,G,C,T} == {0,1,2,3} */
     [0],
@@ -68,19 +59,162 @@ cdef vector[vector[int]] _baseLookup = [ #/* {A,G,C,T} == {0,1,2,3} */
     [0, 1, 2, 3]  #/* N == A or G or C or T */
 ]
 
+# Each individual contributes a vector of base frequencies at every site:
+# columns 0-3 hold unambiguous bases (A,G,C,T) and columns 4-7 hold the
+# fractions of an ambiguity code spread over the bases it can represent.
+# Gaps contribute nothing. Summing these over the individuals in a taxon
+# lets the counts for all quadruples be computed as one product per site.
+# Frequencies are stored in units of 1/FREQ_SCALE so that the fractions of
+# two-, three- and four-base codes are exact integers.
+# Sites where every individual in a taxon has the same unambiguous base are
+# the common case, so that base is also kept in a compact array (MIXED when
+# the taxon varies or has gaps/ambiguities) and such sites only need a single
+# count.
+cdef enum:
+    NFREQ = 8
+    FREQ_SCALE = 12
+    MIXED = 255
+
+# Number of groups of triples whose count tables are added up in one pass
+# over the blocks of sites when counting out of core (see _test_blocks).
+_BLOCK_TRIOS = 1 << 14
+
+
+@cython.profile(False)
+cdef inline int _sparse_freqs(FREQ_t* freqs, DNA_t fixed, int n_ind, bint amb, int* idx,
+                              double* val, int* lvl, double* n_unamb, double* n_amb) nogil:
+    # Collect the nonzero base frequencies of one taxon at one site, along
+    # with the number of unambiguous and ambiguous individuals it holds.
+    cdef int b, n = 0
+    n_amb[0] = 0.0
+    if fixed != MIXED:
+        idx[0] = fixed
+        val[0] = n_ind
+        lvl[0] = 0
+        n_unamb[0] = n_ind
+        return 1
+    n_unamb[0] = 0.0
+    for b in range(4):
+        if freqs[b] != 0:
+            idx[n] = b
+            val[n] = <double>freqs[b] / FREQ_SCALE
+            lvl[n] = 0
+            n_unamb[0] += val[n]
+            n += 1
+    if amb:
+        for b in range(4):
+            if freqs[4 + b] != 0:
+                idx[n] = b
+                val[n] = <double>freqs[4 + b] / FREQ_SCALE
+                lvl[n] = 1
+                n_amb[0] += freqs[4 + b]
+                n += 1
+        n_amb[0] /= FREQ_SCALE
+    return n
+
+
+@cython.profile(False)
+cdef inline double _resolved_quads(double* n_unamb, double* n_amb) nogil:
+    # Number of quadruples of individuals with at most two ambiguous bases.
+    cdef:
+        double l0 = n_unamb[0] * n_unamb[1]
+        double l1 = n_unamb[0] * n_amb[1] + n_amb[0] * n_unamb[1]
+        double l2 = n_amb[0] * n_amb[1]
+        double r0 = n_unamb[2] * n_unamb[3]
+        double r1 = n_unamb[2] * n_amb[3] + n_amb[2] * n_unamb[3]
+        double r2 = n_amb[2] * n_amb[3]
+    return l0 * (r0 + r1 + r2) + l1 * (r0 + r1) + l2 * r0
+
+
+@cython.profile(False)
+cdef inline double _count_site(FREQ_t* out, DNA_t fo, FREQ_t* p1, DNA_t fp1,
+                               FREQ_t* hyb, DNA_t fh, FREQ_t* p2, DNA_t fp2,
+                               int n_out, int n_p1, int n_hyb, int n_p2, bint amb,
+                               double w, double nquads, double* counts) noexcept nogil:
+    # Add the counts for one site to a flattened 16x16 table and return the
+    # number of quadruples of individuals they cover. The counts summed over
+    # every (out, p1, hyb, p2) quadruple of individuals factor into products
+    # of the per-taxon frequencies.
+    # A quadruple is only resolved when at most two of its bases are
+    # ambiguous, so each product term tracks its number of ambiguous
+    # bases (level) and is skipped once that exceeds two.
+    cdef:
+        int idx[4][NFREQ]
+        double val[4][NFREQ]
+        int lvl[4][NFREQ]
+        int cnt[4]
+        double n_unamb[4]
+        double n_amb[4]
+        double v_ab, v_abc
+        int a, b, c, d, l_ab, l_abc, x
+    if fo != MIXED and fp1 != MIXED and fh != MIXED and fp2 != MIXED:
+        counts[(fo * 4 + fp1) * 16 + fh * 4 + fp2] += w * nquads
+        return w * nquads
+    # Only taxa that vary at this site need their frequencies read.
+    cnt[0] = _sparse_freqs(out, fo, n_out, amb, idx[0], val[0], lvl[0], &n_unamb[0], &n_amb[0])
+    cnt[1] = _sparse_freqs(p1, fp1, n_p1, amb, idx[1], val[1], lvl[1], &n_unamb[1], &n_amb[1])
+    cnt[2] = _sparse_freqs(hyb, fh, n_hyb, amb, idx[2], val[2], lvl[2], &n_unamb[2], &n_amb[2])
+    cnt[3] = _sparse_freqs(p2, fp2, n_p2, amb, idx[3], val[3], lvl[3], &n_unamb[3], &n_amb[3])
+    if cnt[0] == 0 or cnt[1] == 0 or cnt[2] == 0 or cnt[3] == 0:
+        return 0.0
+    for a in range(cnt[0]):
+        for b in range(cnt[1]):
+            l_ab = lvl[0][a] + lvl[1][b]
+            v_ab = w * val[0][a] * val[1][b]
+            x = (idx[0][a] * 4 + idx[1][b]) * 16
+            for c in range(cnt[2]):
+                l_abc = l_ab + lvl[2][c]
+                if l_abc > 2:
+                    continue
+                v_abc = v_ab * val[2][c]
+                for d in range(cnt[3]):
+                    if l_abc + lvl[3][d] > 2:
+                        continue
+                    counts[x + idx[2][c] * 4 + idx[3][d]] += v_abc * val[3][d]
+    return w * _resolved_quads(n_unamb, n_amb)
+
+
+@cython.profile(False)
+cdef inline void _copy_counts(double[:, :] src, double (*counts)[16]):
+    # Load a 16x16 table of counts into a C array.
+    cdef int c1, c2
+    for c1 in range(16):
+        for c2 in range(16):
+            counts[c1][c2] = src[c1, c2]
+
+
 cdef class HydeData(object):
     """
     Class for storing (1) a matrix of DNA bases as unsigned, 8-bit
     integers and (2) mapping of individuals to taxa.
 
-    :param str infile: the name of the input DNA sequence data file.
+    :param str infile: the name of the input DNA sequence data file (one line per individual, sequential or interleaved PHYLIP, FASTA, NEXUS, or VCF; the format is detected automatically). Both files may be compressed with gzip, bzip2 or xz.
     :param str mapfile: the name of the individual mapping file.
     :param str outgroup: the name of the outgroup.
-    :param int nind: the number of individuals.
-    :param int ntaxa: the number of populations/taxa.
-    :param int nsites: the number of sites.
+    :param int nind: the number of individuals (optional; checked against the data file).
+    :param int ntaxa: the number of populations/taxa, including the outgroup (optional; checked against the map file).
+    :param int nsites: the number of sites (optional; checked against the data file).
     :param bool quiet: suppress printing output.
     :param bool ignore_amb_sites: ignore missing/ambiguous sites.
+    :param bool compress_sites: store each unique site pattern once, weighted by the number of times it occurs.
+    :param bool cache: keep a memory-mapped binary copy of the encoded data and reuse it on later runs.
+    :param int site_threads: number of threads used to count site patterns for each triple.
+    :param bool biallelic: keep only biallelic SNPs when reading a VCF file.
+    :param int block_sites: count site patterns out of core, this many sites at a time (default=0, keep the data in memory).
+    :param str cache_dir: directory for the binary copy of the data (default=next to the input file, or a temporary directory if that cannot be written to).
+
+    The binary copy of the data (``<infile>.hyde.npy``, with the taxon map
+    in ``<infile>.hyde.json``) is kept next to the input file unless
+    ``cache_dir`` is given. It is rebuilt whenever the contents of the
+    input file or the map file change, which are checked against a hash of
+    both files saved with the copy.
+
+    With ``block_sites`` set, the encoded data are written to the binary
+    copy as they are read (as with ``cache``) and that copy is
+    memory-mapped. The base frequencies are then built for one
+    block of sites at a time and the site pattern counts for each block are
+    added to the counts for each triple, so the memory used depends on the
+    size of a block rather than on the number of sites.
 
     Example:
 
@@ -88,105 +222,122 @@ cdef class HydeData(object):
 
         import phyde as hd
         data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup", 100, 6, 10000)
+        # or, with the dimensions taken from the files
+        data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup")
     """
     cdef:
         DNA_t[:, ::1] dnaMat
         INDEX_t[::1] outIndex # outgroup sequence indices
+        FREQ_t[:, :, ::1] taxonFreqs # per-taxon base frequencies at each site
+        DNA_t[:, ::1] taxonFixed # per-taxon fixed base at each site
+        FREQ_t[:, ::1] outFreqs
+        DNA_t[::1] outFixed
+        double[::1] siteWeights # occurrences of each column when compressed
+        tuple batchSites # unique sites across all taxa for count_tables()
         int nind, nsites
         dict taxonMap
         dict taxonMap_cp
-        double counts[16][16]
-        double site_pattern_probs[15]
-        double ind_nucl_probs[4][15]
+        dict taxonIndex
         str outgroup
         bint quiet
         bint ignore_amb_sites
+        bint compress_sites
+        bint cache
+        int site_threads
+        bint biallelic
+        int blockSites # sites counted at a time when out of core (0 in memory)
+        str blockFile # memory-mapped copy of the data when out of core
+        str cachePath # name of the binary copy of the data, without the extension
+        bint shm_owner
+        object shm # shared-memory block backing the arrays (see to_shared)
+        dict layout
+        object countCache # persistent cache of count tables (see use_count_cache)
+        str fingerprint # hash of the encoded data and taxon map
 
     def __init__(self, infile=None, mapfile=None, str outgroup=None,
                  int nind=-1, int ntaxa=-1, int nsites=-1, bint quiet=False,
-                 bint ignore_amb_sites=False):
+                 bint ignore_amb_sites=False, bint compress_sites=False,
+                 bint cache=False, int site_threads=1, bint biallelic=False,
+                 int block_sites=0, str cache_dir=None):
         """
         HydeData class constructor.
         """
         self.nind = nind
         self.nsites = nsites
-        self.dnaMat = np.zeros((self.nind, self.nsites), dtype=DNA)
         self.taxonMap = {}
         self.taxonMap_cp = {}
         self.outgroup = outgroup
         self.quiet = quiet
         self.ignore_amb_sites = ignore_amb_sites
+        self.compress_sites = compress_sites
+        self.cache = cache or block_sites > 0
+        self.site_threads = site_threads
+        self.biallelic = biallelic
+        self.blockSites = max(block_sites, 0)
+        if self.cache:
+            self.cachePath = self._cache_path(infile, cache_dir)
+        if self.blockSites > 0:
+            self.blockFile = self.cachePath + ".npy"
+        self.siteWeights = None
         if self.ignore_amb_sites:
             print("\nNB: Ignoring sites with missing/ambiguous bases.\n")
-        if not self.quiet:
-            print("\nReading input file",end='')
-        self._read_infile(infile)
-        if not self.quiet:
-            print("Done.")
-        if not self.quiet:
-            print("Reading map file  ",end='')
-        self._read_mapfile(mapfile)
-        if not self.quiet:
-            print("Done.")
+        if not (self.cache and self._load_cache(infile, mapfile)):
+            if not self.quiet:
+                print("\nReading input file ",end='')
+            self._read_infile(infile)
+            if not self.quiet:
+                print("Done.")
+            if not self.quiet:
+                print("Reading map file  ",end='')
+            self._read_mapfile(mapfile)
+            if not self.quiet:
+                print("Done.")
+            if self.cache:
+                self._write_cache(infile, mapfile)
+        if ntaxa != -1 and len(self.taxonMap) != ntaxa:
+            print("\nERROR:")
+            print("  Number of taxa specified (", ntaxa, ") is not equal", sep='')
+            print("  to the number of taxa in the map file (", len(self.taxonMap), ").\n", sep='')
+            sys.exit(-1)
+        nmap = sum(len(inds) for inds in self.taxonMap.values())
+        if nmap != self.nind:
+            print("\nERROR:")
+            print("  Number of individuals in the map file (", nmap, ") is not equal", sep='')
+            print("  to the number of individuals in the data file (", self.nind, ").\n", sep='')
+            sys.exit(-1)
+        if self.compress_sites and self.blockSites == 0:
+            self._compress_sites()
+        self._build_taxon_freqs()
         self.outIndex = np.array([i[0] for i in self.taxonMap[outgroup]], dtype=INDEX)
+        if self.blockSites == 0:
+            self.outFreqs = self.taxonFreqs[self.taxonIndex[outgroup]]
+            self.outFixed = self.taxonFixed[self.taxonIndex[outgroup]]
 
     def _read_infile(self, infile):
-        counter = 0
-        first_line = 1
-        valid_header = 1
-        nind_not_int = 0
-        with open(infile) as f:
-            for line in f:
-                if first_line == 1:
-                    first_line = 0
-                    nind_phylip = line.split()[0]
-                    nsites_phylip = line.split()[1]
-
-                    try:
-                        int(nind_phylip)
-                    except ValueError:
-                        nind_not_int = 1
-
-                    if nind_not_int:
-                        pass
-                    else:
-                        continue
-                        #print("\nERROR:")
-                        #print("  First line of data file does not contain the correct header information.")
-                        #print("  User input:")
-                        #if len(nsites_phylip) > 50:
-                        #    print("\n    ", nind_phylip, " ", nsites_phylip[0:49], "...", sep="")
-                        #else:
-                        #    print(line)
-                        #sys.exit(-1)
-
-                #try:
-                #    bases = line.split()[1]
-                #except IndexError:
-                #    break
-                if len(line) > self.nsites:
-                    bases = line.split()[1]
-                else:
-                    break
-                if len(bases) != self.nsites:
-                    print("\nERROR:")
-                    print("  Number of sites specified (", self.nsites, ") is not equal", sep='')
-                    print("  to the number of sites in the data file (", len(bases), ").\n", sep='')
-                    sys.exit(-1)
-                self._convert(counter, bases)
-                if not self.quiet:
-                    print(".", end="")
-                    sys.stdout.flush()
-                #print("**",counter,"**",sep="")
-                counter += 1
-                if counter > self.nind:
-                    print("\nERROR:")
-                    print("  Number of individuals specified (", self.nind, ") is not equal", sep='')
-                    print("  to the number of individuals in the data file (>= ", counter, ").\n", sep='')
-                    sys.exit(-1)
+        # The format of the data file is detected from its first bytes and
+        # the sequences are encoded straight into the matrix as they are
+        # read (see phyde.readers). The number of individuals and sites given
+        # to the constructor (if any) are checked against the file. Out of
+        # core, the matrix is written to disk as it is read and memory-mapped.
+        path = None if self.blockSites == 0 else self.cachePath + ".npy.tmp"
+        try:
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            dna, names = read_alignment(infile, self.nind, self.nsites, path=path,
+                                        biallelic=self.biallelic)
+        except ValueError as e:
+            print("\nERROR:")
+            print("  ", e, ".\n", sep='')
+            sys.exit(-1)
+        except OSError as e:
+            print("\nERROR:")
+            print("  Unable to open ", e.filename, " (", e.strerror, ").\n", sep='')
+            sys.exit(-1)
+        self.nind, self.nsites = dna.shape
+        self.dnaMat = dna
 
     def _read_mapfile(self, mapfile):
-        with open(mapfile) as f:
+        with open_input(mapfile, "r") as f:
             lines = f.read().splitlines()
             taxa = []
             for i, l in enumerate(lines):
@@ -199,6 +350,282 @@ cdef class HydeData(object):
                 if not self.quiet:
                     print(".", end='')
 
+    def _cache_path(self, infile, cache_dir):
+        # Name of the binary copy of the data, without the extension: next
+        # to the input file, or in cache_dir (by default a temporary
+        # directory when the input file's directory cannot be written to),
+        # where the name includes a hash of the input file's full path.
+        infile = os.path.abspath(infile)
+        if cache_dir is None:
+            if os.access(os.path.dirname(infile), os.W_OK):
+                return infile + ".hyde"
+            cache_dir = os.path.join(tempfile.gettempdir(), "hyde-cache")
+        name = hashlib.sha1(infile.encode()).hexdigest()[:16]
+        return os.path.join(os.path.abspath(cache_dir), os.path.basename(infile) + "." + name + ".hyde")
+
+    def _cache_key(self, infile, mapfile):
+        # Fingerprint of the source files: a hash of the contents of the data
+        # and map files, read in blocks so that a large data file is never
+        # held in memory. Hashing is much faster than parsing the data.
+        key = hashlib.blake2b()
+        key.update(("%d:" % self.biallelic).encode())
+        for fn in (infile, mapfile):
+            with open(fn, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    key.update(block)
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def _load_cache(self, infile, mapfile):
+        """
+        Memory-map the encoded data matrix cached by a previous run. Returns
+        False if there is no cache or it is out of date.
+        """
+        try:
+            with open(self.cachePath + ".json") as f:
+                meta = json.load(f)
+            if meta["source"] != self._cache_key(infile, mapfile):
+                return False
+            dna = np.load(self.cachePath + ".npy", mmap_mode="c")
+        except (OSError, ValueError, KeyError):
+            return False
+        if dna.dtype != DNA or dna.ndim != 2 or self.nind not in (-1, dna.shape[0]) \
+                or self.nsites not in (-1, dna.shape[1]):
+            return False
+        self.nind, self.nsites = dna.shape
+        if not self.quiet:
+            print("\nUsing cached data ", self.cachePath, ".npy", sep='')
+        self.dnaMat = dna
+        for t, inds in meta["taxonMap"].items():
+            self.taxonMap[t] = [(i, name) for i, name in inds]
+            self.taxonMap_cp[t] = [(i, name) for i, name in inds]
+        return True
+
+    def _write_cache(self, infile, mapfile):
+        """
+        Save the encoded data matrix and taxon map (see _cache_path). Out of
+        core, the matrix has already been written while reading it.
+        """
+        meta = {"source": self._cache_key(infile, mapfile), "taxonMap": self.taxonMap}
+        try:
+            if self.blockSites == 0:
+                os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+                with open(self.cachePath + ".npy.tmp", "wb") as f:
+                    np.save(f, np.asarray(self.dnaMat))
+            os.replace(self.cachePath + ".npy.tmp", self.cachePath + ".npy")
+            with open(self.cachePath + ".json.tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(self.cachePath + ".json.tmp", self.cachePath + ".json")
+        except OSError as e:
+            print("\nNB: Unable to write cache for ", infile, " (", e.strerror, ").", sep='')
+
+    def use_count_cache(self, path, max_size=1 << 30):
+        """
+        Keep the count table for each trio of taxa in a persistent cache
+        (see :class:`phyde.CountCache`). Later runs on the same data look
+        the tables up instead of counting the site patterns again, so only
+        the test statistics have to be computed. Tables are stored for each
+        unordered trio, so every triple formed from the same three taxa
+        uses the same entry.
+
+        :param str path: name of the cache file.
+        :param int max_size: maximum size of the cache in bytes (default=1GB).
+        :returns: the :class:`phyde.CountCache`.
+
+        Example:
+
+        .. code:: py
+
+            import phyde as hd
+            data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup", 100, 6, 10000)
+            data.use_count_cache("counts.hyde.db")
+        """
+        if self.fingerprint is None:
+            self.fingerprint = self._data_fingerprint()
+        self.countCache = CountCache(path, max_size)
+        return self.countCache
+
+    def _data_fingerprint(self):
+        # Hash of everything the count tables depend on: the encoded data
+        # matrix, the site weights and the rows of each taxon.
+        key = hashlib.sha1()
+        dna = np.ascontiguousarray(self.dnaMat)
+        key.update(("%d:%d:" % dna.shape).encode())
+        key.update(dna.data)
+        if self.siteWeights is not None:
+            key.update(np.ascontiguousarray(self.siteWeights).data)
+        key.update(json.dumps({t: [i for i, _ in inds] for t, inds in self.taxonMap.items()}).encode())
+        return key.hexdigest()
+
+    def _count_key(self, tuple trio):
+        # Key of the count table for a trio in the count cache.
+        return "\t".join((self.fingerprint, "amb" if not self.ignore_amb_sites else "noamb",
+                          self.outgroup) + trio)
+
+    def _cached_counts(self, triples, count):
+        # Count tables for a list of triples, taking the tables for each
+        # trio from the count cache where possible. The table for a triple
+        # is the table for its trio, in list_triples() order, with the axes
+        # permuted. count() counts the tables for a list of trios and
+        # returns (tables, num_obs).
+        trios, axes, keys = [], [], []
+        for triple in triples:
+            triple = tuple(triple)
+            if len(set(triple)) == 3:
+                trio = tuple(sorted(triple, key=self.taxonIndex.__getitem__))
+                axes.append((0,) + tuple(1 + trio.index(t) for t in triple))
+            else:
+                trio = triple
+                axes.append((0, 1, 2, 3))
+            trios.append(trio)
+            keys.append(self._count_key(trio))
+        found = self.countCache.get_many(keys)
+        missing = {k: trio for k, trio in zip(keys, trios) if k not in found}
+        if missing:
+            tables, num_obs = count(list(missing.values()))
+            new = {k: (tables[i], num_obs[i]) for i, k in enumerate(missing)}
+            self.countCache.put_many(new)
+            found.update(new)
+        return (np.array([found[k][0].transpose(a) for k, a in zip(keys, axes)]).reshape(-1, 4, 4, 4, 4),
+                np.array([found[k][1] for k in keys], dtype=np.double))
+
+    def _kernel_counts(self, list trios):
+        # Count tables for a list of trios, one at a time.
+        if self.blockSites > 0:
+            return self._sum_blocks("kernel", trios)
+        tables = np.empty((len(trios), 4, 4, 4, 4))
+        num_obs = np.empty(len(trios))
+        for k, (a, b, c) in enumerate(trios):
+            tables[k], num_obs[k] = self._trio_counts(a, b, c)
+        return tables, num_obs
+
+    def to_shared(self):
+        """
+        Move the data matrix and per-taxon base frequencies into a named
+        shared-memory block. Worker processes can then attach to the block
+        with :meth:`from_shared` instead of each holding a copy of the data.
+        Call :meth:`close_shared` once the workers are finished.
+
+        :returns: a picklable description of the shared data.
+
+        Example:
+
+        .. code:: py
+
+            desc = data.to_shared()
+            pool = mp.Pool(4, initializer=init_worker, initargs=(desc,))
+            ...
+            data.close_shared()
+        """
+        if self.shm is None and self.blockSites == 0:
+            arrays = {
+                "dnaMat": np.asarray(self.dnaMat),
+                "taxonFreqs": np.asarray(self.taxonFreqs),
+                "taxonFixed": np.asarray(self.taxonFixed),
+            }
+            if self.siteWeights is not None:
+                arrays["siteWeights"] = np.asarray(self.siteWeights)
+            layout = {}
+            size = 0
+            for k, a in arrays.items():
+                layout[k] = (size, a.shape, a.dtype.str)
+                size += (a.nbytes + 63) // 64 * 64
+            self.shm = SharedMemory(create=True, size=max(size, 1))
+            self.shm_owner = True
+            self.layout = layout
+            views = self._shared_views()
+            for k, a in arrays.items():
+                views[k][...] = a
+            self._set_arrays(views)
+        return {
+            "name": None if self.shm is None else self.shm.name,
+            "layout": self.layout,
+            "nind": self.nind,
+            "nsites": self.nsites,
+            "taxonMap": self.taxonMap,
+            "taxonMap_cp": self.taxonMap_cp,
+            "taxonIndex": self.taxonIndex,
+            "outgroup": self.outgroup,
+            "quiet": self.quiet,
+            "ignore_amb_sites": self.ignore_amb_sites,
+            "compress_sites": self.compress_sites,
+            "site_threads": self.site_threads,
+            "block_sites": self.blockSites,
+            "block_file": self.blockFile,
+            "fingerprint": self.fingerprint,
+            "count_cache": None if self.countCache is None else
+                           (self.countCache.path, self.countCache.max_size),
+        }
+
+    @staticmethod
+    def from_shared(dict desc):
+        """
+        Attach to data placed in shared memory by :meth:`to_shared` without
+        copying it. Out of core, the binary copy of the data is memory-mapped
+        instead.
+
+        :param dict desc: the description returned by :meth:`to_shared`.
+        :returns: a HydeData object backed by the shared block.
+        """
+        cdef HydeData self = HydeData.__new__(HydeData)
+        self.nind = desc["nind"]
+        self.nsites = desc["nsites"]
+        self.taxonMap = {t: list(inds) for t, inds in desc["taxonMap"].items()}
+        self.taxonMap_cp = {t: list(inds) for t, inds in desc["taxonMap_cp"].items()}
+        self.taxonIndex = dict(desc["taxonIndex"])
+        self.outgroup = desc["outgroup"]
+        self.quiet = desc["quiet"]
+        self.ignore_amb_sites = desc["ignore_amb_sites"]
+        self.compress_sites = desc["compress_sites"]
+        self.cache = False
+        self.site_threads = desc["site_threads"]
+        self.siteWeights = None
+        self.blockSites = desc["block_sites"]
+        self.blockFile = desc["block_file"]
+        self.shm_owner = False
+        if self.blockSites > 0:
+            self.dnaMat = np.load(self.blockFile, mmap_mode="c")
+        else:
+            self.shm = SharedMemory(name=desc["name"])
+            self.layout = desc["layout"]
+            self._set_arrays(self._shared_views())
+        self.outIndex = np.array([i[0] for i in self.taxonMap[self.outgroup]], dtype=INDEX)
+        self.fingerprint = desc["fingerprint"]
+        if desc["count_cache"] is not None:
+            self.countCache = CountCache(*desc["count_cache"])
+        return self
+
+    def close_shared(self):
+        """
+        Detach from the shared-memory block created by :meth:`to_shared`,
+        removing it if this object created it. The data are copied back into
+        private memory so the object remains usable.
+        """
+        if self.shm is None:
+            return
+        arrays = {k: np.array(v) for k, v in self._shared_views().items()}
+        self._set_arrays(arrays)
+        arrays = None
+        self.shm.close()
+        if self.shm_owner:
+            self.shm.unlink()
+        self.shm = None
+        self.shm_owner = False
+
+    def _shared_views(self):
+        # numpy arrays over the shared block, one per entry in the layout
+        return {k: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                for k, (offset, shape, dtype) in self.layout.items()}
+
+    def _set_arrays(self, dict arrays):
+        self.dnaMat = arrays["dnaMat"]
+        self.taxonFreqs = arrays["taxonFreqs"]
+        self.taxonFixed = arrays["taxonFixed"]
+        if "siteWeights" in arrays:
+            self.siteWeights = arrays["siteWeights"]
+        self.outFreqs = self.taxonFreqs[self.taxonIndex[self.outgroup]]
+        self.outFixed = self.taxonFixed[self.taxonIndex[self.outgroup]]
+
     def resetOutgroup(self, newOut):
         """
         Reset outgroup population.
@@ -207,11 +634,145 @@ cdef class HydeData(object):
         """
         self.outgroup = newOut
         self.outIndex = np.array([i[0] for i in self.taxonMap[newOut]], dtype=INDEX)
+        if self.blockSites > 0:
+            return
+        self.batchSites = None
+        self.outFreqs = self.taxonFreqs[self.taxonIndex[newOut]]
+        self.outFixed = self.taxonFixed[self.taxonIndex[newOut]]
 
-    cdef void _convert(self, int row, str d):
-        cdef unsigned long s
-        for s in range(len(d)):
-            self.dnaMat[row,s] = _BASE_TO_UINT8[d[s]]
+    def _compress_sites(self):
+        # Keep one copy of each unique column of the data matrix along with
+        # the number of times it occurs.
+        nsites = self.dnaMat.shape[1]
+        patterns, weights = np.unique(np.asarray(self.dnaMat), axis=1, return_counts=True)
+        self.dnaMat = np.ascontiguousarray(patterns)
+        self.siteWeights = weights.astype(np.double)
+        if not self.quiet:
+            print("Compressed ", nsites, " sites to ", patterns.shape[1],
+                  " unique site patterns (", round(nsites / max(patterns.shape[1], 1), 2),
+                  "x).", sep="")
+
+    def _build_taxon_freqs(self):
+        # Sum the base frequencies of the individuals in each taxon. Out of
+        # core, they are only built for one block of sites at a time (see
+        # _site_block).
+        cdef int t
+        taxa = list(self.taxonMap)
+        self.taxonIndex = {taxa[t]: t for t in range(len(taxa))}
+        if self.blockSites > 0:
+            return
+        self.taxonFreqs = np.zeros((len(taxa), self.dnaMat.shape[1], NFREQ), dtype=FREQ)
+        self.taxonFixed = np.zeros((len(taxa), self.dnaMat.shape[1]), dtype=DNA)
+        for t in range(len(taxa)):
+            self._fill_freqs(np.array([i[0] for i in self.taxonMap[taxa[t]]], dtype=INDEX),
+                             self.taxonFreqs[t], self.taxonFixed[t])
+
+    def _site_block(self, int start):
+        # An in-memory copy of the sites [start, start + blockSites) of the
+        # data, with its own base frequencies, for counting out of core.
+        cdef HydeData block = HydeData.__new__(HydeData)
+        block.dnaMat = np.ascontiguousarray(np.asarray(self.dnaMat)[:, start:start + self.blockSites])
+        block.nind = self.nind
+        block.nsites = block.dnaMat.shape[1]
+        block.taxonMap = self.taxonMap
+        block.taxonMap_cp = self.taxonMap_cp
+        block.outgroup = self.outgroup
+        block.quiet = True
+        block.ignore_amb_sites = self.ignore_amb_sites
+        block.compress_sites = self.compress_sites
+        block.site_threads = self.site_threads
+        block.siteWeights = None
+        if block.compress_sites:
+            block._compress_sites()
+        block._build_taxon_freqs()
+        block.outIndex = self.outIndex
+        block.outFreqs = block.taxonFreqs[block.taxonIndex[block.outgroup]]
+        block.outFixed = block.taxonFixed[block.taxonIndex[block.outgroup]]
+        return block
+
+    def _block_counts(self, str kind, args):
+        # Count tables for one block of sites (see _sum_blocks).
+        if kind == "kernel":
+            return self._kernel_counts(args)
+        if kind == "batch":
+            return self._batch_counts(args)
+        p1, hyb, p2 = args
+        return self._individual_counts(p1, hyb, p2)
+
+    def _sum_blocks(self, str kind, args, int n_threads=1):
+        # Count tables out of core: the tables for each block of sites are
+        # counted in turn and added up, so only one block (per thread) is
+        # held in memory. The counts are sums over sites, so the totals are
+        # the same as for the whole matrix at once.
+        starts = range(0, self.dnaMat.shape[1], self.blockSites)
+        run = lambda start: self._site_block(start)._block_counts(kind, args)
+        total = None
+        if n_threads > 1:
+            pool = ThreadPool(n_threads)
+            parts = imap_ordered(pool, run, starts, n_threads)
+        else:
+            pool = None
+            parts = map(run, starts)
+        try:
+            for counts in parts:
+                if total is None:
+                    total = counts
+                else:
+                    for t, c in zip(total, counts):
+                        np.add(t, c, out=t)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return total
+
+    cdef tuple _row_freqs(self, np.ndarray[INDEX_t, ndim=1] rows):
+        """
+        Base frequencies at each site summed over a set of individuals.
+
+        :param rows: rows of the individuals in the data matrix.
+
+        Returns the frequencies and the base shared by every individual at
+        each site (see :meth:`_fill_freqs`).
+        """
+        cdef:
+            FREQ_t[:, ::1] freqs = np.zeros((self.dnaMat.shape[1], NFREQ), dtype=FREQ)
+            DNA_t[::1] fixed = np.zeros(self.dnaMat.shape[1], dtype=DNA)
+        self._fill_freqs(rows, freqs, fixed)
+        return freqs, fixed
+
+    cdef int _fill_freqs(self, np.ndarray[INDEX_t, ndim=1] rows, FREQ_t[:, ::1] freqs,
+                         DNA_t[::1] fixed) except -1:
+        """
+        Add up the base frequencies of a set of individuals at each site, in
+        units of 1/FREQ_SCALE, and record the base that every one of them
+        has at each site (MIXED when they differ or have gaps or ambiguity
+        codes).
+
+        :param rows: rows of the individuals in the data matrix.
+        :param freqs: zeroed array of frequencies, one row per site.
+        :param fixed: array for the shared base at each site.
+        """
+        cdef:
+            int r, s, b, sites = self.dnaMat.shape[1]
+            unsigned n
+            DNA_t base
+        if FREQ_SCALE * rows.shape[0] > np.iinfo(FREQ).max:
+            raise ValueError("** Too many individuals (" + str(rows.shape[0]) + ") in one taxon. **")
+        for r in range(rows.shape[0]):
+            for s in range(sites):
+                base = self.dnaMat[rows[r],s]
+                if base < 4:
+                    freqs[s,base] += FREQ_SCALE
+                elif base > 4:
+                    n = _baseLookup[base].size()
+                    for b in range(n):
+                        freqs[s,4 + _baseLookup[base][b]] += FREQ_SCALE / n
+        for s in range(sites):
+            fixed[s] = MIXED
+            for b in range(4):
+                if freqs[s,b] == FREQ_SCALE * rows.shape[0]:
+                    fixed[s] = b
+        return 0
 
     cpdef dict test_triple(self, str p1, str hyb, str p2):
         """
@@ -237,11 +798,294 @@ cdef class HydeData(object):
           res = data.test_triple("sp1", "sp2", "sp3")
         """
         cdef:
-            np.ndarray[INDEX_t, ndim=1] p1_rows  = np.array([i[0] for i in self.taxonMap[p1]], dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] hyb_rows = np.array([i[0] for i in self.taxonMap[hyb]],  dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] p2_rows  = np.array([i[0] for i in self.taxonMap[p2]],  dtype=INDEX)
+            int i_p1 = self.taxonIndex[p1], i_hyb = self.taxonIndex[hyb], i_p2 = self.taxonIndex[p2]
             dict res
-        res = self._test_triple_c(p1_rows, hyb_rows, p2_rows)
+        if self.countCache is not None:
+            tables, num_obs = self._cached_counts([(p1, hyb, p2)], self._kernel_counts)
+            return self._table_results([(p1, hyb, p2)], tables[0], num_obs[0])[0][1]
+        if self.blockSites > 0:
+            tables, num_obs = self._kernel_counts([(p1, hyb, p2)])
+            return self._table_results([(p1, hyb, p2)], tables[0], num_obs[0])[0][1]
+        res = self._test_triple_c(self.taxonFreqs[i_p1], self.taxonFixed[i_p1],
+                                  self.taxonFreqs[i_hyb], self.taxonFixed[i_hyb],
+                                  self.taxonFreqs[i_p2], self.taxonFixed[i_p2],
+                                  len(self.taxonMap[p1]), len(self.taxonMap[hyb]),
+                                  len(self.taxonMap[p2]))
+        return res
+
+    cpdef list test_trio(self, str a, str b, str c):
+        """
+        Test the three hypotheses for an unordered trio of taxa,
+        ``(a, b, c)``, ``(a, c, b)`` and ``(b, a, c)``, the order used by
+        :meth:`list_triples`. The site patterns are only counted once: the
+        counts for each ordering are a permutation of the same table.
+
+        :param str a: first taxon.
+        :param str b: second taxon.
+        :param str c: third taxon.
+        :rtype: list
+
+        Returns a list of ``(triple, result)`` pairs, where each result is
+        the same dictionary returned by :meth:`test_triple`.
+
+        Example:
+
+        .. code:: py
+
+          import phyde as hd
+          data = hd.HydeData("data.txt", "map.txt", "out", 16, 4, 50000)
+          res = data.test_trio("sp1", "sp2", "sp3")
+        """
+        if self.countCache is not None:
+            tables, num_obs = self._cached_counts([(a, b, c)], self._kernel_counts)
+            return self._table_results([(a, b, c), (a, c, b), (b, a, c)], tables[0], num_obs[0])
+        table, num_obs = self._trio_counts(a, b, c)
+        return self._table_results([(a, b, c), (a, c, b), (b, a, c)], table, num_obs)
+
+    cdef tuple _trio_counts(self, str a, str b, str c):
+        """
+        Count table for the triple (a, b, c), with axes (outgroup, a, b, c),
+        and the number of resolved quadruples of individuals.
+
+        :param str a: first taxon.
+        :param str b: second taxon.
+        :param str c: third taxon.
+        """
+        cdef:
+            int i_a = self.taxonIndex[a], i_b = self.taxonIndex[b], i_c = self.taxonIndex[c]
+            int n_out = self.outIndex.shape[0]
+            int n_a = len(self.taxonMap[a]), n_b = len(self.taxonMap[b]), n_c = len(self.taxonMap[c])
+            double num_obs
+            FREQ_t[:, ::1] a_freqs, b_freqs, c_freqs
+            DNA_t[::1] a_fixed, b_fixed, c_fixed
+            double counts[16][16]
+            np.ndarray[np.double_t, ndim=4] table
+            int c1, c2
+        if self.blockSites > 0:
+            tables, obs = self._kernel_counts([(a, b, c)])
+            return tables[0], obs[0]
+        a_freqs, b_freqs, c_freqs = self.taxonFreqs[i_a], self.taxonFreqs[i_b], self.taxonFreqs[i_c]
+        a_fixed, b_fixed, c_fixed = self.taxonFixed[i_a], self.taxonFixed[i_b], self.taxonFixed[i_c]
+        table = np.empty((4, 4, 4, 4))
+        with nogil:
+            num_obs = self._get_counts(self.outFreqs, self.outFixed, a_freqs, a_fixed,
+                                       b_freqs, b_fixed, c_freqs, c_fixed,
+                                       n_out, n_a, n_b, n_c, self.siteWeights, counts)
+        for c1 in range(16):
+            for c2 in range(16):
+                table[c1 // 4, c1 % 4, c2 // 4, c2 % 4] = counts[c1][c2]
+        return table, num_obs
+
+    def count_triples(self, triples):
+        """
+        Count the site patterns for many triples at once. Instead of
+        sweeping over the sites once per triple, the counts for the whole
+        batch are built from a few large matrix products over blocks of
+        sites (see :func:`phyde.batch.count_tables`).
+
+        :param triples: iterable of 3-tuples ``(p1, hyb, p2)``.
+        :rtype: tuple
+
+        Returns ``(tables, num_obs)``: an array of shape ``(n, 4, 4, 4, 4)``
+        with the counts for each triple, with axes (outgroup, p1, hyb, p2),
+        and an array with the number of resolved quadruples of individuals
+        for each triple.
+
+        Example:
+
+        .. code:: py
+
+          import phyde as hd
+          data = hd.HydeData("data.txt", "map.txt", "out", 16, 4, 50000)
+          tables, num_obs = data.count_triples(data.list_triples())
+        """
+        if self.countCache is not None:
+            return self._cached_counts(list(triples), self._batch_counts)
+        return self._batch_counts(triples)
+
+    def _batch_counts(self, triples):
+        # Count tables for a list of triples with count_tables().
+        if self.blockSites > 0:
+            return self._sum_blocks("batch", list(triples))
+        idx = [[self.taxonIndex[t] for t in triple] for triple in triples]
+        if self.batchSites is None:
+            # find the unique sites once rather than for every batch
+            weights = None if self.siteWeights is None else np.asarray(self.siteWeights)
+            self.batchSites = unique_sites(np.asarray(self.outFreqs), np.asarray(self.taxonFreqs),
+                                           weights=weights)
+        return count_tables(np.asarray(self.outFreqs), np.asarray(self.taxonFreqs), idx,
+                            amb=not self.ignore_amb_sites, sites=self.batchSites)
+
+    def test_triples(self, triples, int n_threads=1, int batch=0):
+        """
+        Test each triple in an iterable of triples, yielding the results in
+        order. Runs of three consecutive triples that make up the
+        hypotheses for one trio (as in :meth:`list_triples`) are tested
+        together with :meth:`test_trio`. With more than one thread the
+        tests are spread over a pool of threads that all share this
+        object's data; site patterns are counted without holding the GIL,
+        so the threads run in parallel. With ``batch`` set, the site
+        patterns for that many trios at a time are counted together with
+        :meth:`count_triples`.
+
+        :param triples: iterable of 3-tuples ``(p1, hyb, p2)``.
+        :param int n_threads: number of threads to use (default=1).
+        :param int batch: number of trios to count at once (default=0, one at a time).
+
+        Yields ``(triple, result)`` pairs.
+
+        Example:
+
+        .. code:: py
+
+          import phyde as hd
+          data = hd.HydeData("data.txt", "map.txt", "out", 16, 4, 50000)
+          for triple, res in data.test_triples(data.triple_space(), n_threads=4):
+              print(triple, res["Zscore"])
+        """
+        for res in self._test_groups(triples, n_threads, batch):
+            for r in res:
+                yield r
+
+    def test_tables(self, triples, int n_threads=1, int batch=0, int size=1024,
+                    double interval=1.0):
+        """
+        Test each triple in an iterable of triples, as in
+        :meth:`test_triples`, but yield the results in order as blocks of
+        rows in a :class:`phyde.ResultTable` rather than one dictionary per
+        triple. With ``batch`` set, each block holds the results for one
+        batch of trios, which are never converted to dictionaries. Without
+        it, a block is yielded once it has ``size`` rows or ``interval``
+        seconds after the last one, so that slow tests are still written
+        out (and checkpointed) every few seconds.
+
+        :param triples: iterable of 3-tuples ``(p1, hyb, p2)``.
+        :param int n_threads: number of threads to use (default=1).
+        :param int batch: number of trios to count at once (default=0, one at a time).
+        :param int size: maximum number of triples in each block when not batched (default=1024).
+        :param float interval: maximum number of seconds between blocks when not batched (default=1).
+
+        Example:
+
+        .. code:: py
+
+          import phyde as hd
+          data = hd.HydeData("data.txt", "map.txt", "out", 16, 4, 50000)
+          with open("hyde-out.txt", "w") as outfile:
+              for table in data.test_tables(data.triple_space(), batch=256):
+                  table.write(outfile)
+        """
+        if batch > 0:
+            for table in self._test_groups(triples, n_threads, batch):
+                yield table
+        else:
+            block, last = [], time.monotonic()
+            for res in self.test_triples(triples, n_threads):
+                block.append(res)
+                if len(block) >= size or time.monotonic() - last >= interval:
+                    yield ResultTable.from_results(block)
+                    block, last = [], time.monotonic()
+            if block:
+                yield ResultTable.from_results(block)
+
+    def _test_groups(self, triples, int n_threads, int batch):
+        # Results for each group of triples from group_trios(), or for each
+        # batch of groups, in order.
+        trios = group_trios(triples)
+        groups, run = trios, self._test_group
+        if batch > 0:
+            groups = iter(lambda: list(islice(trios, batch)), [])
+            run = self._test_batch
+        if self.blockSites > 0:
+            for res in self._test_blocks(trios, n_threads, batch):
+                yield res
+        elif n_threads > 1:
+            with ThreadPool(n_threads) as pool:
+                for res in imap_ordered(pool, run, groups, 4 * n_threads):
+                    yield res
+        else:
+            for group in groups:
+                yield run(group)
+        if self.countCache is not None:
+            # write the new tables before a worker process can be stopped
+            self.countCache.flush()
+
+    def _test_blocks(self, trios, int n_threads, int batch):
+        # Results for groups of triples out of core. The tables for many
+        # groups are counted in one pass over the blocks of sites, with the
+        # blocks spread over the threads, rather than reading every block
+        # again for each group.
+        kind = "kernel" if batch == 0 else "batch"
+        count = lambda firsts: self._sum_blocks(kind, firsts, n_threads)
+        for chunk in iter(lambda: list(islice(trios, max(batch, _BLOCK_TRIOS))), []):
+            firsts = [group[0] for group in chunk]
+            if self.countCache is not None:
+                tables, num_obs = self._cached_counts(firsts, count)
+            else:
+                tables, num_obs = count(firsts)
+            if batch > 0:
+                for i in range(0, len(chunk), batch):
+                    yield self._test_batch(chunk[i:i + batch], tables[i:i + batch], num_obs[i:i + batch])
+            else:
+                for k in range(len(chunk)):
+                    yield self._table_results(chunk[k], tables[k], num_obs[k])
+
+    def _test_group(self, list group):
+        # Results for one group of triples from group_trios().
+        p1, hyb, p2 = group[0]
+        if len(group) == 3:
+            return self.test_trio(p1, hyb, p2)
+        return [(group[0], self.test_triple(p1, hyb, p2))]
+
+    def _test_batch(self, list groups, tables=None, num_obs=None):
+        # Results for a list of groups from group_trios(), counted together
+        # (unless the tables are given) and with the statistics for every
+        # triple computed at once. Each triple's table is a permutation of
+        # the table for its group (see _table_results).
+        if tables is None:
+            tables, num_obs = self.count_triples([group[0] for group in groups])
+        triples, rows, perms, n_quads = [], [], [], []
+        for k in range(len(groups)):
+            n = self.outIndex.shape[0]
+            for t in groups[k][0]:
+                n *= len(self.taxonMap[t])
+            for triple, axes in zip(groups[k], ((0, 1, 2, 3), (0, 1, 3, 2), (0, 2, 1, 3))):
+                triples.append(triple)
+                perms.append(tables[k].transpose(axes))
+                rows.append(k)
+                n_quads.append(n)
+        stats = batch_stats(np.array(perms), num_obs[rows], np.array(n_quads, dtype=np.double))
+        if not self.quiet:
+            with np.errstate(all="ignore"):
+                total = sum(stats[name] for name in PATTERNS)
+                failed = np.abs((1.0 / num_obs[rows]) * total - 1.0) > 0.05
+            for _ in range(np.count_nonzero(failed)):
+                print("** WARNING: There was a problem counting site patterns. **")
+        return ResultTable([t[0] for t in triples], [t[1] for t in triples],
+                           [t[2] for t in triples], stats)
+
+    cdef list _table_results(self, list group, np.ndarray table, double num_obs):
+        """
+        Results for a group of triples from :func:`phyde.group_trios`, given
+        the 4x4x4x4 table of counts for its first triple. The axes of the
+        table are (outgroup, p1, hyb, p2): swapping hyb and p2 gives the
+        counts for (a, c, b), and swapping p1 and hyb those for (b, a, c).
+
+        :param list group: triples that share the counts.
+        :param table: table of counts for the first triple.
+        :param double num_obs: number of resolved quadruples counted.
+
+        Returns a list of (triple, results) pairs.
+        """
+        cdef:
+            double counts[16][16]
+            double n_quads = <double>self.outIndex.shape[0]
+            list res = []
+        for t in group[0]:
+            n_quads *= len(self.taxonMap[t])
+        for triple, axes in zip(group, ((0, 1, 2, 3), (0, 1, 3, 2), (0, 2, 1, 3))):
+            _copy_counts(table.transpose(axes).reshape(16, 16), counts)
+            res.append((triple, self._calc_stats(counts, num_obs, n_quads)))
         return res
 
     cpdef dict test_individuals(self, str p1, str hyb, str p2):
@@ -262,19 +1106,18 @@ cdef class HydeData(object):
           res = data.test_individuals("sp1", "sp2", "sp3")
         """
         cdef:
-            np.ndarray[INDEX_t, ndim=1] p1_rows  = np.array([i[0] for i in self.taxonMap[p1]], dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] hyb_rows = np.array([i[0] for i in self.taxonMap[hyb]],  dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] p2_rows  = np.array([i[0] for i in self.taxonMap[p2]],  dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] curr_ind = np.array([0], dtype=INDEX)
-            int n_hyb = hyb_rows.shape[0], t
+            int n_hyb = len(self.taxonMap[hyb]), t
+            double n_quads = <double>self.outIndex.shape[0] * len(self.taxonMap[p1]) * len(self.taxonMap[p2])
+            double[:, :, ::1] ind_counts
+            double[::1] ind_obs
+            double counts[16][16]
             dict res = {}
 
+        ind_counts, ind_obs = self._individual_counts(p1, hyb, p2)
         for t in range(n_hyb):
-            curr_ind[0] = hyb_rows[t]
+            _copy_counts(ind_counts[t], counts)
             res[self.taxonMap[hyb][t][1]] = {}
-            res[self.taxonMap[hyb][t][1]] = self._test_triple_c(p1_rows, curr_ind, p2_rows)
-            #tmp_res = self._test_triple_c(p1_rows, hyb_rows[t], p2_rows)
-            #res[self.taxonMap[hyb][t]] = tmp_res
+            res[self.taxonMap[hyb][t][1]] = self._calc_stats(counts, ind_obs[t], n_quads)
         return res
 
     cpdef dict bootstrap_triple(self, str p1, str hyb, str p2, int reps=100):
@@ -297,16 +1140,23 @@ cdef class HydeData(object):
           res = data.bootstrap_triple("sp1", "sp2", "sp3")
         """
         cdef:
-            np.ndarray[INDEX_t, ndim=1] p1_rows  = np.array([i[0] for i in self.taxonMap[p1]], dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] hyb_rows = np.array([i[0] for i in self.taxonMap[hyb]],  dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] p2_rows  = np.array([i[0] for i in self.taxonMap[p2]],  dtype=INDEX)
-            np.ndarray[INDEX_t, ndim=1] hyb_resampled = hyb_rows
+            int n_hyb = len(self.taxonMap[hyb]), r
+            double n_quads = <double>self.outIndex.shape[0] * len(self.taxonMap[p1]) * n_hyb * len(self.taxonMap[p2])
+            np.ndarray[np.double_t, ndim=3] ind_counts
+            np.ndarray[np.double_t, ndim=1] ind_obs
+            np.ndarray[np.double_t, ndim=1] weights
+            double counts[16][16]
             dict res = {}
-            int r
+
+        # The counts for a resampled set of hybrid individuals are the sum of
+        # the counts for each individual, weighted by how many times it was
+        # drawn, so each individual is only counted once.
+        ind_counts, ind_obs = self._individual_counts(p1, hyb, p2)
         for r in range(reps):
-            hyb_resampled = np.random.choice(hyb_rows, hyb_rows.shape[0], replace=True)
+            weights = np.random.multinomial(n_hyb, [1.0 / n_hyb] * n_hyb).astype(np.double)
+            _copy_counts(np.tensordot(weights, ind_counts, axes=1), counts)
             res[r+1] = {}
-            res[r+1] = self._test_triple_c(p1_rows, hyb_resampled, p2_rows)
+            res[r+1] = self._calc_stats(counts, weights.dot(ind_obs), n_quads)
         return res
 
     cpdef list list_triples(self):
@@ -318,47 +1168,97 @@ cdef class HydeData(object):
 
         Returns a list of 3-tuples: ``(p1, hyb, p2)``
         """
-        res = []
-        ks = list(self.taxonMap)
-        for a in range(len(ks)):
-            if ks[a] == self.outgroup:
-                del ks[a]
-        for i in range(len(ks)-2):
-            for j in range(i+1, len(ks)-1):
-                for k in range(j+1, len(ks)):
-                    res.append((ks[i],ks[j], ks[k]))
-                    res.append((ks[i],ks[k], ks[j]))
-                    res.append((ks[j],ks[i], ks[k]))
-        return res
+        return list(self.triple_space())
+
+    def triple_space(self):
+        """
+        Lazily enumerate all possible triples based on the populations in
+        the given map file, in the same order as :meth:`list_triples`,
+        without building the full list.
 
-    cdef dict _test_triple_c(self, np.ndarray[INDEX_t, ndim=1] p1,
-                             np.ndarray[INDEX_t, ndim=1] hyb,
-                             np.ndarray[INDEX_t, ndim=1] p2):
+        :rtype: TripleSpace
         """
+        return TripleSpace([t for t in self.taxonMap if t != self.outgroup])
 
+    cdef tuple _individual_counts(self, str p1, str hyb, str p2):
+        """
+        Count tables for each individual in the hybrid taxon.
+
+        :param str p1:  parent one.
+        :param str hyb: the putative hybrid.
+        :param str p2:  parent two.
+
+        Returns an array of 16x16 tables of counts, one per individual, and
+        the number of resolved quadruples counted for each.
         """
         cdef:
-            int i, j, k, l, c1, c2
-            int n_out = self.outIndex.shape[0], n_p1 = p1.shape[0]
-            int n_hyb = hyb.shape[0], n_p2 = p2.shape[0]
-            double num_obs = 0.0, avg_obs = 0.0, z_val = 0.0, p_val = 0.0
-            double _c_num = 0.0, _c_denom = 0.0, _c = 0.0, gamma = 0.0
+            np.ndarray[INDEX_t, ndim=1] hyb_rows = np.array([i[0] for i in self.taxonMap[hyb]],  dtype=INDEX)
+            np.ndarray[INDEX_t, ndim=1] curr_ind = np.array([0], dtype=INDEX)
+            int n_hyb = hyb_rows.shape[0], t, c1, c2
+            int n_out = self.outIndex.shape[0], n_p1 = len(self.taxonMap[p1]), n_p2 = len(self.taxonMap[p2])
+            FREQ_t[:, ::1] p1_freqs, p2_freqs
+            DNA_t[::1] p1_fixed, p2_fixed
+            FREQ_t[:, ::1] ind_freqs
+            DNA_t[::1] ind_fixed
+            double counts[16][16]
+            double[:, :, ::1] ind_counts = np.zeros((n_hyb, 16, 16), dtype=np.double)
+            double[::1] ind_obs = np.zeros(n_hyb, dtype=np.double)
 
-        for c1 in range(16):
-            for c2 in range(16):
-                self.counts[c1][c2] = 0.0
+        if self.blockSites > 0:
+            return self._sum_blocks("individual", (p1, hyb, p2))
+        p1_freqs, p2_freqs = self.taxonFreqs[self.taxonIndex[p1]], self.taxonFreqs[self.taxonIndex[p2]]
+        p1_fixed, p2_fixed = self.taxonFixed[self.taxonIndex[p1]], self.taxonFixed[self.taxonIndex[p2]]
+        for t in range(n_hyb):
+            curr_ind[0] = hyb_rows[t]
+            ind_freqs, ind_fixed = self._row_freqs(curr_ind)
+            with nogil:
+                ind_obs[t] = self._get_counts(self.outFreqs, self.outFixed, p1_freqs, p1_fixed,
+                                              ind_freqs, ind_fixed, p2_freqs, p2_fixed,
+                                              n_out, n_p1, 1, n_p2, self.siteWeights, counts)
+            for c1 in range(16):
+                for c2 in range(16):
+                    ind_counts[t,c1,c2] = counts[c1][c2]
+        return np.asarray(ind_counts), np.asarray(ind_obs)
 
-        for i in range(n_out):
-            for j in range(n_p1):
-                for k in range(n_hyb):
-                    for l in range(n_p2):
-                        num_obs += self._get_counts(self.outIndex[i], p1[j], hyb[k], p2[l])
+    cdef dict _test_triple_c(self, FREQ_t[:, ::1] p1, DNA_t[::1] p1_fixed,
+                             FREQ_t[:, ::1] hyb, DNA_t[::1] hyb_fixed,
+                             FREQ_t[:, ::1] p2, DNA_t[::1] p2_fixed,
+                             int n_p1, int n_hyb, int n_p2):
+        """
 
-        avg_obs  = num_obs / (self.outIndex.shape[0] * p1.shape[0] * hyb.shape[0] * p2.shape[0])
-        z_val    = self._calc_gh(num_obs, avg_obs)
+        """
+        cdef:
+            int n_out = self.outIndex.shape[0]
+            double num_obs = 0.0
+            double counts[16][16]
+
+        with nogil:
+            num_obs = self._get_counts(self.outFreqs, self.outFixed, p1, p1_fixed, hyb, hyb_fixed,
+                                       p2, p2_fixed, n_out, n_p1, n_hyb, n_p2, self.siteWeights, counts)
+        return self._calc_stats(counts, num_obs, <double>n_out * n_p1 * n_hyb * n_p2)
+
+    cdef dict _calc_stats(self, double (*counts)[16], double num_obs, double n_quads):
+        """
+        Test statistic, p-value, gamma and site pattern counts for a table
+        of counts.
+
+        :param counts: 16x16 table of counts.
+        :param double num_obs: number of resolved quadruples counted.
+        :param double n_quads: number of quadruples of individuals.
+        """
+        cdef:
+            double avg_obs = 0.0, z_val = 0.0, p_val = 0.0
+            double _c_num = 0.0, _c_denom = 0.0, _c = 0.0, gamma = 0.0
+            double site_pattern_probs[15]
+            bint counted
+
+        avg_obs  = num_obs / n_quads
+        z_val    = self._calc_gh(counts, site_pattern_probs, num_obs, avg_obs, &counted)
+        if not counted and not self.quiet:
+            print("** WARNING: There was a problem counting site patterns. **")
         p_val    = self._calc_p_value(z_val)
-        _c_num   = avg_obs * (self.site_pattern_probs[8] - self.site_pattern_probs[6])
-        _c_denom = avg_obs * (self.site_pattern_probs[3] - self.site_pattern_probs[6])
+        _c_num   = avg_obs * (site_pattern_probs[8] - site_pattern_probs[6])
+        _c_denom = avg_obs * (site_pattern_probs[3] - site_pattern_probs[6])
         _c       = _c_num / _c_denom
         gamma = _c / (1 + _c)
 
@@ -366,143 +1266,168 @@ cdef class HydeData(object):
             "Zscore": z_val,
             "Pvalue": p_val,
             "Gamma" : gamma,
-            "AAAA"  : self.site_pattern_probs[0],
-            "AAAB"  : self.site_pattern_probs[1],
-            "AABA"  : self.site_pattern_probs[2],
-            "AABB"  : self.site_pattern_probs[3],
-            "AABC"  : self.site_pattern_probs[4],
-            "ABAA"  : self.site_pattern_probs[5],
-            "ABAB"  : self.site_pattern_probs[6],
-            "ABAC"  : self.site_pattern_probs[7],
-            "ABBA"  : self.site_pattern_probs[8],
-            "BAAA"  : self.site_pattern_probs[9],
-            "ABBC"  : self.site_pattern_probs[10],
-            "CABC"  : self.site_pattern_probs[11],
-            "BACA"  : self.site_pattern_probs[12],
-            "BCAA"  : self.site_pattern_probs[13],
-            "ABCD"  : self.site_pattern_probs[14]
+            "AAAA"  : site_pattern_probs[0],
+            "AAAB"  : site_pattern_probs[1],
+            "AABA"  : site_pattern_probs[2],
+            "AABB"  : site_pattern_probs[3],
+            "AABC"  : site_pattern_probs[4],
+            "ABAA"  : site_pattern_probs[5],
+            "ABAB"  : site_pattern_probs[6],
+            "ABAC"  : site_pattern_probs[7],
+            "ABBA"  : site_pattern_probs[8],
+            "BAAA"  : site_pattern_probs[9],
+            "ABBC"  : site_pattern_probs[10],
+            "CABC"  : site_pattern_probs[11],
+            "BACA"  : site_pattern_probs[12],
+            "BCAA"  : site_pattern_probs[13],
+            "ABCD"  : site_pattern_probs[14]
         }
 
     @cython.nonecheck(False)
-    cdef double _get_counts(self, int out, int p1, int hyb, int p2):
+    @cython.profile(False)
+    cdef double _get_counts(self, FREQ_t[:, ::1] out, DNA_t[::1] out_fixed,
+                            FREQ_t[:, ::1] p1, DNA_t[::1] p1_fixed,
+                            FREQ_t[:, ::1] hyb, DNA_t[::1] hyb_fixed,
+                            FREQ_t[:, ::1] p2, DNA_t[::1] p2_fixed,
+                            int n_out, int n_p1, int n_hyb, int n_p2,
+                            double[::1] weights, double (*counts)[16]) noexcept nogil:
         """
 
         """
+        # Sites are weighted by their number of occurrences when the data
+        # matrix holds unique site patterns. With more than one site thread
+        # the sites are split between OpenMP threads that each add to their
+        # own count table, and the tables are summed at the end.
         cdef:
-            double nn = 0.0, resolved = 0.0
-            DNA_t i, j, k, l
-            int s, sites = self.dnaMat.shape[1]
-        for s in range(sites):
-            i = self.dnaMat[out,s]
-            j = self.dnaMat[p1,s]
-            k = self.dnaMat[hyb,s]
-            l = self.dnaMat[p2,s]
-            if i < 4 and j < 4 and k < 4 and l < 4:
-                nn += 1.0
-                self.counts[i * 4 + j][k * 4 + l] += 1.0
-            elif not self.ignore_amb_sites:
-                resolved = self._resolve_ambiguity_cpp(i, j, k, l)
-                nn += resolved
-            else:
-              pass
-
+            double nn = 0.0, w = 1.0
+            double nquads = <double>n_out * n_p1 * n_hyb * n_p2
+            bint weighted = weights is not None
+            bint amb = not self.ignore_amb_sites
+            int s, c, t, sites = out.shape[0], n_threads = self.site_threads
+            double* table = &counts[0][0]
+            double* tables = NULL
+        for c in range(256):
+            table[c] = 0.0
+        if n_threads > 1 and sites > 0:
+            tables = <double*> calloc(n_threads * 256, sizeof(double))
+        if tables == NULL:
+            for s in range(sites):
+                if weighted:
+                    w = weights[s]
+                nn += _count_site(&out[s,0], out_fixed[s], &p1[s,0], p1_fixed[s],
+                                  &hyb[s,0], hyb_fixed[s], &p2[s,0], p2_fixed[s],
+                                  n_out, n_p1, n_hyb, n_p2, amb, w, nquads, table)
+            return nn
+        for s in prange(sites, num_threads=n_threads, schedule="static"):
+            w = weights[s] if weighted else 1.0
+            nn += _count_site(&out[s,0], out_fixed[s], &p1[s,0], p1_fixed[s],
+                              &hyb[s,0], hyb_fixed[s], &p2[s,0], p2_fixed[s],
+                              n_out, n_p1, n_hyb, n_p2, amb, w, nquads,
+                              tables + threadid() * 256)
+        for t in range(n_threads):
+            for c in range(256):
+                table[c] += tables[t * 256 + c]
+        free(tables)
         return nn
 
-    cdef double _calc_gh(self, double nobs, double avobs):
+    @cython.profile(False)
+    cdef double _calc_gh(self, double (*counts)[16], double* site_pattern_probs,
+                         double nobs, double avobs, bint* counted) noexcept nogil:
         """
 
         """
+        counted[0] = True
         # AAAA
-        self.site_pattern_probs[0] = self.counts[0][0] + self.counts[5][5] + self.counts[10][10] + self.counts[15][15]
+        site_pattern_probs[0] = counts[0][0] + counts[5][5] + counts[10][10] + counts[15][15]
         # AAAB
-        self.site_pattern_probs[1] = (self.counts[0][1] + self.counts[0][2] + self.counts[0][3] + self.counts[5][4]
-                                    + self.counts[5][6] + self.counts[5][7] + self.counts[10][8] + self.counts[10][9]
-                                    + self.counts[10][11] + self.counts[15][12] + self.counts[15][13] + self.counts[15][14])
+        site_pattern_probs[1] = (counts[0][1] + counts[0][2] + counts[0][3] + counts[5][4]
+                                    + counts[5][6] + counts[5][7] + counts[10][8] + counts[10][9]
+                                    + counts[10][11] + counts[15][12] + counts[15][13] + counts[15][14])
         # AABA
-        self.site_pattern_probs[2] = (self.counts[0][4] + self.counts[0][8] + self.counts[0][12] + self.counts[5][1]
-                                    + self.counts[5][9] + self.counts[5][13] + self.counts[10][2] + self.counts[10][6]
-                                    + self.counts[10][14] + self.counts[15][3] + self.counts[15][7] + self.counts[15][11])
+        site_pattern_probs[2] = (counts[0][4] + counts[0][8] + counts[0][12] + counts[5][1]
+                                    + counts[5][9] + counts[5][13] + counts[10][2] + counts[10][6]
+                                    + counts[10][14] + counts[15][3] + counts[15][7] + counts[15][11])
         # AABB
-        self.site_pattern_probs[3] = (self.counts[0][5] + self.counts[0][10] + self.counts[0][15] + self.counts[5][0]
-                                    + self.counts[5][10] + self.counts[5][15] + self.counts[10][0] + self.counts[10][5]
-                                    + self.counts[10][15] + self.counts[15][0] + self.counts[15][5] + self.counts[15][10])
+        site_pattern_probs[3] = (counts[0][5] + counts[0][10] + counts[0][15] + counts[5][0]
+                                    + counts[5][10] + counts[5][15] + counts[10][0] + counts[10][5]
+                                    + counts[10][15] + counts[15][0] + counts[15][5] + counts[15][10])
         # AABC
-        self.site_pattern_probs[4] = (self.counts[0][6] + self.counts[0][7] + self.counts[0][9] + self.counts[0][11]
-                                    + self.counts[0][13] + self.counts[0][14] + self.counts[5][2] + self.counts[5][3]
-                                    + self.counts[5][8] + self.counts[5][11] + self.counts[5][12] + self.counts[5][14]
-                                    + self.counts[10][1] + self.counts[10][3] + self.counts[10][4] + self.counts[10][7]
-                                    + self.counts[10][12] + self.counts[10][13] + self.counts[15][1] + self.counts[15][2]
-                                    + self.counts[15][4] + self.counts[15][6] + self.counts[15][8] + self.counts[15][9])
+        site_pattern_probs[4] = (counts[0][6] + counts[0][7] + counts[0][9] + counts[0][11]
+                                    + counts[0][13] + counts[0][14] + counts[5][2] + counts[5][3]
+                                    + counts[5][8] + counts[5][11] + counts[5][12] + counts[5][14]
+                                    + counts[10][1] + counts[10][3] + counts[10][4] + counts[10][7]
+                                    + counts[10][12] + counts[10][13] + counts[15][1] + counts[15][2]
+                                    + counts[15][4] + counts[15][6] + counts[15][8] + counts[15][9])
         # ABAA
-        self.site_pattern_probs[5] = (self.counts[1][0] + self.counts[2][0] + self.counts[3][0] + self.counts[4][5]
-                                    + self.counts[6][5] + self.counts[7][5] + self.counts[8][10] + self.counts[9][10]
-                                    + self.counts[11][10] + self.counts[12][15] + self.counts[13][15] + self.counts[14][15])
+        site_pattern_probs[5] = (counts[1][0] + counts[2][0] + counts[3][0] + counts[4][5]
+                                    + counts[6][5] + counts[7][5] + counts[8][10] + counts[9][10]
+                                    + counts[11][10] + counts[12][15] + counts[13][15] + counts[14][15])
         # ABAB
-        self.site_pattern_probs[6] = (self.counts[1][1] + self.counts[2][2] + self.counts[3][3] + self.counts[4][4]
-                                    + self.counts[6][6] + self.counts[7][7] + self.counts[8][8] + self.counts[9][9]
-                                    + self.counts[11][11] + self.counts[12][12] + self.counts[13][13] + self.counts[14][14])
+        site_pattern_probs[6] = (counts[1][1] + counts[2][2] + counts[3][3] + counts[4][4]
+                                    + counts[6][6] + counts[7][7] + counts[8][8] + counts[9][9]
+                                    + counts[11][11] + counts[12][12] + counts[13][13] + counts[14][14])
         # ABAC
-        self.site_pattern_probs[7] = (self.counts[1][2] + self.counts[1][3] + self.counts[2][1] + self.counts[2][3]
-                                    + self.counts[3][1] + self.counts[3][2] + self.counts[4][6] + self.counts[4][7]
-                                    + self.counts[6][4] + self.counts[6][7] + self.counts[7][4] + self.counts[7][6]
-                                    + self.counts[8][9] + self.counts[8][11] + self.counts[9][8] + self.counts[9][11]
-                                    + self.counts[11][8] + self.counts[11][9] + self.counts[12][13] + self.counts[12][14]
-                                    + self.counts[13][12] + self.counts[13][14] + self.counts[14][12] + self.counts[14][13])
+        site_pattern_probs[7] = (counts[1][2] + counts[1][3] + counts[2][1] + counts[2][3]
+                                    + counts[3][1] + counts[3][2] + counts[4][6] + counts[4][7]
+                                    + counts[6][4] + counts[6][7] + counts[7][4] + counts[7][6]
+                                    + counts[8][9] + counts[8][11] + counts[9][8] + counts[9][11]
+                                    + counts[11][8] + counts[11][9] + counts[12][13] + counts[12][14]
+                                    + counts[13][12] + counts[13][14] + counts[14][12] + counts[14][13])
         # ABBA
-        self.site_pattern_probs[8] = (self.counts[1][4] + self.counts[2][8] + self.counts[3][12] + self.counts[4][1]
-                                    + self.counts[6][9] + self.counts[7][13] + self.counts[8][2] + self.counts[9][6]
-                                    + self.counts[11][14] + self.counts[12][3] + self.counts[13][7] + self.counts[14][11])
+        site_pattern_probs[8] = (counts[1][4] + counts[2][8] + counts[3][12] + counts[4][1]
+                                    + counts[6][9] + counts[7][13] + counts[8][2] + counts[9][6]
+                                    + counts[11][14] + counts[12][3] + counts[13][7] + counts[14][11])
         # BAAA
-        self.site_pattern_probs[9] = (self.counts[4][0] + self.counts[8][0] + self.counts[12][0] + self.counts[1][5]
-                                    + self.counts[9][5] + self.counts[13][5] + self.counts[2][10] + self.counts[6][10]
-                                    + self.counts[14][10] + self.counts[3][15] + self.counts[7][15] + self.counts[11][15])
+        site_pattern_probs[9] = (counts[4][0] + counts[8][0] + counts[12][0] + counts[1][5]
+                                    + counts[9][5] + counts[13][5] + counts[2][10] + counts[6][10]
+                                    + counts[14][10] + counts[3][15] + counts[7][15] + counts[11][15])
         # ABBC
-        self.site_pattern_probs[10] = (self.counts[1][6] + self.counts[1][7] + self.counts[2][9] + self.counts[2][11]
-                                     + self.counts[3][13] + self.counts[3][14] + self.counts[4][2] + self.counts[4][3]
-                                     + self.counts[6][8] + self.counts[6][11] + self.counts[7][12] + self.counts[7][14]
-                                     + self.counts[8][1] + self.counts[8][3] + self.counts[9][4] + self.counts[9][7]
-                                     + self.counts[11][12] + self.counts[11][13] + self.counts[12][1] + self.counts[12][2]
-                                     + self.counts[13][4] + self.counts[13][6] + self.counts[14][8] + self.counts[14][9])
+        site_pattern_probs[10] = (counts[1][6] + counts[1][7] + counts[2][9] + counts[2][11]
+                                     + counts[3][13] + counts[3][14] + counts[4][2] + counts[4][3]
+                                     + counts[6][8] + counts[6][11] + counts[7][12] + counts[7][14]
+                                     + counts[8][1] + counts[8][3] + counts[9][4] + counts[9][7]
+                                     + counts[11][12] + counts[11][13] + counts[12][1] + counts[12][2]
+                                     + counts[13][4] + counts[13][6] + counts[14][8] + counts[14][9])
         # CABC
-        self.site_pattern_probs[11] = (self.counts[8][6] + self.counts[12][7] + self.counts[4][9] + self.counts[12][11]
-                                     + self.counts[4][13] + self.counts[8][14] + self.counts[9][2] + self.counts[13][3]
-                                     + self.counts[1][8] + self.counts[13][11] + self.counts[1][12] + self.counts[9][14]
-                                     + self.counts[6][1] + self.counts[14][3] + self.counts[2][4] + self.counts[14][7]
-                                     + self.counts[2][12] + self.counts[6][13] + self.counts[7][1] + self.counts[11][2]
-                                     + self.counts[3][4] + self.counts[11][6] + self.counts[3][8] + self.counts[7][9])
+        site_pattern_probs[11] = (counts[8][6] + counts[12][7] + counts[4][9] + counts[12][11]
+                                     + counts[4][13] + counts[8][14] + counts[9][2] + counts[13][3]
+                                     + counts[1][8] + counts[13][11] + counts[1][12] + counts[9][14]
+                                     + counts[6][1] + counts[14][3] + counts[2][4] + counts[14][7]
+                                     + counts[2][12] + counts[6][13] + counts[7][1] + counts[11][2]
+                                     + counts[3][4] + counts[11][6] + counts[3][8] + counts[7][9])
         # BACA
-        self.site_pattern_probs[12] = (self.counts[4][8] + self.counts[4][12] + self.counts[8][4] + self.counts[8][12]
-                                     + self.counts[12][4] + self.counts[12][8] + self.counts[1][9] + self.counts[1][13]
-                                     + self.counts[9][1] + self.counts[9][13] + self.counts[13][1] + self.counts[13][9]
-                                     + self.counts[2][6] + self.counts[2][14] + self.counts[6][2] + self.counts[6][14]
-                                     + self.counts[14][2] + self.counts[14][6] + self.counts[3][7] + self.counts[3][11]
-                                     + self.counts[7][3] + self.counts[7][11] + self.counts[11][3] + self.counts[11][7])
+        site_pattern_probs[12] = (counts[4][8] + counts[4][12] + counts[8][4] + counts[8][12]
+                                     + counts[12][4] + counts[12][8] + counts[1][9] + counts[1][13]
+                                     + counts[9][1] + counts[9][13] + counts[13][1] + counts[13][9]
+                                     + counts[2][6] + counts[2][14] + counts[6][2] + counts[6][14]
+                                     + counts[14][2] + counts[14][6] + counts[3][7] + counts[3][11]
+                                     + counts[7][3] + counts[7][11] + counts[11][3] + counts[11][7])
         # BCAA
-        self.site_pattern_probs[13] = (self.counts[6][0] + self.counts[7][0] + self.counts[9][0] + self.counts[11][0]
-                                     + self.counts[13][0] + self.counts[14][0] + self.counts[2][5] + self.counts[3][5]
-                                     + self.counts[8][5] + self.counts[11][5] + self.counts[12][5] + self.counts[14][5]
-                                     + self.counts[1][10] + self.counts[3][10] + self.counts[4][10] + self.counts[7][10]
-                                     + self.counts[12][10] + self.counts[13][10] + self.counts[1][15] + self.counts[2][15]
-                                     + self.counts[4][15] + self.counts[6][15] + self.counts[8][15] + self.counts[9][15])
+        site_pattern_probs[13] = (counts[6][0] + counts[7][0] + counts[9][0] + counts[11][0]
+                                     + counts[13][0] + counts[14][0] + counts[2][5] + counts[3][5]
+                                     + counts[8][5] + counts[11][5] + counts[12][5] + counts[14][5]
+                                     + counts[1][10] + counts[3][10] + counts[4][10] + counts[7][10]
+                                     + counts[12][10] + counts[13][10] + counts[1][15] + counts[2][15]
+                                     + counts[4][15] + counts[6][15] + counts[8][15] + counts[9][15])
         # ABCD
-        self.site_pattern_probs[14] = (self.counts[1][11] + self.counts[1][14] + self.counts[2][7] + self.counts[2][13]
-                                     + self.counts[3][6] + self.counts[3][9] + self.counts[4][11] + self.counts[4][14]
-                                     + self.counts[6][3] + self.counts[6][12] + self.counts[7][2] + self.counts[7][8]
-                                     + self.counts[8][7] + self.counts[8][13] + self.counts[9][3] + self.counts[9][12]
-                                     + self.counts[11][1] + self.counts[11][4] + self.counts[12][6] + self.counts[12][9]
-                                     + self.counts[13][2] + self.counts[13][8] + self.counts[14][1] + self.counts[14][4])
-
-        if (fabs((1.0 / nobs) * (self.site_pattern_probs[0] + self.site_pattern_probs[1] + self.site_pattern_probs[2] + self.site_pattern_probs[3]
-                              + self.site_pattern_probs[4]  + self.site_pattern_probs[5] + self.site_pattern_probs[6] + self.site_pattern_probs[7]
-                              + self.site_pattern_probs[8]  + self.site_pattern_probs[9] + self.site_pattern_probs[10] + self.site_pattern_probs[11]
-                              + self.site_pattern_probs[12] + self.site_pattern_probs[13] + self.site_pattern_probs[14]) - 1.0) > 0.05):
-            if not self.quiet: print("** WARNING: There was a problem counting site patterns. **")
+        site_pattern_probs[14] = (counts[1][11] + counts[1][14] + counts[2][7] + counts[2][13]
+                                     + counts[3][6] + counts[3][9] + counts[4][11] + counts[4][14]
+                                     + counts[6][3] + counts[6][12] + counts[7][2] + counts[7][8]
+                                     + counts[8][7] + counts[8][13] + counts[9][3] + counts[9][12]
+                                     + counts[11][1] + counts[11][4] + counts[12][6] + counts[12][9]
+                                     + counts[13][2] + counts[13][8] + counts[14][1] + counts[14][4])
+
+        if (fabs((1.0 / nobs) * (site_pattern_probs[0] + site_pattern_probs[1] + site_pattern_probs[2] + site_pattern_probs[3]
+                              + site_pattern_probs[4]  + site_pattern_probs[5] + site_pattern_probs[6] + site_pattern_probs[7]
+                              + site_pattern_probs[8]  + site_pattern_probs[9] + site_pattern_probs[10] + site_pattern_probs[11]
+                              + site_pattern_probs[12] + site_pattern_probs[13] + site_pattern_probs[14]) - 1.0) > 0.05):
+            counted[0] = False
             return -99999.9
 
         cdef:
-            double p9 = (self.site_pattern_probs[8] + 0.05) / nobs
-            double p7 = (self.site_pattern_probs[6] + 0.05) / nobs
-            double p4 = (self.site_pattern_probs[3] + 0.05) / nobs
+            double p9 = (site_pattern_probs[8] + 0.05) / nobs
+            double p7 = (site_pattern_probs[6] + 0.05) / nobs
+            double p4 = (site_pattern_probs[3] + 0.05) / nobs
             double obs_invp1 = avobs * (p9 - p7)
             double obs_invp2 = avobs * (p4 - p7)
         if obs_invp1 == 0:
@@ -524,7 +1449,8 @@ cdef class HydeData(object):
         else:
             return temp
 
-    cdef double _calc_p_value(self, double my_z):
+    @cython.profile(False)
+    cdef double _calc_p_value(self, double my_z) noexcept nogil:
         """
 
         """
@@ -544,47 +1470,3 @@ cdef class HydeData(object):
             double y = 1.0 - (((((a5 * t + a4) * t) + a3) * t + a2) * t + a1) * t * exp(-z * z);
 
         return 1.0 - (0.5 * (1.0 + sign * y))
-
-    cdef double _resolve_ambiguity(self, int out, int p1, int hyb, int p2):
-        """
-
-        """
-        cdef double denom = 0.0
-        cdef unsigned i, j, k, l
-        if (out >= 4 and p1 >= 4 and hyb >= 4 or
-            out >= 4 and hyb >= 4 and p2 >= 4 or
-            out >= 4 and p1 >= 4 and p2 >= 4 or
-            p1 >= 4 and hyb >= 4 and p2 >= 4):
-            return 0.0
-        elif (out == 4 or p1 == 4 or hyb ==4 or p2 == 4):
-            return 0.0
-        else:
-            denom = len(_BASE_LOOKUP[out]) * len(_BASE_LOOKUP[p1]) * len(_BASE_LOOKUP[hyb]) * len(_BASE_LOOKUP[p2])
-            for i in range(len(_BASE_LOOKUP[out])):
-                for j in range(len(_BASE_LOOKUP[p1])):
-                    for k in range(len(_BASE_LOOKUP[hyb])):
-                        for l in range(len(_BASE_LOOKUP[p2])):
-                            self.counts[_BASE_LOOKUP[out][i] * 4 + _BASE_LOOKUP[p1][j]][_BASE_LOOKUP[hyb][k] * 4 + _BASE_LOOKUP[p2][l]] += 1.0 / denom
-            return 1.0
-
-    cdef double _resolve_ambiguity_cpp(self, int out, int p1, int hyb, int p2):
-        """
-
-        """
-        cdef double denom = 0.0
-        cdef unsigned i, j, k, l
-        if (out >= 4 and p1 >= 4 and hyb >= 4 or
-            out >= 4 and hyb >= 4 and p2 >= 4 or
-            out >= 4 and p1 >= 4 and p2 >= 4 or
-            p1 >= 4 and hyb >= 4 and p2 >= 4):
-            return 0.0
-        elif (out == 4 or p1 == 4 or hyb ==4 or p2 == 4):
-            return 0.0
-        else:
-            denom = _baseLookup[out].size() * _baseLookup[p1].size() * _baseLookup[hyb].size() * _baseLookup[p2].size()
-            for i in range(_baseLookup[out].size()):
-                for j in range(_baseLookup[p1].size()):
-                    for k in range(_baseLookup[hyb].size()):
-                        for l in range(_baseLookup[p2].size()):
-                            self.counts[_baseLookup[out][i] * 4 + _baseLookup[p1][j]][_baseLookup[hyb][k] * 4 + _baseLookup[p2][l]] += (1.0 / denom)
-            return 1.0
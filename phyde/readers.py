@@ -0,0 +1,925 @@
+""" Readers for the sequence alignment formats accepted by HydeData. """
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import re
+import struct
+import threading
+from itertools import chain
+
+import numpy as np
+
+# Encoding of the bases used by HydeData.
+BASE_CODES = {
+    "A": 0,  "a": 0,
+    "G": 1,  "g": 1,
+    "C": 2,  "c": 2,
+    "T": 3,  "t": 3,
+    "U": 3,  "u": 3,
+    "M": 5,  "m": 5,
+    "R": 6,  "r": 6,
+    "W": 7,  "w": 7,
+    "S": 8,  "s": 8,
+    "Y": 9,  "y": 9,
+    "K": 10, "k": 10,
+    "B": 11, "b": 11,
+    "D": 12, "d": 12,
+    "H": 13, "h": 13,
+    "V": 14, "v": 14,
+    "N": 15, "n": 15, "?": 15,
+    "-": 4
+}
+
+# Byte-indexed version of BASE_CODES used to decode whole sequences at
+# once; characters that are not valid bases map to INVALID.
+INVALID = 255
+BASE_LUT = np.full(256, INVALID, dtype=np.uint8)
+for _base, _code in BASE_CODES.items():
+    BASE_LUT[ord(_base)] = _code
+
+# IUPAC code for each set of bases in a genotype.
+IUPAC_CODES = {
+    "A": "A", "C": "C", "G": "G", "T": "T",
+    "AC": "M", "AG": "R", "AT": "W", "CG": "S", "CT": "Y", "GT": "K",
+    "CGT": "B", "AGT": "D", "ACT": "H", "ACG": "V", "ACGT": "N"
+}
+
+# IUPAC code for each pair of alleles, indexed by their bytes; pairs with
+# a missing allele ("N") are coded as N.
+_GENOTYPE_LUT = np.full((256, 256), ord("N"), dtype=np.uint8)
+for _a in "ACGTacgt":
+    for _b in "ACGTacgt":
+        _GENOTYPE_LUT[ord(_a), ord(_b)] = ord(IUPAC_CODES["".join(sorted(set((_a + _b).upper())))])
+
+# Number of bytes read (or sequence data buffered) at a time.
+_BLOCK = 1 << 24
+# Number of bytes looked at to detect the format of a file.
+_HEAD = 4096
+_WHITESPACE = b" \t\r\n\v\f"
+_COMMENT = re.compile(rb"\[[^\]]*\]")
+# Fields after the genotype in the samples of a VCF record.
+_VCF_EXTRA = re.compile(rb":[^\t\r\n]*")
+_VCF_ALLELE = re.compile(rb"[/|]")
+
+# Magic numbers of the compressed formats that can be read directly.
+_COMPRESSED = [
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+]
+# Number of decompressed blocks that may be waiting to be parsed.
+_QUEUE = 4
+# Length of the header of the .npy files written by AlignmentMatrix, which
+# is fixed so that the shape can be rewritten in place.
+_NPY_HEADER = 128
+
+# Registered readers, in the order they are tried.
+_READERS = []
+
+
+def register_reader(reader):
+    """
+    Add a reader for a new alignment format (a subclass of
+    :class:`phyde.AlignmentReader`). Readers are tried in the reverse of
+    the order they were registered, so a new reader is checked before the
+    built-in ones. Can also be used as a class decorator.
+
+    :param reader: the reader class.
+    """
+    _READERS.insert(0, reader)
+    return reader
+
+
+def detect_format(head):
+    """
+    Find the reader for a data file from its first bytes.
+
+    :param bytes head: the start of the file.
+    :returns: the reader class.
+    """
+    for reader in _READERS:
+        if reader.detect(head):
+            return reader
+    raise ValueError("Unable to detect the format of the data file")
+
+
+def open_input(filename, mode="rb"):
+    """
+    Open a data or map file for reading. Files compressed with gzip, bzip2
+    or xz (detected from their first bytes) are decompressed in a
+    background thread, which hands blocks to the reader through a bounded
+    queue, so decompression overlaps with parsing and nothing is written
+    to disk.
+
+    :param str filename: name of the file.
+    :param str mode: "rb" for bytes or "r" for text (default="rb").
+    :returns: a file object.
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        with hd.open_input("map.txt.gz", "r") as f:
+            lines = f.read().splitlines()
+    """
+    with open(filename, "rb") as f:
+        magic = f.read(6)
+    for prefix, opener in _COMPRESSED:
+        if magic.startswith(prefix):
+            f = io.BufferedReader(_BackgroundReader(filename, opener), max(_BLOCK // 4, _HEAD))
+            break
+    else:
+        f = open(filename, "rb")
+    return io.TextIOWrapper(f) if mode == "r" else f
+
+
+def read_alignment(infile, nind=-1, nsites=-1, fmt=None, path=None, **options):
+    """
+    Read a sequence alignment into a matrix of encoded bases, with one row
+    per individual. The format of the file is detected from its first
+    bytes unless it is given. The sequences are encoded as they are read,
+    so the text of the file is never held in memory.
+
+    :param str infile: name of the data file.
+    :param int nind: number of individuals to check the file against (optional).
+    :param int nsites: number of sites to check the file against (optional).
+    :param str fmt: name of the format (e.g., "fasta"; default=detect it).
+    :param str path: write the matrix to this ``.npy`` file as it is read and return it memory-mapped (optional).
+    :param options: options for the reader (e.g., ``biallelic=True`` for VCF files).
+    :returns: the matrix of bases and the names of the individuals.
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        dna, names = hd.read_alignment("data.fasta")
+    """
+    with open_input(infile) as f:
+        if fmt is None:
+            reader = detect_format(f.peek(_HEAD)[:_HEAD])
+        else:
+            readers = {r.name: r for r in _READERS}
+            if fmt not in readers:
+                raise ValueError("Unknown data file format (" + fmt + ")")
+            reader = readers[fmt]
+        try:
+            size = os.fstat(f.fileno()).st_size
+        except OSError:
+            # the size of a compressed file says little about its contents
+            size = None
+        matrix = AlignmentMatrix(nind, nsites, size, path)
+        reader(**options).read(f, matrix)
+    if not matrix.names:
+        raise ValueError("No sequences found in the data file (" + infile + ")")
+    return matrix.finish(), matrix.names
+
+
+class AlignmentMatrix(object):
+    """
+    The matrix of encoded bases that a reader fills in. Readers add the
+    individuals with :meth:`add_row` and append their sequences with
+    :meth:`extend`, in as many pieces as they like; each piece is decoded
+    in bulk through a lookup table straight into its row. The matrix is
+    sized from the dimensions of the alignment when they are known, or
+    else from the length of the first sequence and the size of the file,
+    and shrunk in place when the file has been read. Formats with one
+    line per site instead add all of the individuals with
+    :meth:`add_individuals` and append blocks of sites with
+    :meth:`append_sites`; the matrix then grows and shrinks along the sites.
+    Given a ``path``, the matrix is kept in a memory-mapped ``.npy`` file
+    rather than in memory, so that it can be larger than the memory.
+
+    :param int nind: number of individuals (-1 if unknown).
+    :param int nsites: number of sites (-1 if unknown).
+    :param int size: size of the data file in bytes (optional).
+    :param str path: name of a file to keep the matrix in (optional).
+    """
+
+    def __init__(self, nind=-1, nsites=-1, size=None, path=None):
+        """
+        AlignmentMatrix constructor.
+        """
+        self.nind = nind
+        self.nsites = nsites
+        self.size = size
+        self.path = path
+        self.names = []
+        self.lengths = []
+        self.dna = None
+        self._given_sites = nsites != -1
+        self._first = []
+        self._columns = False
+
+    def set_dims(self, nind, nsites):
+        """
+        Set the dimensions given in the header of the data file, checking
+        them against the values given to the constructor.
+
+        :param int nind: number of individuals (-1 if not given).
+        :param int nsites: number of sites (-1 if not given).
+        """
+        if nind != -1:
+            if self.nind != -1 and self.nind != nind:
+                raise ValueError(
+                    "Number of individuals specified (%d) is not equal\n"
+                    "  to the number of individuals in the data file (%d)" % (self.nind, nind))
+            self.nind = nind
+        if nsites != -1:
+            if self.nsites != -1 and self.nsites != nsites:
+                raise ValueError(
+                    "Number of sites specified (%d) is not equal\n"
+                    "  to the number of sites in the data file (%d)" % (self.nsites, nsites))
+            self.nsites = nsites
+            self._given_sites = True
+
+    def add_row(self, name):
+        """
+        Add an individual and return its row.
+
+        :param name: name of the individual.
+        """
+        row = len(self.names)
+        if self.nind != -1 and row >= self.nind:
+            raise ValueError(
+                "Number of individuals specified (%d) is not equal\n"
+                "  to the number of individuals in the data file (>= %d)" % (self.nind, row + 1))
+        if self.dna is None:
+            if self.nsites != -1:
+                self._allocate()
+            elif row > 0:
+                # the first sequence is complete and gives the number of sites
+                self.nsites = self.lengths[0]
+                self._allocate()
+        if self.dna is not None and row == len(self.dna):
+            self._resize((2 * row, self.nsites))
+        if isinstance(name, bytes):
+            name = name.decode(errors="replace")
+        self.names.append(name)
+        self.lengths.append(0)
+        return row
+
+    def extend(self, row, bases):
+        """
+        Append bases to the sequence of an individual.
+
+        :param int row: row of the individual.
+        :param bytes bases: the bases, without any whitespace.
+        """
+        codes = np.frombuffer(bases, dtype=np.uint8)
+        start = self.lengths[row]
+        stop = start + len(codes)
+        if self.dna is None:
+            out = np.take(BASE_LUT, codes)
+            self._first.append(out)
+        else:
+            if stop > self.nsites:
+                self._site_error(row, ">= %d" % stop)
+            out = self.dna[row, start:stop]
+            np.take(BASE_LUT, codes, out=out)
+        if len(out) and out.max() == INVALID:
+            site = np.argmax(out == INVALID)
+            raise ValueError(
+                "Invalid character '%s' at site %d of individual %s"
+                % (chr(bases[site]), start + site + 1, self.names[row]))
+        self.lengths[row] = stop
+
+    def add_individuals(self, names, nsites):
+        """
+        Add every individual at once, with room for a number of sites, for
+        formats with one line per site.
+
+        :param list names: names of the individuals.
+        :param int nsites: number of sites to make room for (more are added as needed).
+        """
+        for name in names:
+            self.names.append(name.decode(errors="replace") if isinstance(name, bytes) else name)
+            self.lengths.append(0)
+        if self.nsites != -1:
+            nsites = self.nsites
+        self._new((len(self.names), max(nsites, 1)))
+        self._columns = True
+
+    def append_sites(self, chars):
+        """
+        Append a block of sites for every individual at once.
+
+        :param chars: the bases as bytes (a uint8 array), with one row per individual and one column per site.
+        """
+        start = self.lengths[0]
+        stop = start + chars.shape[1]
+        if stop > self.dna.shape[1]:
+            if self._given_sites:
+                self._site_error(0, ">= %d" % stop)
+            self._grow_sites(max(2 * self.dna.shape[1], stop))
+        out = self.dna[:, start:stop]
+        np.take(BASE_LUT, chars, out=out)
+        if out.size and out.max() == INVALID:
+            row, site = np.argwhere(out == INVALID)[0]
+            raise ValueError(
+                "Invalid character '%s' at site %d of individual %s"
+                % (chr(chars[row, site]), start + site + 1, self.names[row]))
+        self.lengths = [stop] * len(self.names)
+
+    def finish(self):
+        """
+        Check that the alignment is complete and return the matrix.
+        """
+        if self._columns and self.nsites == -1:
+            self.nsites = self.lengths[0]
+        if self.dna is None:
+            if self.nsites == -1:
+                self.nsites = self.lengths[0] if self.lengths else 0
+            self._allocate()
+        if self.nsites == 0:
+            raise ValueError("No sites found in the data file")
+        n = len(self.names)
+        if self.nind != -1 and n != self.nind:
+            raise ValueError(
+                "Number of individuals specified (%d) is not equal\n"
+                "  to the number of individuals in the data file (%d)" % (self.nind, n))
+        for row, length in enumerate(self.lengths):
+            if length != self.nsites:
+                self._site_error(row, length)
+        if len(self.dna) != n:
+            # give back the unused rows without copying the matrix
+            self._resize((n, self.nsites))
+        if self.dna.shape[1] != self.nsites:
+            self._move_rows(self.nsites, self.nsites)
+        if self.path is not None:
+            self.dna.flush()
+        return self.dna
+
+    def _grow_sites(self, nsites):
+        # Make room for more sites in every row, in place.
+        self._move_rows(nsites, self.lengths[0])
+
+    def _move_rows(self, width, used):
+        # Change the number of columns of the matrix without a second copy
+        # of it: the rows are moved within the buffer, which is enlarged
+        # before moving them back or shrunk after moving them forward.
+        n, old = self.dna.shape
+        if width > old:
+            self._resize((n, width))
+            rows = range(n - 1, 0, -1)
+        else:
+            rows = range(1, n)
+        flat = self.dna.reshape(-1)
+        for i in rows:
+            flat[i * width:i * width + used] = flat[i * old:i * old + used]
+        del flat
+        if width < old:
+            self._resize((n, width))
+
+    def _new(self, shape):
+        # Allocate the matrix, in memory or in a file that is only as large
+        # on disk as the part that has been written.
+        if self.path is None:
+            self.dna = np.zeros(shape, dtype=np.uint8)
+            return
+        with open(self.path, "wb") as f:
+            f.write(_npy_header(shape))
+            f.truncate(_NPY_HEADER + shape[0] * shape[1])
+        self.dna = np.memmap(self.path, dtype=np.uint8, mode="r+", offset=_NPY_HEADER, shape=shape)
+
+    def _resize(self, shape):
+        # Resize the buffer of the matrix in place, keeping its contents in
+        # the same (flat) order.
+        if self.path is None:
+            self.dna.resize(shape, refcheck=False)
+            return
+        self.dna.flush()
+        self.dna = None
+        with open(self.path, "r+b") as f:
+            f.write(_npy_header(shape))
+            f.truncate(_NPY_HEADER + shape[0] * shape[1])
+        self.dna = np.memmap(self.path, dtype=np.uint8, mode="r+", offset=_NPY_HEADER, shape=shape)
+
+    def _allocate(self):
+        # Rows that are never filled are never touched, so an upper bound on
+        # the number of individuals costs no memory.
+        if self.nind != -1:
+            rows = self.nind
+        elif self.size:
+            # every sequence takes up at least nsites + 1 bytes
+            rows = self.size // (self.nsites + 1) + 1
+        else:
+            rows = 64
+        self._new((max(rows, len(self.names), 1), self.nsites))
+        if self._first:
+            first = np.concatenate(self._first)
+            if len(first) > self.nsites:
+                self._site_error(0, len(first))
+            self.dna[0, :len(first)] = first
+            self._first = []
+
+    def _site_error(self, row, length):
+        if self._given_sites:
+            raise ValueError(
+                "Number of sites specified (%d) is not equal\n"
+                "  to the number of sites in the data file (%s)" % (self.nsites, length))
+        raise ValueError(
+            "Number of sites for individual %s (%s) is not equal\n"
+            "  to the number of sites for individual %s (%d)"
+            % (self.names[row], length, self.names[0], self.nsites))
+
+
+class _BackgroundReader(io.RawIOBase):
+    # Raw stream of the contents of a compressed file. A thread reads and
+    # decompresses blocks ahead of the reader, stopping when the queue is
+    # full; the decompressors release the GIL, so the two run in parallel.
+
+    def __init__(self, filename, opener):
+        self.filename = filename
+        self._queue = queue.Queue(_QUEUE)
+        self._block = memoryview(b"")
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(opener,), daemon=True)
+        self._thread.start()
+
+    def _run(self, opener):
+        # The last item queued is always either an empty block (the end of
+        # the file) or the error that stopped the thread, so the reader
+        # never waits for a block that will not come.
+        end = b""
+        try:
+            with opener(self.filename, "rb") as f:
+                while not self._stop.is_set():
+                    block = f.read(_BLOCK)
+                    if not block:
+                        break
+                    self._put(block)
+        except Exception as e:
+            end = e
+        finally:
+            self._put(end)
+
+    def _put(self, item):
+        # Wait for room in the queue, unless the file has been closed.
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # Fill the whole buffer unless the end of the file is reached, so
+        # that peeking at the start of the file sees enough of it.
+        n = 0
+        while n < len(b):
+            if not self._block:
+                if self._eof:
+                    break
+                item = self._queue.get()
+                if isinstance(item, Exception):
+                    self._eof = True
+                    raise ValueError("Unable to decompress " + self.filename + " (" + str(item) + ")")
+                if not item:
+                    self._eof = True
+                    break
+                self._block = memoryview(item)
+            k = min(len(b) - n, len(self._block))
+            b[n:n + k] = self._block[:k]
+            self._block = self._block[k:]
+            n += k
+        return n
+
+    def close(self):
+        self._stop.set()
+        super().close()
+
+
+class _RowBuffer(object):
+    # Pieces of sequence waiting to be added to their rows. Short pieces
+    # (e.g., the lines of an interleaved file) are joined so that each
+    # row is extended once per block.
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.pieces = {}
+        self.size = 0
+
+    def add(self, row, bases):
+        self.pieces.setdefault(row, []).append(bases)
+        self.size += len(bases)
+        if self.size >= _BLOCK:
+            self.flush()
+
+    def flush(self):
+        for row, pieces in self.pieces.items():
+            self.matrix.extend(row, b"".join(pieces))
+        self.pieces = {}
+        self.size = 0
+
+
+class AlignmentReader(object):
+    """
+    Base class for the alignment readers. A reader detects its format
+    from the first bytes of a file and streams the sequences into an
+    :class:`phyde.AlignmentMatrix`. New formats can be added by
+    subclassing it and registering the subclass with
+    :func:`phyde.register_reader`.
+    """
+
+    # name of the format
+    name = None
+
+    def __init__(self, **options):
+        """
+        AlignmentReader constructor. Readers ignore options that do not
+        apply to their format.
+        """
+        self.options = options
+
+    @classmethod
+    def detect(cls, head):
+        """
+        Check whether a file is in this format.
+
+        :param bytes head: the start of the file.
+        :rtype: bool
+        """
+        return False
+
+    def read(self, f, matrix):
+        """
+        Read the sequences from a file into a matrix.
+
+        :param f: the file, opened in binary mode.
+        :param matrix: the :class:`phyde.AlignmentMatrix` to fill in.
+        """
+        raise NotImplementedError
+
+
+@register_reader
+class PhylipReader(AlignmentReader):
+    """
+    Reads alignments with one line per individual (a name followed by its
+    sequence), with or without a PHYLIP header, and PHYLIP files whose
+    sequences are split over several lines. In sequential files each
+    sequence is complete before the name of the next individual; in
+    interleaved files the names appear only in the first block of lines and
+    each following block continues the sequences in the same order. This is
+    the default when no other format is detected.
+    """
+
+    name = "phylip"
+
+    @classmethod
+    def detect(cls, head):
+        return True
+
+    def read(self, f, matrix):
+        line = f.readline()
+        # Read the header line of PHYLIP files
+        header = line.split()
+        nind = -1
+        if header and header[0].isdigit():
+            if len(header) > 1 and header[1].isdigit():
+                nind = int(header[0])
+                matrix.set_dims(nind, int(header[1]))
+            line = f.readline()
+        while line and not line.strip():
+            line = f.readline()
+        if not line:
+            return
+        name, bases = _split_name(line)
+        if nind != -1 and len(bases) < matrix.nsites:
+            # Interleaved files start with a block of one line per
+            # individual, each with a name and the same number of bases.
+            # In sequential files the lines after the first one continue
+            # the first sequence instead.
+            lines = [line]
+            while len(lines) < nind:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    lines.append(line)
+            widths = set(len(_split_name(line)[1]) for line in lines)
+            if len(lines) == nind and widths == {len(bases)} and bases:
+                self._read_interleaved(chain(lines, f), matrix, nind)
+            else:
+                self._read_sequential(chain(lines, f), matrix)
+            return
+        matrix.extend(matrix.add_row(name), bases)
+        for line in f:
+            if line.strip():
+                name, bases = _split_name(line)
+                matrix.extend(matrix.add_row(name), bases)
+
+    def _read_sequential(self, lines, matrix):
+        buf = _RowBuffer(matrix)
+        row = -1
+        length = matrix.nsites
+        for line in lines:
+            if not line.strip():
+                continue
+            if length >= matrix.nsites:
+                name, bases = _split_name(line)
+                row = matrix.add_row(name)
+                length = 0
+            else:
+                bases = line.translate(None, _WHITESPACE)
+            buf.add(row, bases)
+            length += len(bases)
+        buf.flush()
+
+    def _read_interleaved(self, lines, matrix, nind):
+        buf = _RowBuffer(matrix)
+        k = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            if k < nind:
+                name, bases = _split_name(line)
+                buf.add(matrix.add_row(name), bases)
+            else:
+                buf.add(k % nind, line.translate(None, _WHITESPACE))
+            k += 1
+        buf.flush()
+
+
+@register_reader
+class FastaReader(AlignmentReader):
+    """
+    Reads FASTA files, where each sequence may be split over any number
+    of lines. The file is scanned in large blocks rather than line by line.
+    """
+
+    name = "fasta"
+
+    @classmethod
+    def detect(cls, head):
+        return head.lstrip()[:1] == b">"
+
+    def read(self, f, matrix):
+        row = -1
+        name = None  # header line being read, if any
+        bol = True  # at the beginning of a line
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            pos = 0
+            while pos < len(block):
+                if name is not None:
+                    end = block.find(b"\n", pos)
+                    if end == -1:
+                        name += block[pos:]
+                        break
+                    name += block[pos:end]
+                    row = matrix.add_row((name.split() or [b""])[0])
+                    name = None
+                    pos = end + 1
+                    bol = True
+                elif bol and block[pos] == ord(">"):
+                    name = b""
+                    pos += 1
+                else:
+                    end = block.find(b"\n>", pos)
+                    stop = len(block) if end == -1 else end + 1
+                    bases = block[pos:stop].translate(None, _WHITESPACE)
+                    if bases:
+                        if row == -1:
+                            raise ValueError("Sequence data found before the first FASTA header")
+                        matrix.extend(row, bases)
+                    bol = block[stop - 1] == ord("\n")
+                    pos = stop
+        if name is not None:
+            matrix.add_row((name.split() or [b""])[0])
+
+
+@register_reader
+class NexusReader(AlignmentReader):
+    """
+    Reads the DATA (or CHARACTERS) block of NEXUS files, in either the
+    sequential or interleaved layout. Comments in square brackets are
+    ignored; names may be quoted.
+    """
+
+    name = "nexus"
+
+    @classmethod
+    def detect(cls, head):
+        return head.lstrip()[:6].upper() == b"#NEXUS"
+
+    def read(self, f, matrix):
+        ntax = nchar = -1
+        interleave = False
+        pending = b""
+        for line in f:
+            pending += _COMMENT.sub(b"", line)
+            while True:
+                text = pending.lstrip()
+                if text[:6].upper() == b"MATRIX" and text[6:7].isspace():
+                    matrix.set_dims(ntax, nchar)
+                    self._read_matrix(chain(text[6:].splitlines(True), f), matrix, interleave)
+                    return
+                command, sep, pending = pending.partition(b";")
+                if not sep:
+                    pending = command
+                    break
+                words = command.upper().replace(b"=", b" = ").split()
+                if words[:1] == [b"DIMENSIONS"]:
+                    ntax = _option(words, b"NTAX", ntax)
+                    nchar = _option(words, b"NCHAR", nchar)
+                elif words[:1] == [b"FORMAT"] and b"INTERLEAVE" in words:
+                    interleave = _option(words, b"INTERLEAVE", b"YES") != b"NO"
+        raise ValueError("No MATRIX command found in the NEXUS file")
+
+    def _read_matrix(self, lines, matrix, interleave):
+        buf = _RowBuffer(matrix)
+        rows = {}
+        row = -1
+        filled = 0
+        for line in lines:
+            if b"[" in line:
+                line = _COMMENT.sub(b"", line)
+            end = line.find(b";")
+            if end != -1:
+                line = line[:end]
+            if line.strip():
+                if interleave:
+                    name, bases = _split_name(line)
+                    if name not in rows:
+                        rows[name] = matrix.add_row(name)
+                    row = rows[name]
+                elif row == -1 or filled >= matrix.nsites:
+                    name, bases = _split_name(line)
+                    row = matrix.add_row(name)
+                    filled = 0
+                else:
+                    bases = line.translate(None, _WHITESPACE)
+                filled += len(bases)
+                buf.add(row, bases)
+            if end != -1:
+                break
+        buf.flush()
+
+
+@register_reader
+class VcfReader(AlignmentReader):
+    """
+    Reads the genotypes of the samples in a VCF file, one site per SNP.
+    Each genotype is coded as its base when it is homozygous and as the
+    IUPAC ambiguity code of its alleles when it is heterozygous; missing
+    calls are coded as N. Records that are not SNPs (e.g., indels) are
+    skipped, as are SNPs with more than one alternate allele when the
+    ``biallelic`` option is set; records with more than ten alleles are
+    rejected. The records are read in blocks, and the genotypes of each
+    block are decoded with array operations.
+    """
+
+    name = "vcf"
+
+    @classmethod
+    def detect(cls, head):
+        return head.startswith(b"##fileformat=VCF")
+
+    def read(self, f, matrix):
+        biallelic = self.options.get("biallelic", False)
+        for line in f:
+            if line.startswith(b"#CHROM"):
+                break
+            if not line.startswith(b"##"):
+                raise ValueError("No #CHROM header line found in the VCF file")
+        else:
+            raise ValueError("No #CHROM header line found in the VCF file")
+        samples = line.split()[9:]
+        if not samples:
+            return
+        nsites = 1 << 16
+        if matrix.size:
+            # every record takes up at least two bytes per sample
+            nsites = matrix.size // (2 * len(samples) + 18) + 1
+        matrix.add_individuals(samples, nsites)
+        while True:
+            lines = f.readlines(_BLOCK)
+            if not lines:
+                break
+            chars = self._genotypes(lines, len(samples), biallelic)
+            if len(chars):
+                matrix.append_sites(chars.T)
+
+    def _genotypes(self, lines, n, biallelic):
+        # Code the genotypes of a block of records, with one row per site.
+        alleles, calls, sites = [], [], []
+        for line in lines:
+            fields = line.split(b"\t", 9)
+            if len(fields) < 10:
+                if line.strip():
+                    raise ValueError("Record with no genotypes in the VCF file (" +
+                                     line[:50].decode(errors="replace").strip() + ")")
+                continue
+            ref, alt = fields[3], fields[4]
+            alts = alt.split(b",") if alt != b"." else []
+            if len(ref) != 1 or any(len(a) != 1 for a in alts) or \
+                    (ref + b"".join(alts)).upper().strip(b"ACGTN"):
+                continue
+            if biallelic and len(alts) != 1:
+                continue
+            if len(alts) > 9:
+                # more alleles than any SNP can have, and than the table of
+                # alleles below has room for
+                raise ValueError("Too many alleles at site " +
+                                 (fields[0] + b":" + fields[1]).decode(errors="replace"))
+            gt = fields[9].rstrip(b"\r\n")
+            if fields[8] != b"GT":
+                gt = _VCF_EXTRA.sub(b"", gt) if fields[8].startswith(b"GT") else b""
+            alleles.append((ref + b"".join(alts)).ljust(10, b"\0"))
+            calls.append(gt)
+            sites.append(fields[0] + b":" + fields[1])
+        chars = np.empty((len(calls), n), dtype=np.uint8)
+        # Diploid calls with single-digit alleles (e.g., "0/1") take up four
+        # bytes per sample, including the tab after them, and are decoded
+        # together. Records that do not fit this layout are decoded one by one.
+        fast = [i for i, gt in enumerate(calls) if len(gt) == 4 * n - 1]
+        if fast:
+            gts = np.frombuffer(b"\t".join([calls[i] for i in fast]) + b"\t",
+                                dtype=np.uint8).reshape(len(fast), n, 4)
+            table = np.frombuffer(b"".join([alleles[i] for i in fast]), dtype=np.uint8)
+            table = np.append(table.reshape(len(fast), 10),
+                              np.full((len(fast), 1), ord("N"), dtype=np.uint8), axis=1)
+            rows = np.arange(len(fast))[:, None]
+            first = _allele_index(gts[:, :, 0])
+            second = _allele_index(gts[:, :, 2])
+            ok = ((gts[:, :, 1] == ord("/")) | (gts[:, :, 1] == ord("|"))).all(axis=1)
+            ok &= (gts[:, :, 3] == ord("\t")).all(axis=1)
+            ok &= (first >= 0).all(axis=1) & (second >= 0).all(axis=1)
+            ok &= (table[rows, first] != 0).all(axis=1) & (table[rows, second] != 0).all(axis=1)
+            chars[fast] = _GENOTYPE_LUT[table[rows, first], table[rows, second]]
+            slow = [i for i, good in zip(fast, ok) if not good]
+            slow += [i for i, gt in enumerate(calls) if len(gt) != 4 * n - 1]
+        else:
+            slow = range(len(calls))
+        for i in slow:
+            chars[i] = self._call_genotypes(calls[i], alleles[i].rstrip(b"\0"), n, sites[i])
+        return chars
+
+    def _call_genotypes(self, gt, alleles, n, site):
+        # Code the genotypes of one record (e.g., haploid or polyploid calls).
+        if not gt:
+            return np.full(n, ord("N"), dtype=np.uint8)
+        calls = gt.split(b"\t")
+        if len(calls) != n:
+            raise ValueError("Wrong number of genotypes at site " + site.decode(errors="replace"))
+        chars = np.empty(n, dtype=np.uint8)
+        for j, call in enumerate(calls):
+            idx = _VCF_ALLELE.split(call)
+            if b"." in idx or b"" in idx:
+                chars[j] = ord("N")
+                continue
+            if not all(i.isdigit() and int(i) < len(alleles) for i in idx):
+                raise ValueError("Invalid genotype '" + call.decode(errors="replace") +
+                                 "' at site " + site.decode(errors="replace"))
+            bases = "".join(sorted(set(chr(alleles[int(i)]).upper() for i in idx)))
+            chars[j] = ord(IUPAC_CODES.get(bases, "N"))
+        return chars
+
+
+def _allele_index(codes):
+    # Column of each allele in the table of a record's alleles: 0-9 for the
+    # digits, 10 for a missing allele (".") and -1 for anything else.
+    index = codes.astype(np.intp) - ord("0")
+    index[codes == ord(".")] = 10
+    index[(index < 0) | (index > 10)] = -1
+    return index
+
+
+def _npy_header(shape):
+    # Header of a .npy file holding a C-ordered uint8 matrix, padded to
+    # _NPY_HEADER bytes.
+    text = "{'descr': '|u1', 'fortran_order': False, 'shape': (%d, %d), }" % tuple(shape)
+    return (b"\x93NUMPY\x01\x00" + struct.pack("<H", _NPY_HEADER - 10) +
+            text.ljust(_NPY_HEADER - 11).encode() + b"\n")
+
+
+def _split_name(line):
+    # Split a line into the name of an individual (which may be quoted) and
+    # its bases, with any whitespace removed.
+    line = line.strip()
+    if line[:1] in (b"'", b'"'):
+        end = line.find(line[:1], 1)
+        if end != -1:
+            return line[1:end], line[end + 1:].translate(None, _WHITESPACE)
+    fields = line.split(None, 1)
+    if len(fields) == 1:
+        return fields[0], b""
+    return fields[0], fields[1].translate(None, _WHITESPACE)
+
+
+def _option(words, key, default):
+    # Value of "KEY = VALUE" in the words of a NEXUS command.
+    for i in range(len(words) - 2):
+        if words[i] == key and words[i + 1] == b"=":
+            value = words[i + 2]
+            return int(value) if value.isdigit() else value
+    return default
@@ -1,16 +1,152 @@
-""" Class for processing HyDe output. """
+""" Classes for storing and processing HyDe output. """
+
+import warnings
+from collections.abc import Mapping
 
 import numpy as np
 
+from phyde.batch import PATTERNS
+from phyde.binary import TripleIndex, is_binary, load_columns, save_columns
+
+# Values reported for each hypothesis test, in the order of the output files.
+STATS = ["Zscore", "Pvalue", "Gamma"] + PATTERNS
+
+# Header line of hyde-out.txt, hyde-ind.txt and each block of hyde-boot.txt.
+RESULT_HEADER = "P1\tHybrid\tP2\t" + "\t".join(STATS) + "\n"
+
+
+class ResultTable:
+    """
+    A compact container for the results of many hypothesis tests, stored as
+    columns: one array of names for each of P1, Hybrid and P2, and one
+    array of floats for each of the values in a result dictionary (see
+    :meth:`phyde.HydeData.test_triple`). Tables can be indexed with a
+    column name, a row number, a slice, or an array of row numbers or
+    booleans, and are written to file as a single block.
+
+    :param p1: names of parent one.
+    :param hyb: names of the putative hybrids.
+    :param p2: names of parent two.
+    :param dict stats: arrays of values keyed by ``"Zscore"``, ``"Pvalue"``, ``"Gamma"`` and the site pattern names.
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup", 100, 6, 10000)
+        for table in data.test_tables(data.triple_space()):
+            sig = table[table["Pvalue"] < 0.05]
+            sig.write(outfile)
+    """
+
+    def __init__(self, p1, hyb, p2, stats):
+        """
+        ResultTable constructor.
+        """
+        self.p1 = np.asarray(p1, dtype=str)
+        self.hyb = np.asarray(hyb, dtype=str)
+        self.p2 = np.asarray(p2, dtype=str)
+        self.stats = {k: np.asarray(stats[k], dtype=np.double) for k in STATS}
+        for col in [self.hyb, self.p2] + list(self.stats.values()):
+            if col.shape != self.p1.shape:
+                raise ValueError("** Columns of a ResultTable must have the same length. **")
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Build a table from ``(triple, result)`` pairs, such as those
+        yielded by :meth:`phyde.HydeData.test_triples`.
+
+        :param results: iterable of ``(triple, result)`` pairs.
+        :rtype: ResultTable
+        """
+        results = list(results)
+        triples = [t for t, _ in results]
+        return cls([t[0] for t in triples], [t[1] for t in triples], [t[2] for t in triples],
+                   {k: [r[k] for _, r in results] for k in STATS})
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Join several tables into one.
+
+        :param tables: iterable of ResultTable objects.
+        :rtype: ResultTable
+        """
+        tables = list(tables)
+        if not tables:
+            return cls.from_results([])
+        return cls(np.concatenate([t.p1 for t in tables]),
+                   np.concatenate([t.hyb for t in tables]),
+                   np.concatenate([t.p2 for t in tables]),
+                   {k: np.concatenate([t.stats[k] for t in tables]) for k in STATS})
+
+    def __len__(self):
+        return self.p1.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key == "P1":
+                return self.p1
+            elif key == "Hybrid":
+                return self.hyb
+            elif key == "P2":
+                return self.p2
+            return self.stats[key]
+        if isinstance(key, (int, np.integer)):
+            return ((str(self.p1[key]), str(self.hyb[key]), str(self.p2[key])),
+                    {k: float(v[key]) for k, v in self.stats.items()})
+        return ResultTable(self.p1[key], self.hyb[key], self.p2[key],
+                           {k: v[key] for k, v in self.stats.items()})
+
+    def __iter__(self):
+        triples = zip(self.p1.tolist(), self.hyb.tolist(), self.p2.tolist())
+        values = zip(*[v.tolist() for v in self.stats.values()])
+        for t, v in zip(triples, values):
+            yield t, dict(zip(STATS, v))
+
+    @property
+    def triples(self):
+        """
+        The list of triples ``(p1, hyb, p2)`` in the table.
+        """
+        return list(zip(self.p1.tolist(), self.hyb.tolist(), self.p2.tolist()))
+
+    def format(self):
+        """
+        Format the rows of the table with the same tab-separated layout as
+        the rows of ``hyde-out.txt`` (without the header).
+
+        :rtype: str
+        """
+        if len(self) == 0:
+            return ""
+        cols = [self.p1.tolist(), self.hyb.tolist(), self.p2.tolist()]
+        cols += [list(map(repr, v.tolist())) for v in self.stats.values()]
+        return "\n".join(map("\t".join, zip(*cols))) + "\n"
+
+    def write(self, outfile):
+        """
+        Write the rows of the table to an open file in a single call (see
+        :meth:`format`).
+
+        :param outfile: a file object opened for writing.
+        """
+        outfile.write(self.format())
+
 
 class HydeResult:
     """
     A class for reading in and working with results from a HyDe analysis.
-    It is mostly a simple container for storing triples as tuples and using
-    them as keys in a dictionary with values that are also dictionaries
-    containing the results from the HyDe analysis.
+    The results are stored as a :class:`ResultTable`, with an index from
+    each triple to its row so that the results for any triple can be looked
+    up directly. ``res`` gives the results for a triple as a dictionary.
+    Results can be read from the text output of HyDe or from the binary
+    format written by :meth:`save`, which is memory-mapped by default.
 
     :param str infile: name of results file.
+    :param bool mmap: memory-map a binary results file (default=True).
 
     Example:
 
@@ -20,14 +156,19 @@ class HydeResult:
         res = hd.HydeResult("hyde-out.txt")
     """
 
-    def __init__(self, infile):
+    def __init__(self, infile, mmap=True):
         """
         HydeResult constructor.
         """
         self.infile = infile
-        self.res = {}
+        self.table = None
+        self.index = {}
         self.triples = []
-        self._read_hyde_results(infile)
+        self.res = _ResultRows(self)
+        if is_binary(infile):
+            self._read_binary(infile, mmap)
+        else:
+            self._read_hyde_results(infile)
 
     def __call__(self, attr, p1, hyb, p2):
         """
@@ -47,57 +188,77 @@ class HydeResult:
             res = hd.HydeResult("hyde-out.txt")
             res("Zscore", "sp1", "sp2", "sp3")
         """
-        return self.res[(p1, hyb, p2)][attr]
+        return float(self.table.stats[attr][self.index[(p1, hyb, p2)]])
 
     def _read_hyde_results(self, file):
-        # Fxn for reading in results file from a hyde_cpp analysis.
-        with open(file) as f:
-            results_read_in = f.read()
-            if results_read_in[-1] == "\n":
-                results = results_read_in[:-1].splitlines()[1:]
-            else:
-                results = results_read_in.splitlines()[1:]
-            for r in results:
-                rs = r.split("\t")
-                tripl = (rs[0], rs[1], rs[2])
-                if tripl not in self.triples:
-                    self.triples.append(tripl)
-                    self.res[tripl] = self._hyde_info(rs[3:])
+        # Fxn for reading in results file from a hyde_cpp analysis. The
+        # columns are parsed in bulk by NumPy instead of one row at a time.
+        ncols = 3 + len(STATS)
+        with warnings.catch_warnings():
+            # a file with no results is not an error
+            warnings.simplefilter("ignore", UserWarning)
+            names = np.loadtxt(file, dtype=str, delimiter="\t", comments=None,
+                               skiprows=1, usecols=range(3), ndmin=2)
+            values = np.loadtxt(file, dtype=np.double, delimiter="\t", comments=None,
+                                skiprows=1, usecols=range(3, ncols), ndmin=2)
+        if values.shape[1] != len(STATS):
+            raise ValueError(
+                "** Warning: length of hyde entry is incorrect. **"
+            )
+        table = ResultTable(names[:, 0], names[:, 1], names[:, 2],
+                            dict(zip(STATS, np.ascontiguousarray(values.T))))
+        triples = list(zip(*[names[:, k].tolist() for k in range(3)]))
+        self.index = dict(zip(triples, range(len(triples))))
+        if len(self.index) != len(triples):
+            # keep the first result for each triple that was tested more than once
+            self.index = {}
+            rows = []
+            for i, tripl in enumerate(triples):
+                if tripl not in self.index:
+                    self.index[tripl] = len(rows)
+                    rows.append(i)
                 else:
                     print("\nERROR:")
                     print(
                         "  The triple ", tripl, " was tested more than once.\n"
                     )
+            table = table[np.array(rows, dtype=np.intp)]
+        self.table = table
+        self.triples = list(self.index)
 
-    def _hyde_info(self, b):
-        # Store information for HyDe hypothesis test.
-        if len(b) != 18:
+    def _read_binary(self, file, mmap):
+        # Fxn for reading in results saved in the binary format.
+        cols = load_columns(file, mmap)
+        if str(cols["kind"]) != "results" or cols["stats"].tolist() != STATS:
             raise ValueError(
-                "** Warning: length of hyde entry is incorrect. **"
+                "** Warning: " + file + " is not a binary HyDe results file. **"
             )
-        else:
-            pass
-        hyde_info = {
-            "Zscore": float(b[0]),
-            "Pvalue": float(b[1]),
-            "Gamma": float(b[2]),
-            "AAAA": float(b[3]),
-            "AAAB": float(b[4]),
-            "AABA": float(b[5]),
-            "AABB": float(b[6]),
-            "AABC": float(b[7]),
-            "ABAA": float(b[8]),
-            "ABAB": float(b[9]),
-            "ABAC": float(b[10]),
-            "ABBA": float(b[11]),
-            "BAAA": float(b[12]),
-            "ABBC": float(b[13]),
-            "CABC": float(b[14]),
-            "BACA": float(b[15]),
-            "BCAA": float(b[16]),
-            "ABCD": float(b[17]),
-        }
-        return hyde_info
+        self.table = ResultTable(cols["p1"], cols["hyb"], cols["p2"],
+                                 dict(zip(STATS, cols["values"])))
+        self.index = TripleIndex(cols["p1"], cols["hyb"], cols["p2"],
+                                 cols["keys"], cols["order"])
+        self.triples = list(self.index)
+
+    def save(self, outfile):
+        """
+        Save the results in the binary format, which can be read back
+        with :class:`phyde.HydeResult` much faster than the text output.
+
+        :param str outfile: name of the output file (e.g., "hyde-out.npz").
+        """
+        t = self.table
+        save_columns(outfile, "results", t.p1, t.hyb, t.p2,
+                     [t.stats[k] for k in STATS], stats=np.array(STATS))
+
+    def write(self, outfile):
+        """
+        Write the results as text, in the same layout as ``hyde-out.txt``.
+
+        :param str outfile: name of the output file.
+        """
+        with open(outfile, "w") as f:
+            f.write(RESULT_HEADER)
+            self.table.write(f)
 
     def abba_baba(self, p1, hyb, p2):
         """
@@ -115,10 +276,44 @@ class HydeResult:
             res = hd.HydeResult("hyde-out.txt")
             res.abba_baba("sp1", "sp2", "sp3")
         """
-        return (
-            np.array(self.res[(p1, hyb, p2)]["ABBA"])
-            - np.array(self.res[(p1, hyb, p2)]["ABAB"])
-        ) / (
-            np.array(self.res[(p1, hyb, p2)]["ABBA"])
-            + np.array(self.res[(p1, hyb, p2)]["ABAB"])
-        )
+        i = self.index[(p1, hyb, p2)]
+        abba = self.table.stats["ABBA"][i]
+        abab = self.table.stats["ABAB"][i]
+        return (abba - abab) / (abba + abab)
+
+    def d_statistics(self):
+        """
+        Calculate Patterson's D-Statistic for every triple at once.
+
+        Returns an array with one value for each triple in ``triples``.
+
+        Example:
+
+        .. code:: py
+
+            import phyde as hd
+            res = hd.HydeResult("hyde-out.txt")
+            d = res.d_statistics()
+            res.triples[d.argmax()]
+        """
+        abba = self.table.stats["ABBA"]
+        abab = self.table.stats["ABAB"]
+        with np.errstate(all="ignore"):
+            return (abba - abab) / (abba + abab)
+
+
+class _ResultRows(Mapping):
+    # Read-only view of a HydeResult as a dictionary of result dictionaries
+    # keyed by triple. Each dictionary is built only when it is looked up.
+
+    def __init__(self, result):
+        self._result = result
+
+    def __getitem__(self, triple):
+        return self._result.table[self._result.index[triple]][1]
+
+    def __iter__(self):
+        return iter(self._result.index)
+
+    def __len__(self):
+        return len(self._result.index)
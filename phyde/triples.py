@@ -0,0 +1,183 @@
+""" Classes and functions for enumerating the triples tested in a HyDe analysis. """
+
+from collections.abc import Sequence
+from math import comb
+
+
+class TripleSpace(Sequence):
+    """
+    A lazy, indexable sequence of all triples ``(p1, hyb, p2)`` that can be
+    formed from a list of taxa. Every combination of three taxa gives three
+    triples (one for each choice of hybrid), in the same order as
+    :meth:`phyde.HydeData.list_triples`. Triples are computed on demand,
+    so the full list never has to be held in memory, and any triple can be
+    looked up directly by its index. This makes it easy to split an
+    analysis into ranges of triples or to restart it part way through.
+
+    :param list taxa: names of the taxa (not including the outgroup).
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        data = hd.HydeData("infile.txt", "mapfile.txt", "outgroup", 100, 6, 10000)
+        triples = data.triple_space()
+        len(triples)
+        triples[10]
+        for t in triples.iter_range(100, 200):
+            data.test_triple(*t)
+    """
+
+    def __init__(self, taxa):
+        """
+        TripleSpace constructor.
+        """
+        self.taxa = list(taxa)
+        self.ntaxa = len(self.taxa)
+        self._index = {t: i for i, t in enumerate(self.taxa)}
+        self._ncombs = comb(self.ntaxa, 3)
+
+    def __len__(self):
+        return 3 * self._ncombs
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if step == 1:
+                return list(self.iter_range(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError("triple index out of range")
+        i, j, l = self._unrank(k // 3)
+        return self._orient(i, j, l, k % 3)
+
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+
+    def __contains__(self, triple):
+        try:
+            self.index(triple)
+        except ValueError:
+            return False
+        return True
+
+    def index(self, triple):
+        """
+        Get the position of a triple in the sequence.
+
+        :param tuple triple: a 3-tuple ``(p1, hyb, p2)``.
+        :rtype: int
+        """
+        try:
+            x, y, z = [self._index[t] for t in triple]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(str(triple) + " is not in the triple space")
+        i, j, l = sorted((x, y, z))
+        if i == j or j == l:
+            raise ValueError(str(triple) + " is not in the triple space")
+        orientations = [(i, j, l), (i, l, j), (j, i, l)]
+        if (x, y, z) not in orientations:
+            raise ValueError(str(triple) + " is not in the triple space")
+        n = self.ntaxa
+        m = n - 1 - i
+        rank = (self._ncombs - comb(n - i, 3)
+                + comb(m, 2) - comb(m - (j - i - 1), 2)
+                + (l - j - 1))
+        return 3 * rank + orientations.index((x, y, z))
+
+    def iter_range(self, start, stop):
+        """
+        Iterate over the triples with indices in ``[start, stop)``.
+
+        :param int start: index of the first triple.
+        :param int stop: index one past the last triple.
+        """
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+        n = self.ntaxa
+        k = start
+        i, j, l = self._unrank(k // 3)
+        o = k % 3
+        while i < n - 2:
+            while j < n - 1:
+                while l < n:
+                    while o < 3:
+                        if k >= stop:
+                            return
+                        yield self._orient(i, j, l, o)
+                        k += 1
+                        o += 1
+                    o = 0
+                    l += 1
+                j += 1
+                l = j + 1
+            i += 1
+            j = i + 1
+            l = j + 1
+
+    def _orient(self, i, j, l, o):
+        # The three triples for the combination of taxa i < j < l
+        t = self.taxa
+        if o == 0:
+            return (t[i], t[j], t[l])
+        elif o == 1:
+            return (t[i], t[l], t[j])
+        else:
+            return (t[j], t[i], t[l])
+
+    def _unrank(self, c):
+        # Find the c-th combination i < j < l in lexicographic order. There
+        # are C(n, 3) - C(n - i, 3) combinations whose first element is less
+        # than i, and likewise for the pairs that follow it, so each element
+        # can be found with a binary search.
+        n = self.ntaxa
+        lo, hi = 0, n - 3
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._ncombs - comb(n - mid, 3) <= c:
+                lo = mid
+            else:
+                hi = mid - 1
+        i = lo
+        c -= self._ncombs - comb(n - i, 3)
+        m = n - 1 - i
+        npairs = comb(m, 2)
+        lo, hi = 0, m - 2
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if npairs - comb(m - mid, 2) <= c:
+                lo = mid
+            else:
+                hi = mid - 1
+        c -= npairs - comb(m - lo, 2)
+        j = i + 1 + lo
+        return i, j, j + 1 + c
+
+
+def group_trios(triples):
+    """
+    Group an iterable of triples so that each run of three consecutive
+    triples that are the three hypotheses for one trio of taxa,
+    ``(a, b, c)``, ``(a, c, b)`` and ``(b, a, c)``, is yielded as a list
+    together. All other triples are yielded as lists of length one.
+
+    :param triples: iterable of 3-tuples ``(p1, hyb, p2)``.
+    """
+    buf = []
+    for t in triples:
+        buf.append(tuple(t))
+        if len(buf) < 3:
+            continue
+        a, b, c = buf[0]
+        if len(set(buf[0])) == 3 and buf[1] == (a, c, b) and buf[2] == (b, a, c):
+            yield buf
+            buf = []
+        else:
+            yield [buf.pop(0)]
+    for t in buf:
+        yield [t]
@@ -1,6 +1,9 @@
 """Utilities for running HyDe analyses"""
 
 import os
+import time
+from collections import deque
+from itertools import islice
 
 
 def expand_prefix(prefix):
@@ -20,3 +23,92 @@ def expand_prefix(prefix):
         return dirname + prefix[1:]
     else:
         return prefix
+
+
+def _run_chunk(func, chunk):
+    return [func(x) for x in chunk]
+
+
+def imap_ordered(pool, func, iterable, window, chunksize=1):
+    """
+    Lazily apply func to each item in iterable using a pool of processes
+    or threads and yield the results in input order as soon as they are
+    available.
+
+    Unlike pool.map(), items are submitted in chunks of size chunksize
+    with at most window chunks in flight at a time, so memory use does
+    not grow with the number of items. A window of a few chunks per worker
+    (e.g., four) keeps every worker busy.
+    """
+    items = iter(iterable)
+    pending = deque()
+    while True:
+        while len(pending) < window:
+            chunk = list(islice(items, chunksize))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_run_chunk, (func, chunk)))
+        if not pending:
+            return
+        for res in pending.popleft().get():
+            yield res
+
+
+def resume_results(filename, header):
+    """
+    Prepare a results file that was partially written by an earlier,
+    interrupted run so that new rows can be appended to it. Any incomplete
+    last line is removed, and the header is written if the file is empty
+    or the run was stopped while writing it. Raises a ValueError if the
+    file does not start with the header, so that other files (e.g., with
+    different columns) are never overwritten.
+
+    Returns the list of complete rows already in the file (excluding the
+    header).
+    """
+    rows = []
+    end = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                rest = line
+                break
+            rows.append(line.decode(errors="replace"))
+            end += len(line)
+        else:
+            rest = b""
+    if not rows and header.encode().startswith(rest):
+        with open(filename, "w") as f:
+            f.write(header)
+        return []
+    if not rows or rows[0] != header:
+        raise ValueError(
+            filename + " is not a resumable HyDe results file (it does not start with the "
+            "expected header)"
+        )
+    os.truncate(filename, end)
+    return rows[1:]
+
+
+class Checkpoint(object):
+    """
+    Flush and fsync a set of output files at most every interval seconds
+    so that an interrupted run loses little of the output it has written.
+
+    Call the object after writing each result, and sync() before exiting.
+    """
+
+    def __init__(self, files, interval=5.0):
+        self.files = files
+        self.interval = interval
+        self.last = time.monotonic()
+
+    def __call__(self):
+        if time.monotonic() - self.last >= self.interval:
+            self.sync()
+
+    def sync(self):
+        for f in self.files:
+            f.flush()
+            os.fsync(f.fileno())
+        self.last = time.monotonic()
@@ -0,0 +1,139 @@
+""" Functions and classes for writing HyDe results to file. """
+
+import queue
+import threading
+
+from phyde.result import RESULT_HEADER, STATS, ResultTable
+
+
+def individual_table(triple, res):
+    """
+    Arrange the results from :meth:`phyde.HydeData.test_individuals` as
+    the rows of ``hyde-ind.txt``: one row per individual, with the name of
+    the individual in the Hybrid column.
+
+    :param tuple triple: the triple ``(p1, hyb, p2)`` that was tested.
+    :param dict res: results keyed by individual.
+    :rtype: ResultTable
+    """
+    inds = list(res)
+    return ResultTable([triple[0]] * len(inds), inds, [triple[2]] * len(inds),
+                       {k: [res[i][k] for i in inds] for k in STATS})
+
+
+def bootstrap_table(triple, boot):
+    """
+    Arrange the results from :meth:`phyde.HydeData.bootstrap_triple` as
+    the rows of one block of ``hyde-boot.txt``: one row per replicate.
+
+    :param tuple triple: the triple ``(p1, hyb, p2)`` that was tested.
+    :param dict boot: results keyed by replicate.
+    :rtype: ResultTable
+    """
+    reps = list(boot.values())
+    return ResultTable([triple[0]] * len(reps), [triple[1]] * len(reps),
+                       [triple[2]] * len(reps), {k: [r[k] for r in reps] for k in STATS})
+
+
+class ResultWriter(object):
+    """
+    Format results and write them to a file on a background thread, so
+    that writing overlaps with running the hypothesis tests. Formatted
+    rows are collected in memory and written to the file in large chunks.
+    Because it has ``flush()`` and ``fileno()`` methods, a ResultWriter can
+    be passed to :class:`phyde.Checkpoint` in place of the file.
+
+    :param outfile: a file object opened for writing.
+    :param int chunk: number of characters to collect before each write (default=1MB).
+    :param int pending: number of blocks that can wait to be written before :meth:`write` blocks (default=64).
+
+    Example:
+
+    .. code:: py
+
+        import phyde as hd
+        with open("hyde-out.txt", "w") as f, hd.ResultWriter(f) as out:
+            out.write(hd.RESULT_HEADER)
+            for table in data.test_tables(data.triple_space()):
+                out.write(table)
+    """
+
+    def __init__(self, outfile, chunk=1 << 20, pending=64):
+        self.outfile = outfile
+        self.chunk = chunk
+        self._queue = queue.Queue(pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, block):
+        """
+        Queue a block of results to be written.
+
+        :param block: a ResultTable, or a string that is written as is.
+        """
+        self._check()
+        self._queue.put(block)
+
+    def flush(self):
+        """
+        Wait until everything queued so far has been written, then flush
+        the file.
+        """
+        if not self._thread.is_alive():
+            self.outfile.flush()
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._check()
+
+    def fileno(self):
+        return self.outfile.fileno()
+
+    def close(self):
+        """
+        Write everything that is still queued and stop the background
+        thread. The file itself is left open.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._check()
+
+    def _check(self):
+        # Raise an error from the background thread in the caller. Nothing
+        # more is written once an error has occurred.
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        buf, size = [], 0
+        while True:
+            block = self._queue.get()
+            try:
+                if block is None or isinstance(block, threading.Event):
+                    if buf:
+                        self.outfile.write("".join(buf))
+                        buf, size = [], 0
+                    self.outfile.flush()
+                elif self._error is None:
+                    text = block if isinstance(block, str) else block.format()
+                    buf.append(text)
+                    size += len(text)
+                    if size >= self.chunk:
+                        self.outfile.write("".join(buf))
+                        buf, size = [], 0
+            except Exception as e:
+                self._error = e
+                buf, size = [], 0
+            if block is None:
+                return
+            if isinstance(block, threading.Event):
+                block.set()
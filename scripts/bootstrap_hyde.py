@@ -20,12 +20,20 @@ For more details on script arguments, type: bootstrap_hyde.py -h
     - outgroup       <string> : name of the outgroup.
     - triples        <string> : name of the file containing triples for testing.
     - reps              <int> : number of bootstrap replicates (default=100).
-    - nind              <int> : number of sampled individuals.
-    - nsites            <int> : number of sampled sites.
-    - ntaxa             <int> : number of sampled taxa/populations.
+    - nind              <int> : number of sampled individuals [optional; read from the data file].
+    - nsites            <int> : number of sampled sites [optional; read from the data file].
+    - ntaxa             <int> : number of sampled taxa/populations [optional; read from the map file].
     - prefix         <string> : name added to the beginning of output file.
     - quiet            <flag> : suppress printing to stdout.
     - ignore_amb_sites <flag> : ignore missing/ambiguous bases.
+    - compress_sites   <flag> : count each unique site pattern once.
+    - biallelic        <flag> : keep only biallelic SNPs when reading a VCF file.
+    - cache            <flag> : reuse a binary copy of the data saved by an earlier run.
+    - block_sites       <int> : count site patterns out of core, this many sites at a time. [default=0, in memory]
+    - cache_dir      <string> : directory for the binary copy of the data [optional; default=next to the data file].
+    - site_threads      <int> : number of threads used to count site patterns for each triple. [default=1]
+    - binary           <flag> : also save the output in binary format ('hyde-boot.npz'),
+                                converted from the text output at the end of the run.
 
 Output
 ------
@@ -72,49 +80,6 @@ def parse_triples(triples_file):
     return triples
 
 
-def write_boot(boot, triple, outfile):
-    """
-    Write the current dictionary of bootstrapping output from bootstrap_triple()
-    to the file passed as an argument to the function.
-    """
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC"
-        "\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outfile,
-    )
-    for v in boot.values():
-        print(
-            triple[0],
-            "\t",
-            triple[1],
-            "\t",
-            triple[2],
-            "\t",
-            sep="",
-            end="",
-            file=outfile,
-        )
-        print(v["Zscore"], "\t", sep="", end="", file=outfile)
-        print(v["Pvalue"], "\t", sep="", end="", file=outfile)
-        print(v["Gamma"], "\t", sep="", end="", file=outfile)
-        print(v["AAAA"], "\t", sep="", end="", file=outfile)
-        print(v["AAAB"], "\t", sep="", end="", file=outfile)
-        print(v["AABA"], "\t", sep="", end="", file=outfile)
-        print(v["AABB"], "\t", sep="", end="", file=outfile)
-        print(v["AABC"], "\t", sep="", end="", file=outfile)
-        print(v["ABAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABAB"], "\t", sep="", end="", file=outfile)
-        print(v["ABAC"], "\t", sep="", end="", file=outfile)
-        print(v["ABBA"], "\t", sep="", end="", file=outfile)
-        print(v["BAAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABBC"], "\t", sep="", end="", file=outfile)
-        print(v["CABC"], "\t", sep="", end="", file=outfile)
-        print(v["BACA"], "\t", sep="", end="", file=outfile)
-        print(v["BCAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABCD"], "\n", sep="", end="", file=outfile)
-
-
 if __name__ == "__main__":
     """
     Runs the script.
@@ -165,35 +130,35 @@ if __name__ == "__main__":
         metavar="\b",
         help="table of triples to be analyzed.",
     )
-    required.add_argument(
+
+    additional = parser.add_argument_group("additional arguments")
+    additional.add_argument(
         "-n",
         "--num_ind",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of individuals in data matrix",
+        help="number of individuals in data matrix [default: read from the data file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-t",
         "--num_taxa",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of taxa (species, OTUs)",
+        help="number of taxa (species, OTUs) [default: read from the map file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-s",
         "--num_sites",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of sites in the data matrix",
+        help="number of sites in the data matrix [default: read from the data file]",
     )
-
-    additional = parser.add_argument_group("additional arguments")
     additional.add_argument(
         "-r",
         "--reps",
@@ -219,6 +184,50 @@ if __name__ == "__main__":
         action="store_true",
         help="ignore missing/ambiguous sites",
     )
+    additional.add_argument(
+        "--compress_sites",
+        action="store_true",
+        help="count each unique site pattern once",
+    )
+    additional.add_argument(
+        "--biallelic",
+        action="store_true",
+        help="keep only biallelic SNPs when reading a VCF file",
+    )
+    additional.add_argument(
+        "--cache",
+        action="store_true",
+        help="save/reuse a binary copy of the data (see --cache_dir)",
+    )
+    additional.add_argument(
+        "--block_sites",
+        action="store",
+        type=int,
+        default=0,
+        metavar="\b",
+        help="count site patterns out of core, this many sites at a time [default=0, in memory]",
+    )
+    additional.add_argument(
+        "--cache_dir",
+        action="store",
+        type=str,
+        default="none",
+        metavar="\b",
+        help="directory for the binary copy of the data [default=next to the data file]",
+    )
+    additional.add_argument(
+        "--site_threads",
+        action="store",
+        type=int,
+        default=1,
+        metavar="\b",
+        help="number of threads used to count site patterns for each triple [default=1]",
+    )
+    additional.add_argument(
+        "--binary",
+        action="store_true",
+        help="also save the output in binary format (<prefix>-boot.npz)",
+    )
 
     args = parser.parse_args()
     infile = args.infile
@@ -232,12 +241,28 @@ if __name__ == "__main__":
     prefix = args.prefix
     quiet = args.quiet
     ignore_amb_sites = args.ignore_amb_sites
+    compress_sites = args.compress_sites
+    cache = args.cache
+    site_threads = args.site_threads
 
     if not quiet:
         print("\nRunning bootstrap_hyde.py")
     # Read data into a HydeData object
     data = hd.HydeData(
-        infile, mapfile, outgroup, nind, ntaxa, nsites, quiet, ignore_amb_sites
+        infile,
+        mapfile,
+        outgroup,
+        nind,
+        ntaxa,
+        nsites,
+        quiet,
+        ignore_amb_sites,
+        compress_sites,
+        cache,
+        site_threads,
+        biallelic=args.biallelic,
+        block_sites=args.block_sites,
+        cache_dir=None if args.cache_dir == "none" else args.cache_dir,
     )
 
     if not quiet:
@@ -265,10 +290,17 @@ if __name__ == "__main__":
     else:
         outfile = open(outpath + "-boot.txt", "a")
 
+    writer = hd.ResultWriter(outfile)
     counter = 0
     for t in triples:
         res = data.bootstrap_triple(t[0], t[1], t[2], reps)
-        write_boot(res, t, outfile)
+        writer.write(hd.RESULT_HEADER)
+        writer.write(hd.bootstrap_table(t, res))
         counter += 1
         if counter != len(triples):
-            print("####\n", end="", file=outfile)
+            writer.write("####\n")
+    writer.close()
+
+    if args.binary:
+        outfile.close()
+        hd.Bootstrap(outpath + "-boot.txt").save(outpath + "-boot.npz")
@@ -20,13 +20,21 @@ For more details on script arguments, type: bootstrap_hyde_mp.py -h
     - outgroup       <string> : name of the outgroup.
     - triples        <string> : name of the file containing triples for testing.
     - reps              <int> : number of bootstrap replicates [default=100].
-    - nind              <int> : number of sampled individuals.
-    - nsites            <int> : number of sampled sites.
-    - ntaxa             <int> : number of sampled taxa/populations.
+    - nind              <int> : number of sampled individuals [optional; read from the data file].
+    - nsites            <int> : number of sampled sites [optional; read from the data file].
+    - ntaxa             <int> : number of sampled taxa/populations [optional; read from the map file].
     - threads           <int> : number of threads [default=all available]
+    - chunksize         <int> : number of triples sent to a thread at a time [default=16]
     - prefix         <string> : name added to the beginning of output file.
     - quiet            <flag> : suppress printing to stdout.
     - ignore_amb_sites <flag> : ignore missing/ambiguous bases.
+    - compress_sites   <flag> : count each unique site pattern once.
+    - biallelic        <flag> : keep only biallelic SNPs when reading a VCF file.
+    - cache            <flag> : reuse a binary copy of the data saved by an earlier run.
+    - block_sites       <int> : count site patterns out of core, this many sites at a time. [default=0, in memory]
+    - cache_dir      <string> : directory for the binary copy of the data [optional; default=next to the data file].
+    - binary           <flag> : also save the output in binary format ('hyde-boot.npz'),
+                                converted from the text output at the end of the run.
 
 Output
 ------
@@ -73,49 +81,6 @@ def parse_triples(triples_file):
     return triples
 
 
-def write_boot(boot, triple, outfile):
-    """
-    Write the current dictionary of bootstrapping output from bootstrap_triple()
-    to the file passed as an argument to the function.
-    """
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC"
-        "\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outfile,
-    )
-    for _, v in boot.items():
-        print(
-            triple[0],
-            "\t",
-            triple[1],
-            "\t",
-            triple[2],
-            "\t",
-            sep="",
-            end="",
-            file=outfile,
-        )
-        print(v["Zscore"], "\t", sep="", end="", file=outfile)
-        print(v["Pvalue"], "\t", sep="", end="", file=outfile)
-        print(v["Gamma"], "\t", sep="", end="", file=outfile)
-        print(v["AAAA"], "\t", sep="", end="", file=outfile)
-        print(v["AAAB"], "\t", sep="", end="", file=outfile)
-        print(v["AABA"], "\t", sep="", end="", file=outfile)
-        print(v["AABB"], "\t", sep="", end="", file=outfile)
-        print(v["AABC"], "\t", sep="", end="", file=outfile)
-        print(v["ABAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABAB"], "\t", sep="", end="", file=outfile)
-        print(v["ABAC"], "\t", sep="", end="", file=outfile)
-        print(v["ABBA"], "\t", sep="", end="", file=outfile)
-        print(v["BAAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABBC"], "\t", sep="", end="", file=outfile)
-        print(v["CABC"], "\t", sep="", end="", file=outfile)
-        print(v["BACA"], "\t", sep="", end="", file=outfile)
-        print(v["BCAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABCD"], "\n", sep="", end="", file=outfile)
-
-
 if __name__ == "__main__":
     """
     Runs the script.
@@ -166,35 +131,35 @@ if __name__ == "__main__":
         metavar="\b",
         help="table of triples to be analyzed.",
     )
-    required.add_argument(
+
+    additional = parser.add_argument_group("additional arguments")
+    additional.add_argument(
         "-n",
         "--num_ind",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of individuals in data matrix",
+        help="number of individuals in data matrix [default: read from the data file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-t",
         "--num_taxa",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of taxa (species, OTUs)",
+        help="number of taxa (species, OTUs) [default: read from the map file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-s",
         "--num_sites",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of sites in the data matrix",
+        help="number of sites in the data matrix [default: read from the data file]",
     )
-
-    additional = parser.add_argument_group("additional arguments")
     additional.add_argument(
         "-r",
         "--reps",
@@ -213,6 +178,14 @@ if __name__ == "__main__":
         metavar="\b",
         help="number of threads [default=all available]",
     )
+    additional.add_argument(
+        "--chunksize",
+        action="store",
+        type=int,
+        default=16,
+        metavar="\b",
+        help="number of triples sent to a thread at a time [default=16]",
+    )
     additional.add_argument(
         "--prefix",
         action="store",
@@ -229,6 +202,42 @@ if __name__ == "__main__":
         action="store_true",
         help="ignore missing/ambiguous bases.",
     )
+    additional.add_argument(
+        "--compress_sites",
+        action="store_true",
+        help="count each unique site pattern once",
+    )
+    additional.add_argument(
+        "--biallelic",
+        action="store_true",
+        help="keep only biallelic SNPs when reading a VCF file",
+    )
+    additional.add_argument(
+        "--cache",
+        action="store_true",
+        help="save/reuse a binary copy of the data (see --cache_dir)",
+    )
+    additional.add_argument(
+        "--block_sites",
+        action="store",
+        type=int,
+        default=0,
+        metavar="\b",
+        help="count site patterns out of core, this many sites at a time [default=0, in memory]",
+    )
+    additional.add_argument(
+        "--cache_dir",
+        action="store",
+        type=str,
+        default="none",
+        metavar="\b",
+        help="directory for the binary copy of the data [default=next to the data file]",
+    )
+    additional.add_argument(
+        "--binary",
+        action="store_true",
+        help="also save the output in binary format (<prefix>-boot.npz)",
+    )
 
     args = parser.parse_args()
     infile = args.infile
@@ -242,14 +251,29 @@ if __name__ == "__main__":
     prefix = args.prefix
     quiet = args.quiet
     ignore_amb_sites = args.ignore_amb_sites
+    compress_sites = args.compress_sites
+    cache = args.cache
     threads = args.threads
+    chunksize = args.chunksize
 
     if not quiet:
         print("\nRunning bootstrap_hyde_mp.py")
 
     # Read data into a HydeData object
     data = hd.HydeData(
-        infile, mapfile, outgroup, nind, ntaxa, nsites, quiet, ignore_amb_sites
+        infile,
+        mapfile,
+        outgroup,
+        nind,
+        ntaxa,
+        nsites,
+        quiet,
+        ignore_amb_sites,
+        compress_sites,
+        cache,
+        biallelic=args.biallelic,
+        block_sites=args.block_sites,
+        cache_dir=None if args.cache_dir == "none" else args.cache_dir,
     )
 
     if not quiet:
@@ -289,21 +313,40 @@ if __name__ == "__main__":
         )}
         return res
 
+    def init_worker(desc):
+        """
+        Attach a worker process to the shared copy of the data.
+        """
+        global data
+        data = hd.HydeData.from_shared(desc)
+
     def mp_run():
         """
-        Run tests on multiple threads.
+        Run tests on multiple threads, yielding the results in
+        order as they finish.
         """
-        p = mp.Pool(threads)
-        res = p.map(wrap_test, triples)
-        return res
+        desc = data.to_shared()
+        try:
+            with mp.Pool(threads, initializer=init_worker, initargs=(desc,)) as p:
+                for res in hd.imap_ordered(p, wrap_test, triples, 4 * threads, chunksize):
+                    yield res
+        finally:
+            data.close_shared()
 
     # run the bootsrap replicates
     out = mp_run()
+    writer = hd.ResultWriter(outfile)
     counter = 0
     for o in out:
         key = list(o.keys())[0]
         value = list(o.values())[0]
-        write_boot(value, key, outfile)
+        writer.write(hd.RESULT_HEADER)
+        writer.write(hd.bootstrap_table(key, value))
         counter += 1
         if counter != len(triples):
-            print("####\n", end="", file=outfile)
+            writer.write("####\n")
+    writer.close()
+
+    if args.binary:
+        outfile.close()
+        hd.Bootstrap(outpath + "-boot.txt").save(outpath + "-boot.npz")
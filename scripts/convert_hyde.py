@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# convert_hyde.py
+
+"""
+<< convert_hyde.py >>
+
+Convert HyDe output between the text layout ('hyde-out.txt', 'hyde-ind.txt',
+'hyde-boot.txt') and the binary format read by the phyde module.
+
+Arguments
+---------
+
+For more details on script arguments, type: convert_hyde.py -h
+
+    - infile         <string> : name of the HyDe output file to convert.
+    - outfile        <string> : name of the converted output file.
+    - boot             <flag> : the input file has bootstrap replicates.
+
+Output
+------
+
+    Writes the binary format ('.npz') if the input file is text, and the
+    text layout if the input file is binary.
+"""
+
+import phyde as hd
+import argparse
+import sys
+
+
+if __name__ == "__main__":
+    """
+    Runs the script.
+    """
+    # print docstring if only the name of the script is given
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(
+        description="Options for convert_hyde.py", add_help=True
+    )
+
+    required = parser.add_argument_group("required arguments")
+    required.add_argument(
+        "-i",
+        "--infile",
+        action="store",
+        type=str,
+        required=True,
+        metavar="\b",
+        help="name of the HyDe output file to convert",
+    )
+    required.add_argument(
+        "-o",
+        "--outfile",
+        action="store",
+        type=str,
+        required=True,
+        metavar="\b",
+        help="name of the converted output file",
+    )
+
+    additional = parser.add_argument_group("additional arguments")
+    additional.add_argument(
+        "--boot",
+        action="store_true",
+        help="the input file has bootstrap replicates (from bootstrap_hyde.py)",
+    )
+
+    args = parser.parse_args()
+
+    if args.boot:
+        res = hd.Bootstrap(args.infile, mmap=False)
+    else:
+        res = hd.HydeResult(args.infile, mmap=False)
+
+    if hd.is_binary(args.infile):
+        res.write(args.outfile)
+    else:
+        res.save(args.outfile)
@@ -57,120 +57,6 @@ def parse_triples(triples_file):
     return triples
 
 
-def write_out(out, triple, outfile):
-    """
-    Take the output from test_triple() and write it to file.
-    """
-    print(
-        triple[0],
-        "\t",
-        triple[1],
-        "\t",
-        triple[2],
-        "\t",
-        sep="",
-        end="",
-        file=outfile,
-    )
-    print(out["Zscore"], "\t", sep="", end="", file=outfile)
-    print(out["Pvalue"], "\t", sep="", end="", file=outfile)
-    print(out["Gamma"], "\t", sep="", end="", file=outfile)
-    print(out["AAAA"], "\t", sep="", end="", file=outfile)
-    print(out["AAAB"], "\t", sep="", end="", file=outfile)
-    print(out["AABA"], "\t", sep="", end="", file=outfile)
-    print(out["AABB"], "\t", sep="", end="", file=outfile)
-    print(out["AABC"], "\t", sep="", end="", file=outfile)
-    print(out["ABAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABAB"], "\t", sep="", end="", file=outfile)
-    print(out["ABAC"], "\t", sep="", end="", file=outfile)
-    print(out["ABBA"], "\t", sep="", end="", file=outfile)
-    print(out["BAAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABBC"], "\t", sep="", end="", file=outfile)
-    print(out["CABC"], "\t", sep="", end="", file=outfile)
-    print(out["BACA"], "\t", sep="", end="", file=outfile)
-    print(out["BCAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABCD"], "\n", sep="", end="", file=outfile)
-
-
-def write_ind(out, triple, outfile):
-    """
-    Write the current output dictionary from test_individuals()
-    to the file passed as an argument to the function.
-    """
-    for k, v in out.items():
-        print(
-            triple[0],
-            "\t",
-            k,
-            "\t",
-            triple[2],
-            "\t",
-            sep="",
-            end="",
-            file=outfile,
-        )
-        print(v["Zscore"], "\t", sep="", end="", file=outfile)
-        print(v["Pvalue"], "\t", sep="", end="", file=outfile)
-        print(v["Gamma"], "\t", sep="", end="", file=outfile)
-        print(v["AAAA"], "\t", sep="", end="", file=outfile)
-        print(v["AAAB"], "\t", sep="", end="", file=outfile)
-        print(v["AABA"], "\t", sep="", end="", file=outfile)
-        print(v["AABB"], "\t", sep="", end="", file=outfile)
-        print(v["AABC"], "\t", sep="", end="", file=outfile)
-        print(v["ABAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABAB"], "\t", sep="", end="", file=outfile)
-        print(v["ABAC"], "\t", sep="", end="", file=outfile)
-        print(v["ABBA"], "\t", sep="", end="", file=outfile)
-        print(v["BAAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABBC"], "\t", sep="", end="", file=outfile)
-        print(v["CABC"], "\t", sep="", end="", file=outfile)
-        print(v["BACA"], "\t", sep="", end="", file=outfile)
-        print(v["BCAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABCD"], "\n", sep="", end="", file=outfile)
-
-
-def write_boot(boot, triple, outfile):
-    """
-    Write the current dictionary of bootstrapping output from bootstrap_triple()
-    to the file passed as an argument to the function.
-    """
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outfile,
-    )
-    for _, v in boot.items():
-        print(
-            triple[0],
-            "\t",
-            triple[1],
-            "\t",
-            triple[2],
-            "\t",
-            sep="",
-            end="",
-            file=outfile,
-        )
-        print(v["Zscore"], "\t", sep="", end="", file=outfile)
-        print(v["Pvalue"], "\t", sep="", end="", file=outfile)
-        print(v["Gamma"], "\t", sep="", end="", file=outfile)
-        print(v["AAAA"], "\t", sep="", end="", file=outfile)
-        print(v["AAAB"], "\t", sep="", end="", file=outfile)
-        print(v["AABA"], "\t", sep="", end="", file=outfile)
-        print(v["AABB"], "\t", sep="", end="", file=outfile)
-        print(v["AABC"], "\t", sep="", end="", file=outfile)
-        print(v["ABAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABAB"], "\t", sep="", end="", file=outfile)
-        print(v["ABAC"], "\t", sep="", end="", file=outfile)
-        print(v["ABBA"], "\t", sep="", end="", file=outfile)
-        print(v["BAAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABBC"], "\t", sep="", end="", file=outfile)
-        print(v["CABC"], "\t", sep="", end="", file=outfile)
-        print(v["BACA"], "\t", sep="", end="", file=outfile)
-        print(v["BCAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABCD"], "\n", sep="", end="", file=outfile)
-
-
 def do_run_hyde(
     infile,
     mapfile,
@@ -208,34 +94,28 @@ def do_run_hyde(
         pass
 
     # print outfile header
-    outf = open(outfile, "a")
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outf,
-    )
+    outf = hd.ResultWriter(open(outfile, "a"))
+    outf.write(hd.RESULT_HEADER)
 
-    filtered_outfile = open("filtered-" + outfile, "a")
+    filtered_outfile = hd.ResultWriter(open("filtered-" + outfile, "a"))
     # print filtered outfile header
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=filtered_outfile,
-    )
+    filtered_outfile.write(hd.RESULT_HEADER)
 
     print("")
     bar = Bar("Progress", max=len(triples))
-    for t in triples:
-        res = data.test_triple(t[0], t[1], t[2])
-        write_out(res, t, outf)
-        if (
-            res["Pvalue"] < (pvalue / len(triples))
-            and abs(res["Zscore"]) != 99999.9
-            and res["Gamma"] > 0.0
-            and res["Gamma"] < 1.0
-        ):
-            write_out(res, t, filtered_outfile)
-        bar.next()
+    for res in data.test_tables(triples, size=64):
+        outf.write(res)
+        filtered_outfile.write(
+            res[
+                (res["Pvalue"] < (pvalue / len(triples)))
+                & (abs(res["Zscore"]) != 99999.9)
+                & (res["Gamma"] > 0.0)
+                & (res["Gamma"] < 1.0)
+            ]
+        )
+        bar.next(len(res))
+    outf.close()
+    filtered_outfile.close()
 
     print("\n\nDone!")
 
@@ -277,19 +157,16 @@ def do_ind_hyde(
         pass
 
     # print outfile header
-    outf = open(outfile, "a")
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outf,
-    )
+    outf = hd.ResultWriter(open(outfile, "a"))
+    outf.write(hd.RESULT_HEADER)
 
     print("")
     bar = Bar("Progress", max=len(triples))
     for t in triples:
         res = data.test_individuals(t[0], t[1], t[2])
-        write_ind(res, t, outf)
+        outf.write(hd.individual_table(t, res))
         bar.next()
+    outf.close()
 
     print("\n\nDone!")
 
@@ -339,23 +216,21 @@ def do_boot_hyde(
         pass
 
     # print outfile header
-    outf = open(outfile, "a")
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outf,
-    )
+    outf = hd.ResultWriter(open(outfile, "a"))
+    outf.write(hd.RESULT_HEADER)
 
     counter = 0
     print("")
     bar = Bar("Progress", max=len(triples))
     for t in triples:
         res = data.bootstrap_triple(t[0], t[1], t[2], reps)
-        write_boot(res, t, outf)
+        outf.write(hd.RESULT_HEADER)
+        outf.write(hd.bootstrap_table(t, res))
         counter += 1
         if counter != len(triples):
-            print("####\n", end="", file=outf)
+            outf.write("####\n")
         bar.next()
+    outf.close()
 
     print("\n\nDone!")
 
@@ -387,15 +262,6 @@ def check_input(
     elif outgroup == "":
         print("No outgroup specified...")
         all_good = False
-    elif nind == 0:
-        print("Number of individuals is not specified...")
-        all_good = False
-    elif ntaxa == 0:
-        print("Number of taxa is not specified...")
-        all_good = False
-    elif nsites == 0:
-        print("Number of sites is not specified...")
-        all_good = False
     else:
         pass
 
@@ -436,6 +302,11 @@ def main(
     else:
         return 0
 
+    # dimensions that are left at 0 are read from the data and map files
+    nind = nind if nind > 0 else -1
+    ntaxa = ntaxa if ntaxa > 0 else -1
+    nsites = nsites if nsites > 0 else -1
+
     if analysis == 1:
         do_run_hyde(
             infile,
@@ -579,11 +450,13 @@ if __name__ == "__main__":
     ttk.Label(mainframe, text="Input file:").grid(column=1, row=2, sticky=W)
     ttk.Label(mainframe, text="Map file:").grid(column=1, row=3, sticky=W)
     ttk.Label(mainframe, text="Outgroup:").grid(column=1, row=4, sticky=W)
-    ttk.Label(mainframe, text="Number of individuals:").grid(
+    ttk.Label(mainframe, text="Number of individuals (optional):").grid(
         column=1, row=5, sticky=W
     )
-    ttk.Label(mainframe, text="Number of taxa:").grid(column=1, row=6, sticky=W)
-    ttk.Label(mainframe, text="Number of sites:").grid(
+    ttk.Label(mainframe, text="Number of taxa (optional):").grid(
+        column=1, row=6, sticky=W
+    )
+    ttk.Label(mainframe, text="Number of sites (optional):").grid(
         column=1, row=7, sticky=W
     )
     ttk.Label(mainframe, text="Output file:").grid(column=1, row=8, sticky=W)
@@ -18,12 +18,20 @@ For more details on script arguments, type: individual_hyde.py -h
     - mapfile        <string> : name of the taxon map file.
     - outgroup       <string> : name of the outgroup.
     - triples        <string> : name of the file containing triples for testing.
-    - nind              <int> : number of sampled individuals.
-    - nsites            <int> : number of sampled sites.
-    - ntaxa             <int> : number of sampled taxa (populations, OTUs, etc.).
+    - nind              <int> : number of sampled individuals [optional; read from the data file].
+    - nsites            <int> : number of sampled sites [optional; read from the data file].
+    - ntaxa             <int> : number of sampled taxa (populations, OTUs, etc.) [optional; read from the map file].
     - prefix         <string> : name added to the beginning of output file.
     - quiet            <flag> : suppress printing to stdout.
     - ignore_amb_sites <flag> : ignore missing/ambiguous sites.
+    - compress_sites   <flag> : count each unique site pattern once.
+    - biallelic        <flag> : keep only biallelic SNPs when reading a VCF file.
+    - cache            <flag> : reuse a binary copy of the data saved by an earlier run.
+    - block_sites       <int> : count site patterns out of core, this many sites at a time. [default=0, in memory]
+    - cache_dir      <string> : directory for the binary copy of the data [optional; default=next to the data file].
+    - site_threads      <int> : number of threads used to count site patterns for each triple. [default=1]
+    - binary           <flag> : also save the output in binary format ('hyde-ind.npz'),
+                                converted from the text output at the end of the run.
 
 Output
 ------
@@ -71,43 +79,6 @@ def parse_triples(triples_file):
     return triples
 
 
-def write_ind(out, triple, outfile):
-    """
-    Write the current output dictionary from test_individuals()
-    to the file passed as an argument to the function.
-    """
-    for k, v in out.items():
-        print(
-            triple[0],
-            "\t",
-            k,
-            "\t",
-            triple[2],
-            "\t",
-            sep="",
-            end="",
-            file=outfile,
-        )
-        print(v["Zscore"], "\t", sep="", end="", file=outfile)
-        print(v["Pvalue"], "\t", sep="", end="", file=outfile)
-        print(v["Gamma"], "\t", sep="", end="", file=outfile)
-        print(v["AAAA"], "\t", sep="", end="", file=outfile)
-        print(v["AAAB"], "\t", sep="", end="", file=outfile)
-        print(v["AABA"], "\t", sep="", end="", file=outfile)
-        print(v["AABB"], "\t", sep="", end="", file=outfile)
-        print(v["AABC"], "\t", sep="", end="", file=outfile)
-        print(v["ABAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABAB"], "\t", sep="", end="", file=outfile)
-        print(v["ABAC"], "\t", sep="", end="", file=outfile)
-        print(v["ABBA"], "\t", sep="", end="", file=outfile)
-        print(v["BAAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABBC"], "\t", sep="", end="", file=outfile)
-        print(v["CABC"], "\t", sep="", end="", file=outfile)
-        print(v["BACA"], "\t", sep="", end="", file=outfile)
-        print(v["BCAA"], "\t", sep="", end="", file=outfile)
-        print(v["ABCD"], "\n", sep="", end="", file=outfile)
-
-
 if __name__ == "__main__":
     """
     Runs the scripts.
@@ -158,35 +129,35 @@ if __name__ == "__main__":
         metavar="\b",
         help="table of triples to be analyzed.",
     )
-    required.add_argument(
+
+    additional = parser.add_argument_group("additional arguments")
+    additional.add_argument(
         "-n",
         "--num_ind",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of individuals in data matrix",
+        help="number of individuals in data matrix [default: read from the data file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-t",
         "--num_taxa",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of taxa (species, OTUs)",
+        help="number of taxa (species, OTUs) [default: read from the map file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-s",
         "--num_sites",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of sites in the data matrix",
+        help="number of sites in the data matrix [default: read from the data file]",
     )
-
-    additional = parser.add_argument_group("additional arguments")
     additional.add_argument(
         "--prefix",
         action="store",
@@ -203,6 +174,50 @@ if __name__ == "__main__":
         action="store_true",
         help="ignore missing/ambiguous sites",
     )
+    additional.add_argument(
+        "--compress_sites",
+        action="store_true",
+        help="count each unique site pattern once",
+    )
+    additional.add_argument(
+        "--biallelic",
+        action="store_true",
+        help="keep only biallelic SNPs when reading a VCF file",
+    )
+    additional.add_argument(
+        "--cache",
+        action="store_true",
+        help="save/reuse a binary copy of the data (see --cache_dir)",
+    )
+    additional.add_argument(
+        "--block_sites",
+        action="store",
+        type=int,
+        default=0,
+        metavar="\b",
+        help="count site patterns out of core, this many sites at a time [default=0, in memory]",
+    )
+    additional.add_argument(
+        "--cache_dir",
+        action="store",
+        type=str,
+        default="none",
+        metavar="\b",
+        help="directory for the binary copy of the data [default=next to the data file]",
+    )
+    additional.add_argument(
+        "--site_threads",
+        action="store",
+        type=int,
+        default=1,
+        metavar="\b",
+        help="number of threads used to count site patterns for each triple [default=1]",
+    )
+    additional.add_argument(
+        "--binary",
+        action="store_true",
+        help="also save the output in binary format (<prefix>-ind.npz)",
+    )
 
     args = parser.parse_args()
     infile = args.infile
@@ -215,12 +230,28 @@ if __name__ == "__main__":
     prefix = args.prefix
     quiet = args.quiet
     ignore_amb_sites = args.ignore_amb_sites
+    compress_sites = args.compress_sites
+    cache = args.cache
+    site_threads = args.site_threads
 
     if not quiet:
         print("\nRunning individual_hyde.py")
 
     data = hd.HydeData(
-        infile, mapfile, outgroup, nind, ntaxa, nsites, quiet, ignore_amb_sites
+        infile,
+        mapfile,
+        outgroup,
+        nind,
+        ntaxa,
+        nsites,
+        quiet,
+        ignore_amb_sites,
+        compress_sites,
+        cache,
+        site_threads,
+        biallelic=args.biallelic,
+        block_sites=args.block_sites,
+        cache_dir=None if args.cache_dir == "none" else args.cache_dir,
     )
 
     # Read data into a HydeData object
@@ -242,12 +273,14 @@ if __name__ == "__main__":
     else:
         outfile = open(outpath + "-ind.txt", "a")
 
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outfile,
-    )
+    writer = hd.ResultWriter(outfile)
+    writer.write(hd.RESULT_HEADER)
 
     for t in triples:
         res = data.test_individuals(t[0], t[1], t[2])
-        write_ind(res, t, outfile)
+        writer.write(hd.individual_table(t, res))
+    writer.close()
+
+    if args.binary:
+        outfile.close()
+        hd.HydeResult(outpath + "-ind.txt").save(outpath + "-ind.npz")
@@ -20,14 +20,25 @@ For more details on script arguments, type: run_hyde_mp.py -h
     - infile         <string> : name of the DNA sequence data file.
     - mapfile        <string> : name of the taxon map file.
     - outgroup       <string> : name of the outgroup.
-    - nind              <int> : number of sampled individuals.
-    - nsites            <int> : number of sampled sites.
-    - ntaxa             <int> : number of sampled taxa/populations.
+    - nind              <int> : number of sampled individuals [optional; read from the data file].
+    - nsites            <int> : number of sampled sites [optional; read from the data file].
+    - ntaxa             <int> : number of sampled taxa/populations [optional; read from the map file].
     - threads           <int> : number of threads to use. [default=all available]
+    - chunksize         <int> : number of triples sent to a thread at a time. [default=16]
     - triples        <string> : name of the file containing triples for testing [optional].
     - prefix         <string> : name added to the beginning of output file.
     - quiet            <flag> : suppress printing to stdout.
     - ignore_amb_sites <flag> : ignore missing/ambiguous sites.
+    - compress_sites   <flag> : count each unique site pattern once.
+    - biallelic        <flag> : keep only biallelic SNPs when reading a VCF file.
+    - cache            <flag> : reuse a binary copy of the data saved by an earlier run.
+    - block_sites       <int> : count site patterns out of core, this many sites at a time. [default=0, in memory]
+    - cache_dir      <string> : directory for the binary copy of the data [optional; default=next to the data file].
+    - resume           <flag> : continue an interrupted run, skipping triples already in the output.
+    - count_cache    <string> : file for keeping count tables between runs on the same data [optional].
+    - count_cache_size  <int> : maximum size of the count table cache in MB. [default=1024]
+    - binary           <flag> : also save the output in binary format ('hyde-out.npz'),
+                                converted from the text output at the end of the run.
 
 Output
 ------
@@ -42,6 +53,7 @@ import multiprocess as mp
 import argparse
 import sys
 import os
+from itertools import islice
 
 
 def parse_triples(triples_file):
@@ -74,41 +86,6 @@ def parse_triples(triples_file):
     return triples
 
 
-def write_out(out, triple, outfile):
-    """
-    Take the output from test_triple() and write it to file.
-    """
-    print(
-        triple[0],
-        "\t",
-        triple[1],
-        "\t",
-        triple[2],
-        "\t",
-        sep="",
-        end="",
-        file=outfile,
-    )
-    print(out["Zscore"], "\t", sep="", end="", file=outfile)
-    print(out["Pvalue"], "\t", sep="", end="", file=outfile)
-    print(out["Gamma"], "\t", sep="", end="", file=outfile)
-    print(out["AAAA"], "\t", sep="", end="", file=outfile)
-    print(out["AAAB"], "\t", sep="", end="", file=outfile)
-    print(out["AABA"], "\t", sep="", end="", file=outfile)
-    print(out["AABB"], "\t", sep="", end="", file=outfile)
-    print(out["AABC"], "\t", sep="", end="", file=outfile)
-    print(out["ABAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABAB"], "\t", sep="", end="", file=outfile)
-    print(out["ABAC"], "\t", sep="", end="", file=outfile)
-    print(out["ABBA"], "\t", sep="", end="", file=outfile)
-    print(out["BAAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABBC"], "\t", sep="", end="", file=outfile)
-    print(out["CABC"], "\t", sep="", end="", file=outfile)
-    print(out["BACA"], "\t", sep="", end="", file=outfile)
-    print(out["BCAA"], "\t", sep="", end="", file=outfile)
-    print(out["ABCD"], "\n", sep="", end="", file=outfile)
-
-
 if __name__ == "__main__":
     """
     Runs the script.
@@ -150,35 +127,35 @@ if __name__ == "__main__":
         metavar="\b",
         help="name of the outgroup (only one accepted)",
     )
-    required.add_argument(
+
+    additional = parser.add_argument_group("additional arguments")
+    additional.add_argument(
         "-n",
         "--num_ind",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of individuals in data matrix",
+        help="number of individuals in data matrix [default: read from the data file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-t",
         "--num_taxa",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of taxa (species, OTUs)",
+        help="number of taxa (species, OTUs) [default: read from the map file]",
     )
-    required.add_argument(
+    additional.add_argument(
         "-s",
         "--num_sites",
         action="store",
         type=int,
-        required=True,
+        default=-1,
         metavar="\b",
-        help="number of sites in the data matrix",
+        help="number of sites in the data matrix [default: read from the data file]",
     )
-
-    additional = parser.add_argument_group("additional arguments")
     additional.add_argument(
         "-j",
         "--threads",
@@ -188,6 +165,14 @@ if __name__ == "__main__":
         metavar="\b",
         help="number of threads [default=all available]",
     )
+    additional.add_argument(
+        "--chunksize",
+        action="store",
+        type=int,
+        default=16,
+        metavar="\b",
+        help="number of triples sent to a thread at a time [default=16]",
+    )
     additional.add_argument(
         "-tr",
         "--triples",
@@ -222,6 +207,63 @@ if __name__ == "__main__":
         action="store_true",
         help="ignore missing/ambiguous sites",
     )
+    additional.add_argument(
+        "--compress_sites",
+        action="store_true",
+        help="count each unique site pattern once",
+    )
+    additional.add_argument(
+        "--biallelic",
+        action="store_true",
+        help="keep only biallelic SNPs when reading a VCF file",
+    )
+    additional.add_argument(
+        "--cache",
+        action="store_true",
+        help="save/reuse a binary copy of the data (see --cache_dir)",
+    )
+    additional.add_argument(
+        "--block_sites",
+        action="store",
+        type=int,
+        default=0,
+        metavar="\b",
+        help="count site patterns out of core, this many sites at a time [default=0, in memory]",
+    )
+    additional.add_argument(
+        "--cache_dir",
+        action="store",
+        type=str,
+        default="none",
+        metavar="\b",
+        help="directory for the binary copy of the data [default=next to the data file]",
+    )
+    additional.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip triples already written to the output file and append the rest",
+    )
+    additional.add_argument(
+        "--count_cache",
+        action="store",
+        type=str,
+        default="none",
+        metavar="\b",
+        help="file for keeping count tables between runs on the same data",
+    )
+    additional.add_argument(
+        "--count_cache_size",
+        action="store",
+        type=int,
+        default=1024,
+        metavar="\b",
+        help="maximum size of the count table cache in MB [default=1024]",
+    )
+    additional.add_argument(
+        "--binary",
+        action="store_true",
+        help="also save the output in binary format (<prefix>-out.npz)",
+    )
 
     args = parser.parse_args()
     infile = args.infile
@@ -231,22 +273,40 @@ if __name__ == "__main__":
     ntaxa = args.num_taxa
     nsites = args.num_sites
     threads = args.threads
+    chunksize = args.chunksize
     pvalue = args.pvalue
     prefix = args.prefix
     quiet = args.quiet
     ignore_amb_sites = args.ignore_amb_sites
+    compress_sites = args.compress_sites
+    cache = args.cache
 
     if not quiet:
         print("\nRunning run_hyde_mp.py")
 
     data = hd.HydeData(
-        infile, mapfile, outgroup, nind, ntaxa, nsites, quiet, ignore_amb_sites
+        infile,
+        mapfile,
+        outgroup,
+        nind,
+        ntaxa,
+        nsites,
+        quiet,
+        ignore_amb_sites,
+        compress_sites,
+        cache,
+        biallelic=args.biallelic,
+        block_sites=args.block_sites,
+        cache_dir=None if args.cache_dir == "none" else args.cache_dir,
     )
 
+    if args.count_cache != "none":
+        data.use_count_cache(args.count_cache, args.count_cache_size << 20)
+
     if args.triples != "none":
         triples = parse_triples(args.triples)
     else:
-        triples = data.list_triples()
+        triples = data.triple_space()
 
     if not quiet:
         print(
@@ -260,9 +320,48 @@ if __name__ == "__main__":
         if args.triples != "none":
             print("\nUsing triples in file ", args.triples, ".", sep="")
 
+    header = hd.RESULT_HEADER
+
+    def keep(res):
+        """
+        Check whether test results pass the filtering criteria. Works on
+        a single result or on all of the rows of a ResultTable at once.
+        """
+        return (
+            (res["Pvalue"] < (pvalue / len(triples)))
+            & (res["Gamma"] > 0.0)
+            & (res["Gamma"] < 1.0)
+        )
+
     # checking to see if output files already exist
     outpath = hd.expand_prefix(prefix)
-    if os.path.exists(outpath + "-out.txt"):
+    resume = args.resume and os.path.exists(outpath + "-out.txt")
+    if resume:
+        # pick up where an interrupted run stopped; the filtered results
+        # are rebuilt below from the rows that were already written
+        try:
+            rows = hd.resume_results(outpath + "-out.txt", header)
+        except ValueError as e:
+            print("\nERROR:")
+            print("  ", e, ".\n", sep="")
+            sys.exit(-1)
+        done = set(tuple(row.split("\t")[0:3]) for row in rows)
+        todo = (t for t in triples if t not in done)
+        if os.path.exists(outpath + "-out-filtered.txt"):
+            os.remove(outpath + "-out-filtered.txt")
+        if not quiet:
+            print(
+                "\nResuming: skipping ",
+                len(done),
+                " triple(s) already in '",
+                outpath,
+                "-out.txt'.",
+                sep="",
+            )
+    else:
+        rows = []
+        todo = triples
+    if os.path.exists(outpath + "-out.txt") and not resume:
         if not quiet:
             print(
                 "\n**  Warning: File '"
@@ -276,11 +375,8 @@ if __name__ == "__main__":
     else:
         outfile = open(outpath + "-out.txt", "a")
     # print outfile header
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=outfile,
-    )
+    if not resume:
+        print(header, end="", file=outfile)
 
     if os.path.exists(outpath + "-out-filtered.txt"):
         if not quiet:
@@ -300,37 +396,61 @@ if __name__ == "__main__":
     else:
         filtered_outfile = open(outpath + "-out-filtered.txt", "a")
     # print filtered outfile header
-    print(
-        "P1\tHybrid\tP2\tZscore\tPvalue\tGamma\tAAAA\tAAAB\tAABA\tAABB\tAABC\tABAA\tABAB\tABAC\tABBA\tBAAA\tABBC\tCABC\tBACA\tBCAA\tABCD\n",
-        end="",
-        file=filtered_outfile,
-    )
+    print(header, end="", file=filtered_outfile)
+    for row in rows:
+        fields = row.split("\t")
+        res = {
+            "Zscore": float(fields[3]),
+            "Pvalue": float(fields[4]),
+            "Gamma": float(fields[5]),
+        }
+        if keep(res):
+            print(row, end="", file=filtered_outfile)
+    writer = hd.ResultWriter(outfile)
+    filtered_writer = hd.ResultWriter(filtered_outfile)
+    checkpoint = hd.Checkpoint([writer, filtered_writer])
 
-    def wrap_test(tr):
+    def wrap_test(groups):
         """
-        Wrapper function for running a hypothesis
-        test on a given triple.
+        Wrapper function for running the hypothesis tests on a chunk
+        of groups of triples (one triple or the three triples of a
+        trio), returning the results as a ResultTable.
         """
-        res = {}
-        res[(tr[0], tr[1], tr[2])] = data.test_triple(tr[0], tr[1], tr[2])
-        return res
+        return hd.ResultTable.from_results(
+            data.test_triples(t for group in groups for t in group)
+        )
+
+    def init_worker(desc):
+        """
+        Attach a worker process to the shared copy of the data.
+        """
+        global data
+        data = hd.HydeData.from_shared(desc)
 
     def mp_run():
         """
-        Run tests on multiple threads.
+        Run tests on multiple threads, yielding the results in
+        order as they finish.
         """
-        p = mp.Pool(threads)
-        res = p.map(wrap_test, triples)
-        return res
+        desc = data.to_shared()
+        try:
+            with mp.Pool(threads, initializer=init_worker, initargs=(desc,)) as p:
+                groups = hd.group_trios(todo)
+                chunks = iter(lambda: list(islice(groups, chunksize)), [])
+                for res in hd.imap_ordered(p, wrap_test, chunks, 4 * threads):
+                    yield res
+        finally:
+            data.close_shared()
 
     out = mp_run()
-    for o in out:
-        key = list(o.keys())[0]
-        val = list(o.values())[0]
-        write_out(val, key, outfile)
-        if (
-            val["Pvalue"] < (pvalue / len(triples))
-            and val["Gamma"] > 0.0
-            and val["Gamma"] < 1.0
-        ):
-            write_out(val, key, filtered_outfile)
+    for table in out:
+        writer.write(table)
+        filtered_writer.write(table[keep(table)])
+        checkpoint()
+    checkpoint.sync()
+    writer.close()
+    filtered_writer.close()
+
+    if args.binary:
+        outfile.close()
+        hd.HydeResult(outpath + "-out.txt").save(outpath + "-out.npz")
@@ -3,7 +3,11 @@ from setuptools.extension import Extension
 
 from Cython.Build import cythonize
 import numpy
+import sys
 
+# OpenMP is used to split the sites between threads when counting site
+# patterns; without it the counting loops simply run serially.
+openmp = ["-fopenmp"] if sys.platform.startswith("linux") else []
 
 setup(
     packages=find_packages(),
@@ -14,6 +18,8 @@ setup(
                 ["phyde/data.pyx"],
                 include_dirs=[numpy.get_include()],
                 language="c++",
+                extra_compile_args=openmp,
+                extra_link_args=openmp,
             ),
         ]
     ),
@@ -25,6 +31,7 @@ setup(
         "scripts/bootstrap_hyde.py",
         "scripts/bootstrap_hyde_mp.py",
         "scripts/hyde_gui.py",
+        "scripts/convert_hyde.py",
     ],
     zip_safe=False,
 )
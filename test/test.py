@@ -36,3 +36,471 @@ print("**** Good. ****")
 print("\n**** Test 8: Testing ABBA-BABA on Bootstrap object. ****")
 print(boot.abba_baba("sp1", "sp2", "sp3"))
 print("**** Good. ****")
+
+print("\n**** Test 9: Enumerating triples with TripleSpace. ****")
+triples = data.triple_space()
+assert list(triples) == data.list_triples()
+print(len(triples), triples[len(triples) - 1], triples.index(('sp2', 'sp1', 'sp3')))
+print("**** Good. ****")
+
+print("\n**** Test 10: Running test_trio(). ****")
+trio = data.test_trio('sp1', 'sp2', 'sp3')
+assert trio[0][1] == data.test_triple('sp1', 'sp2', 'sp3')
+print(trio)
+print("**** Good. ****")
+
+print("\n**** Test 11: Counting triples in a batch. ****")
+batch = list(data.test_triples(data.list_triples(), batch=8))
+for (t1, r1), (t2, r2) in zip(batch, data.test_triples(data.list_triples())):
+    assert t1 == t2
+    assert all(abs(r1[k] - r2[k]) <= 1e-8 * max(1.0, abs(r2[k])) for k in r2)
+print(batch[0])
+print("**** Good. ****")
+
+print("\n**** Test 12: Computing statistics for an array of count tables. ****")
+from phyde.batch import batch_stats
+tables, num_obs = data.count_triples([('sp1', 'sp2', 'sp3'), ('sp1', 'sp3', 'sp2')])
+stats = batch_stats(tables, num_obs, 1.0 * 5 * 5 * 5)
+for i, res in enumerate([data.test_triple('sp1', 'sp2', 'sp3'), data.test_triple('sp1', 'sp3', 'sp2')]):
+    assert all(abs(stats[k][i] - res[k]) <= 1e-8 * max(1.0, abs(res[k])) for k in res)
+print(stats["Zscore"], stats["Gamma"])
+print("**** Good. ****")
+
+print("\n**** Test 13: Collecting results in a ResultTable. ****")
+table = hd.ResultTable.concat(data.test_tables(data.list_triples(), size=4))
+assert len(table) == len(data.list_triples())
+assert table[0] == (('sp1', 'sp2', 'sp3'), data.test_triple('sp1', 'sp2', 'sp3'))
+print(table[table["Pvalue"] < 0.05].triples)
+print("**** Good. ****")
+
+print("\n**** Test 14: Writing results with a ResultWriter. ****")
+import io
+buf = io.StringIO()
+with hd.ResultWriter(buf, chunk=64) as out:
+    out.write(hd.RESULT_HEADER)
+    for t in data.test_tables(data.list_triples(), size=4):
+        out.write(t)
+assert buf.getvalue() == hd.RESULT_HEADER + table.format()
+print(buf.getvalue().splitlines()[1])
+print("**** Good. ****")
+
+print("\n**** Test 15: Looking up results in a HydeResult. ****")
+d = res2.d_statistics()
+i = res2.triples.index(('sp1', 'sp2', 'sp3'))
+assert d[i] == res2.abba_baba('sp1', 'sp2', 'sp3')
+assert res2('Gamma', 'sp1', 'sp2', 'sp3') == res2.res[('sp1', 'sp2', 'sp3')]['Gamma']
+print(len(res2.table), d)
+print("**** Good. ****")
+
+print("\n**** Test 16: Summarizing Bootstrap results. ****")
+summ = boot.summarize()
+gamma = boot.gamma('sp1', 'sp2', 'sp3')
+assert abs(summ[('sp1', 'sp2', 'sp3')]['Gamma'][0] - sum(gamma) / len(gamma)) < 1e-12
+assert (boot.d_statistics()[0] == boot.abba_baba(*boot.triples[0])).all()
+print(boot.values.shape, summ[('sp1', 'sp2', 'sp3')])
+print("**** Good. ****")
+
+print("\n**** Test 17: Saving results in the binary format. ****")
+res2.save("../hyde-out.npz")
+res3 = hd.HydeResult("../hyde-out.npz")
+assert hd.is_binary("../hyde-out.npz") and res3.triples == res2.triples
+assert res3('Gamma', 'sp1', 'sp2', 'sp3') == res2('Gamma', 'sp1', 'sp2', 'sp3')
+boot.save("../hyde-boot.npz")
+assert (hd.Bootstrap("../hyde-boot.npz").values == boot.values).all()
+print(res3.triples)
+print("**** Good. ****")
+
+print("\n**** Test 18: Reusing count tables from a CountCache. ****")
+import os, shutil, tempfile
+# scratch files written by the tests, removed at the end
+scratch = tempfile.mkdtemp()
+cached = hd.HydeData("data.txt", "map.txt", "out", 16, 4, 50000, True)
+cache = cached.use_count_cache(os.path.join(scratch, "hyde-counts.db"))
+first = cached.test_triple('sp1', 'sp3', 'sp2')
+assert cached.test_triple('sp1', 'sp3', 'sp2') == first
+assert list(cached.test_triples(data.list_triples())) == list(data.test_triples(data.list_triples()))
+cache.close()
+print(first["Zscore"])
+print("**** Good. ****")
+
+print("\n**** Test 19: Reading data without the number of individuals, taxa, and sites. ****")
+auto = hd.HydeData("data.txt", "map.txt", "out", quiet=True)
+assert auto.test_triple('sp1', 'sp2', 'sp3') == data.test_triple('sp1', 'sp2', 'sp3')
+auto = hd.HydeData("data-phylip.txt", "map.txt", "out", quiet=True)
+assert auto.test_triple('sp1', 'sp2', 'sp3') == data.test_triple('sp1', 'sp2', 'sp3')
+print(auto.list_triples()[:3])
+print("**** Good. ****")
+
+print("\n**** Test 20: Reading FASTA and interleaved PHYLIP files. ****")
+seqs = [l.split() for l in open("data.txt") if l.strip()]
+fasta_file = os.path.join(scratch, "data.fasta")
+interleaved_file = os.path.join(scratch, "data-interleaved.txt")
+with open(fasta_file, "w") as f:
+    for name, s in seqs:
+        f.write(">" + name + "\n" + "\n".join(s[i:i + 60] for i in range(0, len(s), 60)) + "\n")
+with open(interleaved_file, "w") as f:
+    f.write("%d %d\n" % (len(seqs), len(seqs[0][1])))
+    for i in range(0, len(seqs[0][1]), 1000):
+        for name, s in seqs:
+            f.write((name + " " if i == 0 else "") + s[i:i + 1000] + "\n")
+        f.write("\n")
+dna, names = hd.read_alignment("data.txt")
+for fn in [fasta_file, interleaved_file]:
+    other, other_names = hd.read_alignment(fn)
+    assert (other == dna).all() and other_names == names
+fasta = hd.HydeData(fasta_file, "map.txt", "out", quiet=True)
+assert fasta.test_triple('sp1', 'sp2', 'sp3') == data.test_triple('sp1', 'sp2', 'sp3')
+print(dna.shape, names[:3])
+print("**** Good. ****")
+
+print("\n**** Test 21: Reading compressed data and map files. ****")
+import bz2, gzip
+data_gz = os.path.join(scratch, "data.txt.gz")
+map_bz2 = os.path.join(scratch, "map.txt.bz2")
+with open("data.txt", "rb") as f, gzip.open(data_gz, "wb") as out:
+    out.write(f.read())
+with open("map.txt", "rb") as f, bz2.open(map_bz2, "wb") as out:
+    out.write(f.read())
+with hd.open_input(map_bz2, "r") as f:
+    assert f.read() == open("map.txt").read()
+packed = hd.HydeData(data_gz, map_bz2, "out", quiet=True)
+assert packed.test_triple('sp1', 'sp2', 'sp3') == data.test_triple('sp1', 'sp2', 'sp3')
+assert (hd.read_alignment(data_gz)[0] == dna).all()
+print(packed.test_triple('sp1', 'sp2', 'sp3')["Gamma"])
+print("**** Good. ****")
+
+print("\n**** Test 22: Reading genotypes from a VCF file. ****")
+vcf_file = os.path.join(scratch, "data.vcf")
+with open(vcf_file, "w") as f:
+    f.write("##fileformat=VCFv4.2\n")
+    f.write("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + names) + "\n")
+    for j, col in enumerate(zip(*[s for _, s in seqs])):
+        alleles = sorted(set(col))
+        calls = ["%d/%d" % (alleles.index(b), alleles.index(b)) for b in col]
+        f.write("1\t%d\t.\t%s\t%s\t.\tPASS\t.\tGT\t%s\n" % (j + 1, alleles[0], ",".join(alleles[1:]) or ".", "\t".join(calls)))
+    f.write("1\t%d\t.\tA\tG\t.\tPASS\t.\tGT:DP\t%s\n" % (j + 2, "\t".join(["0/1:9"] * 15 + ["./.:0"])))
+vcf, vcf_names = hd.read_alignment(vcf_file)
+assert vcf_names == names and (vcf[:, :-1] == dna).all()
+assert vcf[:, -1].tolist() == [6] * 15 + [15]
+assert hd.read_alignment(vcf_file, biallelic=True)[0].shape[1] < vcf.shape[1]
+print(vcf.shape, vcf[:3, -1])
+print("**** Good. ****")
+
+print("\n**** Test 23: Counting site patterns out of core in blocks of sites. ****")
+import numpy as np
+import os, shutil, tempfile
+cache_dir = tempfile.mkdtemp()
+blocks = hd.HydeData(fasta_file, "map.txt", "out", quiet=True, block_sites=7000, cache_dir=cache_dir)
+assert not os.path.exists(fasta_file + ".hyde.npy") and len(os.listdir(cache_dir)) == 2
+close = lambda a, b: all(np.isclose(a[k], b[k], equal_nan=True) for k in a)
+assert close(blocks.test_triple('sp1', 'sp2', 'sp3'), data.test_triple('sp1', 'sp2', 'sp3'))
+for batch in [0, 2]:
+    for (t1, r1), (t2, r2) in zip(blocks.test_triples(data.list_triples(), batch=batch),
+                                  data.test_triples(data.list_triples())):
+        assert t1 == t2 and close(r1, r2)
+ind1 = blocks.test_individuals('sp1', 'sp2', 'sp3')
+ind2 = data.test_individuals('sp1', 'sp2', 'sp3')
+assert all(close(ind1[k], ind2[k]) for k in ind2)
+print(blocks.test_triple('sp1', 'sp2', 'sp3')["Zscore"])
+del blocks
+shutil.rmtree(cache_dir)
+print("**** Good. ****")
+
+print("\n**** Test 24: Reading a corrupt compressed data file. ****")
+corrupt = bytearray(gzip.compress(open("data.txt", "rb").read()))
+corrupt[2000:2200] = bytes(b ^ 0x5a for b in corrupt[2000:2200])
+packed = gzip.compress(open("data.txt", "rb").read())
+for name, contents in [("data-corrupt.txt.gz", corrupt), ("data-truncated.txt.gz", packed[:len(packed) // 2])]:
+    fn = os.path.join(scratch, name)
+    with open(fn, "wb") as f:
+        f.write(contents)
+    try:
+        hd.read_alignment(fn)
+        raise AssertionError(fn + " was read without an error")
+    except ValueError as e:
+        print(e)
+print("**** Good. ****")
+
+print("\n**** Test 25: Yielding results at least every interval seconds. ****")
+blocks = list(data.test_tables(data.list_triples(), interval=0.0))
+assert [len(t) for t in blocks] == [1] * len(data.list_triples())
+assert hd.ResultTable.concat(blocks).format() == table.format()
+print(len(blocks))
+print("**** Good. ****")
+
+print("\n**** Test 26: Resuming a partially written results file. ****")
+header = hd.RESULT_HEADER
+resume_file = os.path.join(scratch, "hyde-resume.txt")
+with open(resume_file, "w") as f:
+    f.write(header + "a\tb\tc\t1\n" + "a\tc\tb\t2")
+assert hd.resume_results(resume_file, header) == ["a\tb\tc\t1\n"]
+assert open(resume_file).read() == header + "a\tb\tc\t1\n"
+for contents in ["", header[:10]]:
+    with open(resume_file, "w") as f:
+        f.write(contents)
+    assert hd.resume_results(resume_file, header) == []
+    assert open(resume_file).read() == header
+for contents in ["P1\tHybrid\tP2\tOld\n1\n", "not a results file"]:
+    with open(resume_file, "w") as f:
+        f.write(contents)
+    try:
+        hd.resume_results(resume_file, header)
+        raise AssertionError("resumed a file that is not a results file")
+    except ValueError as e:
+        print(e)
+    assert open(resume_file).read() == contents
+print("**** Good. ****")
+
+print("\n**** Test 27: Matching the counts from enumerating quadruples of individuals. ****")
+# Values from the original implementation, which counted the site patterns
+# for every quadruple of individuals, on data with gaps and ambiguity codes.
+keys = ["Zscore", "Gamma", "AABB", "ABBA", "ABAB"]
+expected = {
+    False: ([1.4447209768921971, 0.14156139405160897, 258626.5, 75104.5, 38864.5],
+            {"scter115K1": [0.6698767338244666, 0.0765136696538234],
+             "scter115K2": [0.2525243377311568, 0.029744849229089914],
+             "scter16KS1": [2.0255436285581, 0.21738958209546444],
+             "scter16KS2": [1.5450103075636799, 0.154452450141316]}),
+    True: ([2.0503539367986288, 0.16823938235165828, 248392.0, 65852.0, 19568.0],
+           {"scter115K1": [2.059356709262348, 0.15446664153788164],
+            "scter115K2": [1.5261740131882784, 0.11464726831855726],
+            "scter16KS1": [2.4110419485338204, 0.23534306679779107],
+            "scter16KS2": [1.9678204565381534, 0.17524201539751508]}),
+}
+for amb, (triple, inds) in expected.items():
+    for threads in [1, 4]:
+        snake = hd.HydeData("../examples/snake-data.txt", "../examples/snake-map.txt", "out",
+                            quiet=True, ignore_amb_sites=amb, site_threads=threads)
+        res = snake.test_triple("sca", "scter", "sced")
+        assert np.allclose([res[k] for k in keys], triple, rtol=1e-10, atol=0)
+        res = snake.test_individuals("sca", "scter", "sced")
+        for name, values in inds.items():
+            assert np.allclose([res[name]["Zscore"], res[name]["Gamma"]], values, rtol=1e-10, atol=0)
+print(res["scter115K1"]["Zscore"])
+print("**** Good. ****")
+
+print("\n**** Test 28: Bootstrapping by reweighting individuals. ****")
+from phyde.batch import PATTERNS
+full = data.test_triple('sp1', 'sp2', 'sp3')
+np.random.seed(42)
+boot_res = data.bootstrap_triple('sp1', 'sp2', 'sp3', reps=200)
+np.random.seed(42)
+assert data.bootstrap_triple('sp1', 'sp2', 'sp3', reps=200) == boot_res
+# every individual has the same number of resolved quadruples (no missing
+# data), so each replicate's table sums to the same total as the full table
+total = sum(full[p] for p in PATTERNS)
+assert all(sum(r[p] for p in PATTERNS) == total for r in boot_res.values())
+means = [np.mean([r[p] for r in boot_res.values()]) for p in PATTERNS]
+assert np.allclose(means, [full[p] for p in PATTERNS], rtol=0.01)
+assert abs(np.mean([r["Gamma"] for r in boot_res.values()]) - full["Gamma"]) < 0.05 * full["Gamma"]
+print(means[PATTERNS.index("ABBA")], full["ABBA"])
+print("**** Good. ****")
+
+print("\n**** Test 29: Compressing site patterns. ****")
+close = lambda a, b: all(np.isclose(a[k], b[k], rtol=1e-10, equal_nan=True) for k in a)
+for amb in [False, True]:
+    plain = hd.HydeData("../examples/snake-data.txt", "../examples/snake-map.txt", "out",
+                        quiet=True, ignore_amb_sites=amb)
+    packed = hd.HydeData("../examples/snake-data.txt", "../examples/snake-map.txt", "out",
+                         quiet=True, ignore_amb_sites=amb, compress_sites=True)
+    triples = plain.list_triples()
+    assert all(close(plain.test_triple(*t), packed.test_triple(*t)) for t in triples)
+    for (t1, r1), (t2, r2) in zip(plain.test_triples(triples), packed.test_triples(triples, batch=8)):
+        assert t1 == t2 and close(r1, r2)
+    ind1 = plain.test_individuals("sca", "scter", "sced")
+    ind2 = packed.test_individuals("sca", "scter", "sced")
+    assert all(close(ind1[k], ind2[k]) for k in ind1)
+print(len(triples))
+print("**** Good. ****")
+
+print("\n**** Test 30: Rejecting invalid bases and reading large taxa. ****")
+for name, contents in [("data-invalid.txt", "i1 ACGT\ni2 ACXT\n"),
+                       ("data-invalid.fasta", ">i1\nACGT\n>i2\nAC1T\n")]:
+    fn = os.path.join(scratch, name)
+    with open(fn, "w") as f:
+        f.write(contents)
+    try:
+        hd.read_alignment(fn)
+        raise AssertionError(fn + " was read without an error")
+    except ValueError as e:
+        print(e)
+# a taxon with more individuals than 16-bit frequencies in units of 1/12 can
+# hold; its counts are those of a taxon with one copy of each sequence,
+# scaled by the number of copies
+many_data = os.path.join(scratch, "data-many.txt")
+many_map = os.path.join(scratch, "map-many.txt")
+many = []
+for n in [2, 6000]:
+    with open(many_data, "w") as f, open(many_map, "w") as m:
+        for i in range(n):
+            f.write("i%d %s\n" % (i, "ACGTAC" if i % 2 else "AGGTCC"))
+            m.write("i%d\tbig\n" % i)
+        for k, seq in enumerate(["ACGTAA", "AGGTCA", "ACCTAC"]):
+            f.write("t%d %s\n" % (k, seq))
+            m.write("t%d\tt%d\n" % (k, k))
+    many.append(hd.HydeData(many_data, many_map, "t0", quiet=True).test_triple("t1", "big", "t2"))
+assert all(many[1][p] == 3000 * many[0][p] for p in PATTERNS)
+print(many[1]["AAAA"], many[1]["Gamma"])
+print("**** Good. ****")
+
+print("\n**** Test 31: Rebuilding the binary copy of the data when the files change. ****")
+import contextlib
+cache_dir = tempfile.mkdtemp()
+shutil.copy("data.txt", cache_dir)
+shutil.copy("map.txt", cache_dir)
+infile, mapfile = os.path.join(cache_dir, "data.txt"), os.path.join(cache_dir, "map.txt")
+
+def cached_read():
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        d = hd.HydeData(infile, mapfile, "out", cache=True)
+    return d, "Using cached data" in out.getvalue()
+
+first, used = cached_read()
+assert not used and os.path.exists(infile + ".hyde.npy") and os.path.exists(infile + ".hyde.json")
+again, used = cached_read()
+assert used and again.test_triple('sp1', 'sp2', 'sp3') == first.test_triple('sp1', 'sp2', 'sp3')
+# change a base in place, keeping the size and modification time of the file
+st = os.stat(infile)
+with open(infile, "r+b") as f:
+    end = len(f.readline().rstrip()) - 1  # last base of the first individual
+    f.seek(end)
+    base = f.read(1)
+    f.seek(end)
+    f.write(b"A" if base != b"A" else b"C")
+os.utime(infile, ns=(st.st_atime_ns, st.st_mtime_ns))
+again, used = cached_read()
+fresh = hd.HydeData(infile, mapfile, "out", quiet=True)
+assert not used and again.test_triple('sp1', 'sp2', 'sp3') == fresh.test_triple('sp1', 'sp2', 'sp3')
+# move an individual to another taxon: the cached taxon map must not be used
+lines = open(mapfile).read().splitlines()
+lines[5] = lines[5].split()[0] + "\tsp3"
+with open(mapfile, "w") as f:
+    f.write("\n".join(lines) + "\n")
+again, used = cached_read()
+fresh = hd.HydeData(infile, mapfile, "out", quiet=True)
+assert not used and again.test_triple('sp1', 'sp2', 'sp3') == fresh.test_triple('sp1', 'sp2', 'sp3')
+assert again.test_triple('sp1', 'sp2', 'sp3') != first.test_triple('sp1', 'sp2', 'sp3')
+del first, again, fresh
+shutil.rmtree(cache_dir)
+print("**** Good. ****")
+
+print("\n**** Test 32: Sharing the data with worker processes. ****")
+import multiprocess as mp
+expected = data.test_triple('sp1', 'sp2', 'sp3')
+desc = data.to_shared()
+segment = os.path.join("/dev/shm", desc["name"].lstrip("/"))
+assert not os.path.isdir("/dev/shm") or os.path.exists(segment)
+with mp.Pool(2) as pool:
+    child = pool.apply(lambda d: hd.HydeData.from_shared(d).test_triple('sp1', 'sp2', 'sp3'), (desc,))
+assert child == expected
+data.close_shared()
+assert not os.path.exists(segment)
+assert data.test_triple('sp1', 'sp2', 'sp3') == expected
+print(child["Zscore"])
+print("**** Good. ****")
+
+print("\n**** Test 33: Running tasks in order with a bounded window. ****")
+import random, threading, time
+from multiprocess.pool import ThreadPool
+started, finished, lock = [], [], threading.Lock()
+
+def work(x):
+    with lock:
+        started.append(x)
+    time.sleep(random.random() * 0.002)
+    return x * x
+
+with ThreadPool(4) as pool:
+    for r in hd.imap_ordered(pool, work, iter(range(200)), 3, chunksize=2):
+        finished.append(r)
+        # at most window chunks have been submitted beyond those consumed
+        assert len(started) - len(finished) <= 3 * 2
+assert finished == [x * x for x in range(200)]
+print(len(finished))
+print("**** Good. ****")
+
+print("\n**** Test 34: Finding the unique sites once for many batches. ****")
+from phyde.batch import count_tables, unique_sites
+snake = hd.HydeData("../examples/snake-data.txt", "../examples/snake-map.txt", "out", quiet=True)
+dna, _ = hd.read_alignment("../examples/snake-data.txt")
+names = list(dict.fromkeys(l.split()[1] for l in open("../examples/snake-map.txt")))
+freqs = np.zeros((len(names), dna.shape[1], 8), dtype=np.uint16)
+for i, line in enumerate(open("../examples/snake-map.txt")):
+    for b in range(4):
+        freqs[names.index(line.split()[1]), :, b] += 12 * (dna[i] == b).astype(np.uint16)
+sites, counts = unique_sites(freqs[names.index("out")], freqs)
+assert counts.sum() == dna.shape[1] and len(sites) < dna.shape[1]
+idx = [[names.index(t) for t in triple] for triple in snake.list_triples()]
+once = count_tables(freqs[names.index("out")], freqs, idx, amb=False, sites=(sites, counts))
+each = count_tables(freqs[names.index("out")], freqs, idx, amb=False)
+assert np.allclose(once[0], each[0]) and np.allclose(once[1], each[1])
+print(len(sites), dna.shape[1])
+print("**** Good. ****")
+
+print("\n**** Test 35: Dropping repeated triples in the binary format. ****")
+from phyde.binary import save_columns
+from phyde.result import STATS
+dup_file = os.path.join(scratch, "hyde-dup.txt")
+shutil.copy("../hyde-out.txt", dup_file)
+with open("../hyde-out.txt") as f, open(dup_file, "a") as dup:
+    dup.write(f.readlines()[1])
+text = hd.HydeResult(dup_file)
+t = res2.table[np.array([0] + list(range(len(res2.table))), dtype=np.intp)]
+save_columns(os.path.join(scratch, "hyde-dup.npz"), "results", t.p1, t.hyb, t.p2,
+             [t.stats[k] for k in STATS], stats=np.array(STATS))
+binary = hd.HydeResult(os.path.join(scratch, "hyde-dup.npz"))
+assert binary.triples == text.triples == res2.triples
+assert len(binary.res) == len(text.res) == len(res2.triples)
+print(len(binary.triples))
+print("**** Good. ****")
+
+print("\n**** Test 36: Reading sequential PHYLIP files with wrapped sequences. ****")
+dna, names = hd.read_alignment("data.txt")
+wrapped_file = os.path.join(scratch, "data-wrapped.txt")
+with open(wrapped_file, "w") as f:
+    f.write("%d %d\n" % (len(seqs), len(seqs[0][1])))
+    for name, s in seqs:
+        # the same line width as the interleaved file in Test 20
+        f.write(name + " " + "\n".join(s[i:i + 1000] for i in range(0, len(s), 1000)) + "\n")
+wrapped, wrapped_names = hd.read_alignment(wrapped_file)
+assert (wrapped == dna).all() and wrapped_names == names
+interleaved, _ = hd.read_alignment(interleaved_file)
+assert (interleaved == dna).all()
+# an interleaved file whose second line completes the length of the first
+# sequence when its name is counted as bases
+short = os.path.join(scratch, "data-short.txt")
+with open(short, "w") as f:
+    f.write("2 121\n")
+    for i in range(0, 121, 60):
+        f.write(("a " if i == 0 else "") + "A" * min(60, 121 - i) + "\n")
+        f.write(("b " if i == 0 else "") + "C" * min(60, 121 - i) + "\n")
+        f.write("\n")
+other, other_names = hd.read_alignment(short)
+assert other.shape == (2, 121) and other_names == ["a", "b"]
+assert (other[0] == other[0, 0]).all() and (other[1] == other[1, 0]).all()
+print(wrapped.shape, wrapped_names[:3])
+print("**** Good. ****")
+
+print("\n**** Test 37: Checking the layout of VCF genotypes. ****")
+header = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ts1\ts2\n"
+bad_vcf = os.path.join(scratch, "bad.vcf")
+with open(bad_vcf, "w") as f:
+    # four bytes per sample, but the samples are not separated by a tab
+    f.write(header + "1\t1\t.\tA\tG\t.\tPASS\t.\tGT\t0/1 1/1\n")
+try:
+    hd.read_alignment(bad_vcf)
+    assert False
+except ValueError as e:
+    print(e)
+with open(bad_vcf, "w") as f:
+    f.write(header + "1\t1\t.\tA\tG\t.\tPASS\t.\tGT\t0/1\t1/1\n")
+    f.write("1\t2\t.\tA\t%s\t.\tPASS\t.\tGT\t0/0\t0/1\n" % ",".join("CGTACGTACG"))
+try:
+    hd.read_alignment(bad_vcf)
+    assert False
+except ValueError as e:
+    print(e)
+print("**** Good. ****")
+
+shutil.rmtree(scratch)